@@ -35,4 +35,5 @@ python -m manage migrate auth
 python -m manage migrate contenttypes
 python -m manage migrate sessions
 python -m manage migrate social_django
+python -m manage createcachetable
 python -m manage runserver
@@ -2,47 +2,128 @@
 Custom bulk upload view
 """
 
+from collections import Counter
+from contextlib import nullcontext
 import csv
 from decimal import Decimal
+import gzip
 import io
+from itertools import islice
 
 from django.conf import settings
-from django.contrib import admin
-from django.core.exceptions import ValidationError
-from django.forms import Form, FileField
+from django.contrib import admin, messages
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import IntegrityError, models, transaction
+from django.forms import ChoiceField, Form, FileField
 from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse
+from django.utils import timezone
 from django.views.generic import View
 
+from ..filters import site_id_filter
 from ..models import MonitoringLocation, AgencyLookup, AltitudeDatumLookup, HorizontalDatumLookup, NatAqfrLookup, \
     UnitsLookup, CountyLookup, StateLookup, CountryLookup
+from ..signals import monitoring_locations_changed
 
 
-def _get_lookup(model, field_name, value):
-    qs = model.objects.filter(**({field_name: value}))
-    if len(qs) == 0:
-        return None
-    return qs[0]
+COMMIT_ALL = 'all'
+COMMIT_CHUNKS = 'chunks'
+MODE_INSERT = 'insert'
+MODE_UPSERT = 'upsert'
+MODE_DIFF = 'diff'
+COUNTS = ('inserted', 'updated', 'unchanged')
+CHUNK_SIZE = 1000
+GZIP_MAGIC = b'\x1f\x8b'
+# Errors raised while reading an uploaded file which is not UTF-8 encoded CSV, or gzipped CSV
+FILE_ERRORS = (UnicodeDecodeError, OSError, EOFError, csv.Error)
+FILE_ERROR_MESSAGE = 'The file could not be read as CSV, or gzipped CSV, encoded as UTF-8'
 
+# Monitoring location fields which are set from BulkUploadLookups or the request, so need no existence query
+LOOKUP_FIELDS = ('agency', 'horizontal_datum', 'altitude_units', 'altitude_datum', 'nat_aqfr', 'country', 'state',
+                 'county', 'well_depth_units')
+USER_FIELDS = ('insert_user', 'update_user')
+# Monitoring location fields compared in the diff mode, all but the id, the user and date fields
+# and the float coordinates derived from the decimal ones
+DIFF_FIELDS = [field for field in MonitoringLocation._meta.concrete_fields
+               if field.editable and not field.primary_key]
 
-def _get_state_lookup(country, state_name):
-    if not country:
-        return None
-    qs = StateLookup.objects.filter(country_cd=country, state_nm=state_name)
-    if len(qs) == 0:
-        return None
-    return qs[0]
 
+class BulkUploadLookups:
+    """
+    Lookup tables of a bulk upload, loaded once and keyed by the values used in the bulk upload
+    template so that converting rows does not query the database. Where several lookups share a
+    key, the first in the lookup's ordering is used.
+    """
+    def __init__(self):
+        self.agencies = self._load(AgencyLookup.objects.all(), lambda agency: agency.agency_cd)
+        self.horizontal_datums = self._load(HorizontalDatumLookup.objects.all(), lambda datum: datum.hdatum_cd)
+        self.altitude_datums = self._load(AltitudeDatumLookup.objects.all(), lambda datum: datum.adatum_cd)
+        self.units = self._load(UnitsLookup.objects.all(), lambda units: units.unit_desc)
+        self.nat_aqfrs = self._load(NatAqfrLookup.objects.all(), lambda nat_aqfr: nat_aqfr.nat_aqfr_cd)
+        self.countries = self._load(CountryLookup.objects.all(), lambda country: country.country_nm)
+        self.states = self._load(StateLookup.objects.all(), lambda state: (state.country_cd_id, state.state_nm))
+        self.counties = self._load(CountyLookup.objects.all(),
+                                   lambda county: (county.country_cd_id, county.state_id_id, county.county_nm))
 
-def _get_county_lookup(country, state, county_name):
-    if not country or not state:
-        return None
-    qs = CountyLookup.objects.filter(
-        county_nm=county_name, state_id=state, country_cd=country)
-    if len(qs) == 0:
-        return None
-    return qs[0]
+    @staticmethod
+    def _load(queryset, get_key):
+        lookups = {}
+        for lookup in queryset:
+            lookups.setdefault(get_key(lookup), lookup)
+        return lookups
+
+    def get_state(self, country, state_name):
+        """
+        Returns the state of country named state_name, or None
+        """
+        if not country:
+            return None
+        return self.states.get((country.country_cd, state_name))
+
+    def get_county(self, country, state, county_name):
+        """
+        Returns the county of state and country named county_name, or None
+        """
+        if not country or not state:
+            return None
+        return self.counties.get((country.country_cd, state.id, county_name))
+
+
+def _clean(monitoring_location):
+    """
+    Validates monitoring_location like full_clean, except that lookup fields are only checked for
+    blank values and uniqueness is not checked, so that no queries are made. BulkUploadView checks
+    the uniqueness of each chunk of rows at once.
+    """
+    errors = {}
+    try:
+        monitoring_location.clean_fields(exclude=LOOKUP_FIELDS + USER_FIELDS)
+    except ValidationError as error:
+        errors = error.update_error_dict(errors)
+    for name in LOOKUP_FIELDS:
+        field = MonitoringLocation._meta.get_field(name)
+        if not field.blank and getattr(monitoring_location, field.attname) is None:
+            errors[name] = [ValidationError(field.error_messages['blank'], code='blank')]
+    try:
+        monitoring_location.clean()
+    except ValidationError as error:
+        errors = error.update_error_dict(errors)
+    if errors:
+        # In the order of the fields, as full_clean reports them
+        field_order = {field.name: index for index, field in enumerate(MonitoringLocation._meta.fields)}
+        raise ValidationError(dict(sorted(errors.items(), key=lambda item: field_order.get(item[0], len(field_order)))))
+
+
+def _normalized(field, value):
+    """
+    Returns value of field as it is compared in the diff mode. Blank strings may be read back as
+    None, so None is compared as a blank string. Decimals are returned unchanged, since Decimal
+    equality ignores trailing zeros and 40.0 equals 40.000.
+    """
+    if value is None and isinstance(field, models.CharField):
+        return ''
+    return value
 
 
 def _validate_decimal(field_name, dec_value, row_index, warning_messages):
@@ -54,12 +135,14 @@ def _validate_decimal(field_name, dec_value, row_index, warning_messages):
     return None
 
 
-def _get_monitoring_location(row_index, row, user, warning_messages):
+def _get_monitoring_location(row_index, row, user, lookups, warning_messages):
     """
     Parses the list of strings that represent a row in the bulk upload template, validates and
-    returns a MonitoringLocation instance. Raises Validation_Error if the row can not be converted
+    returns a MonitoringLocation instance. Raises Validation_Error if the row can not be converted.
+    Uniqueness is not validated and no queries are made.
     :list of strings row:
     :User user
+    :BulkUploadLookups lookups
     :return: MonitoringLocation
     """
     if len(row) < 39:
@@ -67,35 +150,34 @@ def _get_monitoring_location(row_index, row, user, warning_messages):
             {'file_error': 'Does not contain the correct number of columns'}, code='invalid file')
 
     local_aquifer_code = f' ({row[15]})' if row[15] else ''
-    country = _get_lookup(CountryLookup, 'country_nm', row[16])
-    state = _get_state_lookup(country, row[17])
+    country = lookups.countries.get(row[16])
+    state = lookups.get_state(country, row[17])
 
     monitoring_location = MonitoringLocation(
-        agency=_get_lookup(AgencyLookup, 'agency_cd', row[0]),
+        agency=lookups.agencies.get(row[0]),
         site_no=row[1],
         site_name=row[2],
         dec_lat_va=_validate_decimal(
             'dec_lat_va', row[3], row_index, warning_messages),
         dec_long_va=_validate_decimal(
             'dec_long_va', row[4], row_index, warning_messages),
-        horizontal_datum=_get_lookup(
-            HorizontalDatumLookup, 'hdatum_cd', row[5]),
+        horizontal_datum=lookups.horizontal_datums.get(row[5]),
         horz_method=row[6],
         horz_acy=row[7],
         alt_va=_validate_decimal(
             'alt_va', row[8], row_index, warning_messages),
-        altitude_units=_get_lookup(UnitsLookup, 'unit_desc', row[9]),
-        altitude_datum=_get_lookup(AltitudeDatumLookup, 'adatum_cd', row[10]),
+        altitude_units=lookups.units.get(row[9]),
+        altitude_datum=lookups.altitude_datums.get(row[10]),
         alt_method=row[11],
         alt_acy=row[12],
-        nat_aqfr=_get_lookup(NatAqfrLookup, 'nat_aqfr_cd', row[13]),
+        nat_aqfr=lookups.nat_aqfrs.get(row[13]),
         local_aquifer_name=f'{row[14]}{local_aquifer_code}',
         country=country,
         state=state,
-        county=_get_county_lookup(country, state, row[18]),
+        county=lookups.get_county(country, state, row[18]),
         well_depth=_validate_decimal(
             'well_depth', row[19], row_index, warning_messages),
-        well_depth_units=_get_lookup(UnitsLookup, 'unit_desc', row[20]),
+        well_depth_units=lookups.units.get(row[20]),
         site_type=row[21],
         aqfr_type=row[22],
         display_flag=row[23] == 'Yes',
@@ -117,23 +199,65 @@ def _get_monitoring_location(row_index, row, user, warning_messages):
         insert_user=user,
         update_user=user
     )
-    monitoring_location.full_clean()
+    _clean(monitoring_location)
     return monitoring_location
 
 
+def _open_upload(uploaded_file):
+    """
+    Returns a text stream of the uploaded CSV file, which is decompressed if it is gzipped and
+    decoded as it is read
+    """
+    uploaded_file.seek(0)
+    binary = uploaded_file.file
+    is_gzipped = uploaded_file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    uploaded_file.seek(0)
+    if is_gzipped:
+        binary = gzip.GzipFile(fileobj=binary, mode='rb')
+    return io.TextIOWrapper(binary, encoding='utf-8', newline='')
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 class BulkUploadForm(Form):
     """
-    Form containing a single file field
+    Form containing the file field, the commit policy and the mode
     """
     file = FileField()
+    mode = ChoiceField(label='Monitoring locations which are already registered',
+                       choices=((MODE_INSERT, 'are errors'), (MODE_UPSERT, 'are updated'),
+                                (MODE_DIFF, 'are updated where their fields differ')),
+                       required=False)
+    commit = ChoiceField(label='If some rows are invalid',
+                         choices=((COMMIT_ALL, 'load none of the file'),
+                                  (COMMIT_CHUNKS, f'load the chunks of {CHUNK_SIZE} rows which are valid')),
+                         required=False)
 
 
 class BulkUploadView(View):
     """
-    Bulk upload view containing a single file field.
+    Bulk upload view containing a single file field. The file, which may be gzipped, is read and
+    loaded chunk_size rows at a time so memory use does not grow with the size of the file. With
+    the all commit policy the chunks are loaded in a single transaction which is rolled back if any
+    row is invalid. With the chunks commit policy each valid chunk is committed as it is loaded and
+    chunks containing invalid rows are skipped. Reading stops after max_errors invalid rows, and only
+    the first max_warnings warnings are shown. In the
+    insert mode rows of registered monitoring locations are errors, in the upsert mode they update
+    the monitoring locations. In the diff mode they are compared with the registered monitoring
+    locations and only the fields which differ are written.
     """
     form_class = BulkUploadForm
     template_name = 'admin/bulk_upload.html'
+    chunk_size = CHUNK_SIZE
+    max_errors = 1000
+    max_warnings = 1000
 
     def get(self, request):
         """
@@ -145,41 +269,233 @@ class BulkUploadView(View):
         context.update(dict(admin.site.each_context(self.request)))
         return render(request, self.template_name, context)
 
+    @staticmethod
+    def convert_chunk(chunk, user, lookups, file_site_ids, warning_messages, check_existing=True):
+        """
+        Converts and validates a chunk of rows. The agency and site number of each row are checked
+        against the earlier rows of the file, in file_site_ids, and, if check_existing, against the
+        existing monitoring locations with a single query.
+        :param chunk: list of row index and list of strings
+        :param file_site_ids: dictionary of the (agency_cd, site_no) of the valid rows read so far
+            and their row index, which is updated with those of the chunk
+        :return: tuple of the valid monitoring locations and the error messages of the chunk
+        """
+        errors = {}
+        converted = []
+        for row_index, row in chunk:
+            try:
+                monitoring_location = _get_monitoring_location(row_index, row, user, lookups, warning_messages)
+            except ValidationError as error:
+                errors[row_index] = error.message_dict
+                continue
+            site_id = (monitoring_location.agency_id, monitoring_location.site_no)
+            if site_id in file_site_ids:
+                errors[row_index] = {NON_FIELD_ERRORS: [
+                    f'Row {file_site_ids[site_id]} has the same agency and site number']}
+            else:
+                file_site_ids[site_id] = row_index
+                converted.append((row_index, monitoring_location))
+
+        existing = set()
+        if converted and check_existing:
+            site_ids = [(monitoring_location.agency_id, monitoring_location.site_no)
+                        for _, monitoring_location in converted]
+            existing = set(MonitoringLocation.objects.filter(site_id_filter(site_ids))
+                           .values_list('agency_id', 'site_no'))
+        monitoring_locations = []
+        for row_index, monitoring_location in converted:
+            if (monitoring_location.agency_id, monitoring_location.site_no) in existing:
+                errors[row_index] = ValidationError({NON_FIELD_ERRORS: [
+                    monitoring_location.unique_error_message(MonitoringLocation, ('site_no', 'agency'))
+                ]}).message_dict
+            else:
+                monitoring_locations.append(monitoring_location)
+        return monitoring_locations, sorted(errors.items())
+
+    @staticmethod
+    def diff_chunk(monitoring_locations):
+        """
+        Compares the monitoring locations of a chunk with the registered monitoring locations with
+        the same agency and site number, which are read with a single query
+        :return: tuple of the monitoring locations which are not registered and a list of tuples of
+            each registered monitoring location which differs, with the fields of the chunk set on
+            it, and the names of the fields which differ
+        """
+        site_ids = [(ml.agency_id, ml.site_no) for ml in monitoring_locations]
+        registered = {}
+        if site_ids:
+            registered = {(ml.agency_id, ml.site_no): ml
+                          for ml in MonitoringLocation.objects.filter(site_id_filter(site_ids))}
+        new = []
+        changed = []
+        for monitoring_location in monitoring_locations:
+            existing = registered.get((monitoring_location.agency_id, monitoring_location.site_no))
+            if existing is None:
+                new.append(monitoring_location)
+                continue
+            fields = [field for field in DIFF_FIELDS
+                      if _normalized(field, getattr(monitoring_location, field.attname))
+                      != _normalized(field, getattr(existing, field.attname))]
+            if fields:
+                for field in fields:
+                    setattr(existing, field.attname, getattr(monitoring_location, field.attname))
+                existing.update_user = monitoring_location.update_user
+                changed.append((existing, [field.name for field in fields]))
+        return new, changed
+
+    def write_chunk(self, monitoring_locations, mode):
+        """
+        Writes the monitoring locations of a chunk
+        :return: dictionary of the numbers of monitoring locations inserted, updated and unchanged,
+            the Counter of the changed fields in the diff mode and the list of the agency and site
+            number of the updated monitoring locations in the diff mode
+        """
+        changed_fields = Counter()
+        site_ids = []
+        if mode == MODE_UPSERT:
+            inserted, updated = MonitoringLocation.objects.upsert(monitoring_locations)
+        elif mode == MODE_DIFF:
+            new, changed = self.diff_chunk(monitoring_locations)
+            inserted = len(MonitoringLocation.objects.bulk_create(new))
+            updated = len(changed)
+            if changed:
+                # bulk_update does not set auto_now fields
+                update_date = timezone.now()
+                for existing, names in changed:
+                    existing.update_date = update_date
+                    changed_fields.update(names)
+                MonitoringLocation.objects.bulk_update(
+                    [existing for existing, _ in changed], [*sorted(changed_fields), 'update_user', 'update_date'])
+            site_ids = [(ml.agency_id, ml.site_no) for ml in new] + \
+                [(existing.agency_id, existing.site_no) for existing, _ in changed]
+        else:
+            inserted, updated = len(MonitoringLocation.objects.bulk_create(monitoring_locations)), 0
+        return {'inserted': inserted, 'updated': updated, 'unchanged': len(monitoring_locations) - inserted - updated,
+                'changed_fields': changed_fields, 'site_ids': site_ids}
+
+    def load(self, rows, user, commit_policy, mode=MODE_INSERT):
+        """
+        Converts, validates and writes rows in chunks
+        :param rows: iterable of row index and list of strings
+        :param user: User loading the rows
+        :param commit_policy: COMMIT_ALL or COMMIT_CHUNKS
+        :param mode: MODE_INSERT, MODE_UPSERT or MODE_DIFF
+        A file error stops the load. With the chunks policy the chunks before it stay loaded.
+        :return: tuple of the dictionary of the numbers of monitoring locations inserted, updated
+            and unchanged and, under changed_fields, the Counter of the fields changed in the diff
+            mode, error messages and warning messages
+        """
+        lookups = BulkUploadLookups()
+        file_site_ids = {}
+        error_messages = []
+        warning_messages = []
+        counts = dict.fromkeys(COUNTS, 0)
+        changed_fields = Counter()
+        site_ids = []
+        file_error = None
+        last_row_index = 1
+
+        def read_rows():
+            nonlocal last_row_index
+            for row_index, row in rows:
+                last_row_index = row_index
+                yield row_index, row
+
+        try:
+            with transaction.atomic() if commit_policy == COMMIT_ALL else nullcontext():
+                chunks = _chunks(read_rows(), self.chunk_size)
+                while True:
+                    try:
+                        chunk = next(chunks, None)
+                    except FILE_ERRORS as error:
+                        file_error = (last_row_index + 1, error)
+                        break
+                    if chunk is None:
+                        break
+                    monitoring_locations, chunk_errors = self.convert_chunk(
+                        chunk, user, lookups, file_site_ids, warning_messages,
+                        check_existing=mode not in (MODE_UPSERT, MODE_DIFF))
+                    error_messages.extend(chunk_errors)
+                    if len(warning_messages) > self.max_warnings:
+                        # The warnings after max_warnings are replaced by one at the row of the first of them
+                        row_index = warning_messages[self.max_warnings][0]
+                        del warning_messages[self.max_warnings:]
+                        warning_messages.append((row_index, {'warning': 'Too many warnings, the warnings from this '
+                                                                        'row on are not shown'}))
+                    if len(error_messages) >= self.max_errors:
+                        error_messages.append((chunk[-1][0], {'file_error': 'Too many errors, the rest of the file '
+                                                                            'was not read'}))
+                        break
+                    # With the all policy nothing is loaded after the first error
+                    if not error_messages or (commit_policy == COMMIT_CHUNKS and not chunk_errors):
+                        try:
+                            with transaction.atomic():
+                                chunk_counts = self.write_chunk(monitoring_locations, mode)
+                        except IntegrityError:
+                            error_messages.append((chunk[0][0], {NON_FIELD_ERRORS: [
+                                'A monitoring location in the chunk starting at this row was added while the file '
+                                'was loading']}))
+                            continue
+                        for name in COUNTS:
+                            counts[name] += chunk_counts[name]
+                        changed_fields.update(chunk_counts['changed_fields'])
+                        site_ids.extend(chunk_counts['site_ids'])
+                if commit_policy == COMMIT_ALL and (error_messages or file_error):
+                    transaction.set_rollback(True)
+                    counts = dict.fromkeys(COUNTS, 0)
+                    changed_fields = Counter()
+            if file_error:
+                row_index, error = file_error
+                error_messages.append((row_index, {'file_error': (
+                    f'{sum(counts[name] for name in COUNTS)} rows loaded before the file error at row {row_index}. '
+                    f'{FILE_ERROR_MESSAGE}: {error}')}))
+        finally:
+            if counts['inserted'] or counts['updated']:
+                # Only the diff mode knows which monitoring locations were written
+                monitoring_locations_changed.send(sender=MonitoringLocation,
+                                                  site_ids=site_ids if mode == MODE_DIFF else None)
+        return {**counts, 'changed_fields': changed_fields}, error_messages, warning_messages
+
     def post(self, request):
         """
         Overrides View''s post method, processing the file and displaying the errrors
         if any. Successful validation redirect back to the monitoring location
         """
+        form = self.form_class(request.POST, request.FILES)
         context = {
-            'form': self.form_class()
+            'form': form
         }
-        if 'file' in request.FILES:
-            csv_file = request.FILES['file']
-            data_set = csv_file.read().decode('UTF-8')
-            data_stream = io.StringIO(data_set)
-            # Skip header
-            next(data_stream)
-            monitoring_locations = []
-            error_messages = []
-            warning_messages = []
-            row_index = 1
-            for row in csv.reader(data_stream):
-                row_index += 1
-                try:
-                    monitoring_locations.append(_get_monitoring_location(
-                        row_index, row, request.user, warning_messages))
-                except ValidationError as error:
-                    error_messages.append((row_index, error.message_dict))
-            if len(error_messages) == 0:
-                MonitoringLocation.objects.bulk_create(monitoring_locations)
-                if len(warning_messages) == 0:
-                    return redirect(reverse('admin:registry_monitoringlocation_changelist'))
-                warning_messages.insert(
-                    0, (0, {'__overall__': 'Data was loaded with the following warnings'}))
-            context['errors'] = error_messages
-            context['warnings'] = warning_messages
-        else:
+        if 'file' not in request.FILES:
             context['file_error'] = 'Please select a file to upload'
+        elif form.is_valid():
+            commit_policy = form.cleaned_data['commit'] or COMMIT_ALL
+            mode = form.cleaned_data['mode'] or MODE_INSERT
+            try:
+                with _open_upload(request.FILES['file']) as data_stream:
+                    reader = csv.reader(data_stream)
+                    # Skip header
+                    next(reader, None)
+                    counts, error_messages, warning_messages = self.load(
+                        enumerate(reader, 2), request.user, commit_policy, mode)
+            except FILE_ERRORS as error:
+                context['file_error'] = f'{FILE_ERROR_MESSAGE}: {error}'
+            else:
+                loaded = f'{counts["inserted"]} monitoring locations inserted, {counts["updated"]} updated and ' \
+                    f'{counts["unchanged"]} unchanged'
+                if counts['changed_fields']:
+                    loaded += '. Changed fields: ' + ', '.join(
+                        f'{name} ({count})' for name, count in sorted(counts['changed_fields'].items()))
+                if len(error_messages) == 0:
+                    if len(warning_messages) == 0:
+                        messages.success(request, loaded, fail_silently=True)
+                        return redirect(reverse('admin:registry_monitoringlocation_changelist'))
+                    warning_messages.insert(
+                        0, (0, {'__overall__': 'Data was loaded with the following warnings', 'loaded': loaded}))
+                elif any(counts[name] for name in COUNTS):
+                    warning_messages.insert(
+                        0, (0, {'__overall__': 'The chunks without errors were loaded', 'loaded': loaded}))
+                context['errors'] = error_messages
+                context['warnings'] = warning_messages
         context.update(dict(admin.site.each_context(self.request)))
         return render(request, self.template_name, context)
 
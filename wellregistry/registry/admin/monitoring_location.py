@@ -13,6 +13,7 @@ from django.contrib.admin.widgets import RelatedFieldWidgetWrapper
 from admin_auto_filters.filters import AutocompleteFilter
 
 from ..models import MonitoringLocation, AgencyLookup
+from ..pagination import CachedCountPaginator
 from .bulk_upload import BulkUploadView, BulkUploadTemplateView
 from .fetch_from_nwis import FetchFromNwisView
 from .auto_complete import SiteNoAutoCompleteView
@@ -444,6 +445,10 @@ class MonitoringLocationAdmin(ModelAdmin):
 
     actions = ['download_monitoring_locations']
 
+    # The changelist count is cached and the unfiltered total is not counted
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
     fields = ['display_flag', 'agency', 'site_no', 'site_name', 'country', 'state', 'county', 'dec_lat_va',
               'dec_long_va', 'horizontal_datum', 'horz_method', 'horz_acy', 'alt_va', 'altitude_units',
               'altitude_datum', 'alt_method', 'alt_acy', 'well_depth', 'well_depth_units', 'nat_aqfr',
@@ -0,0 +1,16 @@
+"""
+Registry application configuration
+"""
+from django.apps import AppConfig
+
+
+class RegistryConfig(AppConfig):
+    """
+    Configuration for the registry application, connecting its signal handlers once the
+    application registry is ready
+    """
+    name = 'registry'
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel,unused-import
+        from . import signals
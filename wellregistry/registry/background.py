@@ -0,0 +1,63 @@
+"""
+Jobs run in a background thread once changes to monitoring locations are committed
+"""
+
+from abc import ABC, abstractmethod
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundScheduler(ABC):
+    """
+    Runs a job in a background thread once changes to monitoring locations are committed, if
+    the setting named by setting is set. Changes committed while the job is running cause it to
+    run once more after it. Subclasses implement run_job.
+    """
+    setting = None
+    thread_name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = False
+
+    @abstractmethod
+    def run_job(self):
+        """
+        Runs the job in the background thread
+        """
+
+    def request(self):
+        """
+        Requests the job once the current transaction commits
+        """
+        if getattr(settings, self.setting):
+            transaction.on_commit(self._start)
+
+    def _start(self):
+        with self._lock:
+            if self._running:
+                self._pending = True
+                return
+            self._running = True
+        threading.Thread(target=self._run, name=self.thread_name, daemon=True).start()
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    self.run_job()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception('Background job %s failed', self.thread_name)
+                with self._lock:
+                    if not self._pending:
+                        self._running = False
+                        return
+                    self._pending = False
+        finally:
+            connection.close()
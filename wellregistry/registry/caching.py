@@ -0,0 +1,162 @@
+"""
+Cache entries of the REST API which are invalidated when monitoring locations are written
+"""
+
+from hashlib import md5
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+DETAIL_GENERATION_KEY = 'monitoring-location-detail-generation'
+DETAIL_TIMEOUT = 60 * 60
+DETAIL_REPRESENTATIONS = ('json', 'flat')
+DETAIL_INVALIDATION_LIMIT = 1000
+
+PAGE_GENERATION_KEY = 'monitoring-location-page-generation'
+PAGE_INVALIDATED_KEY = 'monitoring-location-page-invalidated'
+PAGE_TIMEOUT = 60 * 10
+PAGE_STALE_TIMEOUT = 30
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def detail_key(agency_cd, site_no, representation):
+    """
+    Returns the cache key of the representation of the monitoring location agency_cd:site_no
+    """
+    generation = cache.get(DETAIL_GENERATION_KEY, 0)
+    site_id = md5(f'{agency_cd}:{site_no}'.encode()).hexdigest()
+    return f'monitoring-location:{generation}:{representation}:{site_id}'
+
+
+def _delete_detail(agency_cd, site_no):
+    cache.delete_many([detail_key(agency_cd, site_no, representation)
+                       for representation in DETAIL_REPRESENTATIONS])
+
+
+def invalidate_detail(agency_cd, site_no):
+    """
+    Invalidates the cached representations of the monitoring location agency_cd:site_no, again
+    once the transaction commits to drop any cached before the write was visible
+    """
+    _delete_detail(agency_cd, site_no)
+    transaction.on_commit(lambda: _delete_detail(agency_cd, site_no))
+
+
+def _delete_details(site_ids):
+    cache.delete_many([detail_key(agency_cd, site_no, representation)
+                       for agency_cd, site_no in site_ids for representation in DETAIL_REPRESENTATIONS])
+
+
+def invalidate_details(site_ids=None):
+    """
+    Invalidates the cached representations of the monitoring locations with site_ids, a list of
+    (agency_cd, site_no) tuples, or of every monitoring location. Used when many monitoring
+    locations, or the lookups they include, change at once. More than DETAIL_INVALIDATION_LIMIT
+    site_ids invalidate every monitoring location.
+    """
+    if site_ids is None or len(site_ids) > DETAIL_INVALIDATION_LIMIT:
+        _increment(DETAIL_GENERATION_KEY)
+        transaction.on_commit(lambda: _increment(DETAIL_GENERATION_KEY))
+    elif site_ids:
+        _delete_details(site_ids)
+        transaction.on_commit(lambda: _delete_details(site_ids))
+
+
+def page_key(url, media_type):
+    """
+    Returns the cache key of the page of monitoring locations at url rendered as media_type
+    """
+    return f'monitoring-location-page:{md5(f"{url}:{media_type}".encode()).hexdigest()}'
+
+
+def _invalidate_pages():
+    _increment(PAGE_GENERATION_KEY)
+    cache.set(PAGE_INVALIDATED_KEY, time.time(), None)
+
+
+def invalidate_pages():
+    """
+    Invalidates the cached pages of monitoring locations, again once the transaction commits.
+    Invalidated pages may still be served stale while they are recomputed.
+    """
+    _invalidate_pages()
+    transaction.on_commit(_invalidate_pages)
+
+
+class SingleFlightCache:
+    """
+    Cache of values which are expensive to compute, shared by every process using the cache
+    backend. Entries are fresh for timeout seconds and until the generation stored under
+    generation_key changes. Only the process which takes the lock of a key computes its value.
+    Meanwhile the others serve the stale entry, for at most stale_timeout seconds after it expired
+    or was invalidated, or wait up to wait_timeout seconds for the new entry before computing it
+    themselves. The time of the latest invalidation is stored under invalidated_key.
+    """
+    lock_timeout = 60
+    wait_timeout = 5
+    wait_interval = 0.05
+
+    def __init__(self, generation_key, invalidated_key, timeout, stale_timeout):
+        self.generation_key = generation_key
+        self.invalidated_key = invalidated_key
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+
+    @staticmethod
+    def _is_fresh(entry, generation, now):
+        return entry['generation'] == generation and now < entry['expires']
+
+    def _is_servable(self, entry, generation, invalidated, now):
+        if entry['generation'] != generation:
+            return now < (invalidated or 0) + self.stale_timeout
+        return now < entry['expires'] + self.stale_timeout
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the value cached under key, calling compute to replace it if it is missing or stale
+        """
+        values = cache.get_many([self.generation_key, self.invalidated_key, key])
+        generation = values.get(self.generation_key, 0)
+        entry = values.get(key)
+        now = time.time()
+        if entry is not None and self._is_fresh(entry, generation, now):
+            return entry['value']
+
+        lock_key = f'{key}:lock'
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, self.lock_timeout):
+            try:
+                return self._compute(key, compute, generation)
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        if entry is not None and self._is_servable(entry, generation, values.get(self.invalidated_key), now):
+            return entry['value']
+
+        deadline = now + self.wait_timeout
+        while time.time() < deadline:
+            time.sleep(self.wait_interval)
+            entry = cache.get(key)
+            if entry is not None and entry['generation'] >= generation and entry['expires'] > now:
+                return entry['value']
+            if cache.get(lock_key) is None:
+                break
+        return self._compute(key, compute, generation)
+
+    def _compute(self, key, compute, generation):
+        value = compute()
+        entry = {'generation': generation, 'expires': time.time() + self.timeout, 'value': value}
+        cache.set(key, entry, self.timeout + self.stale_timeout)
+        return value
+
+
+page_cache = SingleFlightCache(PAGE_GENERATION_KEY, PAGE_INVALIDATED_KEY, PAGE_TIMEOUT, PAGE_STALE_TIMEOUT)
@@ -0,0 +1,67 @@
+"""
+Postgres functions used to build JSON documents in the database
+"""
+
+from django.db.models import FloatField, Func, TextField, Value
+
+
+class JSONBuildObject(Func):
+    """
+    json_build_object taking the object's keys and value expressions as keyword arguments
+    """
+    function = 'json_build_object'
+    output_field = TextField()
+
+    def __init__(self, **fields):
+        expressions = []
+        for key, value in fields.items():
+            expressions.extend((Value(key), value))
+        super().__init__(*expressions)
+
+
+class ISODateTime(Func):
+    """
+    Formats a timestamp with time zone in UTC the way the REST framework DateTimeField
+    does, omitting the fractional seconds when they are zero
+    """
+    template = (
+        'CASE WHEN date_trunc(\'second\', %(expressions)s) = %(expressions)s '
+        'THEN to_char(%(expressions)s AT TIME ZONE \'UTC\', \'YYYY-MM-DD"T"HH24:MI:SS"Z"\') '
+        'ELSE to_char(%(expressions)s AT TIME ZONE \'UTC\', \'YYYY-MM-DD"T"HH24:MI:SS.US"Z"\') END'
+    )
+    output_field = TextField()
+
+
+class MercatorY(Func):
+    """
+    Web Mercator y coordinate, in radians, of a latitude in degrees
+    """
+    template = 'ln(tan(radians(45 + %(expressions)s / 2)))'
+    output_field = FloatField()
+
+
+class GreatCircleDistance(Func):
+    """
+    Haversine distance in kilometres from the origin, a latitude and longitude in degrees, to
+    the points given by the latitude and longitude expressions
+    """
+    earth_radius_km = 6371.0088
+    output_field = FloatField()
+
+    def __init__(self, latitude, longitude, origin):
+        super().__init__(latitude, longitude)
+        self.origin = origin
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # pylint: disable=arguments-differ
+        latitude, longitude = self.get_source_expressions()
+        latitude_sql, latitude_params = compiler.compile(latitude)
+        longitude_sql, longitude_params = compiler.compile(longitude)
+        origin_latitude, origin_longitude = self.origin
+        sql = (f'2 * {self.earth_radius_km} * asin(sqrt('
+               f'power(sin(radians({latitude_sql} - %s) / 2), 2) + '
+               f'cos(radians(%s)) * cos(radians({latitude_sql})) * '
+               f'power(sin(radians({longitude_sql} - %s) / 2), 2)))')
+        params = [*latitude_params, origin_latitude, origin_latitude, *latitude_params, *longitude_params,
+                  origin_longitude]
+        return sql, params
@@ -0,0 +1,207 @@
+"""
+Filters for the REST API
+"""
+# pylint: disable=too-few-public-methods
+
+from abc import ABC, abstractmethod
+import math
+
+from django import forms
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from django_filters.rest_framework import BaseInFilter, BooleanFilter, CharFilter, Filter, FilterSet, \
+    IsoDateTimeFromToRangeFilter, NumberFilter
+
+from .db_functions import GreatCircleDistance
+from .models import MonitoringLocation
+
+KM_PER_DEGREE_LATITUDE = 111.195
+
+
+class CharInFilter(BaseInFilter, CharFilter):
+    """
+    Filter matching any of a comma separated list of values
+    """
+
+
+class CoordinatesField(forms.CharField, ABC):
+    """
+    Form field for a comma separated list of a fixed number of coordinates in decimal degrees.
+    Cleans to a tuple of floats. Subclasses implement valid.
+    """
+    coordinate_count = None
+    message = None
+
+    def clean(self, value):
+        value = super().clean(value)
+        if not value:
+            return None
+        try:
+            coordinates = tuple(float(coordinate) for coordinate in value.split(','))
+        except ValueError:
+            raise forms.ValidationError(self.message)
+        if len(coordinates) != self.coordinate_count or not all(map(math.isfinite, coordinates)):
+            raise forms.ValidationError(self.message)
+        if not self.valid(coordinates):
+            raise forms.ValidationError(self.message)
+        return coordinates
+
+    @staticmethod
+    @abstractmethod
+    def valid(coordinates):
+        """
+        Return True if the range of each of coordinates is valid
+        """
+
+
+class BoundingBoxField(CoordinatesField):
+    """
+    Form field for a bounding box, min_longitude,min_latitude,max_longitude,max_latitude
+    """
+    coordinate_count = 4
+    message = 'Enter a bounding box as min longitude,min latitude,max longitude,max latitude.'
+
+    @staticmethod
+    def valid(coordinates):
+        min_longitude, min_latitude, max_longitude, max_latitude = coordinates
+        return -90 <= min_latitude <= max_latitude <= 90 and \
+            -180 <= min_longitude <= 180 and -180 <= max_longitude <= 180
+
+
+class PointField(CoordinatesField):
+    """
+    Form field for a point, latitude,longitude
+    """
+    coordinate_count = 2
+    message = 'Enter a point as latitude,longitude.'
+
+    @staticmethod
+    def valid(coordinates):
+        latitude, longitude = coordinates
+        return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def _longitude_range(min_longitude, max_longitude):
+    """
+    Returns the Q object matching the longitudes between min_longitude and max_longitude. When
+    min_longitude is greater than max_longitude the range crosses the antimeridian.
+    """
+    if min_longitude <= max_longitude:
+        return Q(dec_long_float__gte=min_longitude, dec_long_float__lte=max_longitude)
+    return Q(dec_long_float__gte=min_longitude) | Q(dec_long_float__lte=max_longitude)
+
+
+def bounding_box_filter(min_longitude, min_latitude, max_longitude, max_latitude):
+    """
+    Returns the Q object matching monitoring locations within the bounding box. The latitude
+    range is an index condition on the double precision coordinates.
+    """
+    return Q(dec_lat_float__gte=min_latitude, dec_lat_float__lte=max_latitude) & \
+        _longitude_range(min_longitude, max_longitude)
+
+
+def site_id_filter(site_ids):
+    """
+    Returns the expression matching the monitoring locations with any of site_ids, a list of
+    (agency_cd, site_no) tuples. The ids are passed as two arrays and unnested, so the pairs are
+    matched with one semi-join on the agency and site number unique index however many there are.
+    """
+    table = MonitoringLocation._meta.db_table
+    return RawSQL(
+        f'("{table}"."agency_cd", "{table}"."site_no") IN (SELECT * FROM unnest(%s::text[], %s::text[]))',
+        ([agency_cd for agency_cd, _ in site_ids], [site_no for _, site_no in site_ids]),
+        output_field=BooleanField()
+    )
+
+
+class BoundingBoxFilter(Filter):
+    """
+    Filters monitoring locations within a bounding box given as
+    min_longitude,min_latitude,max_longitude,max_latitude
+    """
+    field_class = BoundingBoxField
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        return self.get_method(qs)(bounding_box_filter(*value))
+
+
+class PointFilter(Filter):
+    """
+    Filter taking a point given as latitude,longitude. Used with a filter method.
+    """
+    field_class = PointField
+
+
+class MonitoringLocationFilterForm(forms.Form):
+    """
+    Form for MonitoringLocationFilter requiring radius_km when near is used
+    """
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('near') and cleaned_data.get('radius_km') is None:
+            self.add_error('radius_km', 'A radius is required with near.')
+        return cleaned_data
+
+
+class MonitoringLocationFilter(FilterSet):
+    """
+    Filters for the monitoring locations API. The code filters take comma separated lists of
+    codes. Each filter is backed by an index on the monitoring location table: the foreign key
+    indexes, the unique site_no and agency index, and partial indexes on the flags which are
+    usually filtered on true. The spatial filters use the index on the double precision
+    coordinates. near and radius_km select the locations within radius_km of a point, first
+    by the bounding box of the circle and then by great circle distance.
+    """
+    display_flag = BooleanFilter()
+    agency = CharInFilter(field_name='agency')
+    state = CharInFilter(field_name='state__state_cd')
+    county = CharInFilter(field_name='county__county_cd')
+    nat_aqfr = CharInFilter(field_name='nat_aqfr')
+    site_type = CharInFilter()
+    wl_sn_flag = BooleanFilter()
+    qw_sn_flag = BooleanFilter()
+    update_date = IsoDateTimeFromToRangeFilter()
+    site_no = CharInFilter()
+    bbox = BoundingBoxFilter()
+    near = PointFilter(method='filter_near')
+    radius_km = NumberFilter(method='filter_radius_km', min_value=0)
+
+    class Meta:
+        model = MonitoringLocation
+        form = MonitoringLocationFilterForm
+        fields = ['display_flag', 'agency', 'state', 'county', 'nat_aqfr', 'site_type', 'wl_sn_flag', 'qw_sn_flag',
+                  'update_date', 'site_no', 'bbox', 'near', 'radius_km']
+
+    def filter_near(self, queryset, name, value):
+        """
+        Filter queryset to the monitoring locations within radius_km of the point, value
+        """
+        # pylint: disable=unused-argument
+        latitude, longitude = value
+        radius_km = float(self.form.cleaned_data['radius_km'])
+
+        latitude_delta = radius_km / KM_PER_DEGREE_LATITUDE
+        min_latitude = max(latitude - latitude_delta, -90)
+        max_latitude = min(latitude + latitude_delta, 90)
+        widest_latitude = max(abs(min_latitude), abs(max_latitude))
+        bounds = Q(dec_lat_float__gte=min_latitude, dec_lat_float__lte=max_latitude)
+        if widest_latitude < 90:
+            longitude_delta = latitude_delta / math.cos(math.radians(widest_latitude))
+            if longitude_delta < 180:
+                bounds &= _longitude_range((longitude - longitude_delta + 180) % 360 - 180,
+                                           (longitude + longitude_delta + 180) % 360 - 180)
+
+        return queryset.filter(bounds) \
+            .annotate(distance_km=GreatCircleDistance('dec_lat_float', 'dec_long_float', (latitude, longitude))) \
+            .filter(distance_km__lte=radius_km)
+
+    @staticmethod
+    def filter_radius_km(queryset, name, value):
+        """
+        radius_km is applied by filter_near
+        """
+        # pylint: disable=unused-argument
+        return queryset
@@ -0,0 +1,90 @@
+"""
+Command to benchmark the serialization paths of the monitoring locations API
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rest_framework.renderers import JSONRenderer
+
+from registry.models import AgencyLookup, AltitudeDatumLookup, CountyLookup, HorizontalDatumLookup, \
+    MonitoringLocation, NatAqfrLookup, UnitsLookup
+from registry.renderers import PassthroughJSONRenderer
+from registry.serializers import FlatMonitoringLocationSerializer, MonitoringLocationSerializer, \
+    PgJSONMonitoringLocationSerializer
+from registry.views import MonitoringLocationsListView
+
+
+def create_benchmark_monitoring_locations(count):
+    """
+    Creates count synthetic monitoring locations, with site numbers starting with BENCHMARK
+    """
+    county = CountyLookup.objects.select_related('state_id', 'country_cd').first()
+    if county is None:
+        raise CommandError('Lookup tables are empty, run update_lookups first')
+    lookups = {
+        'agency': AgencyLookup.objects.first(),
+        'country': county.country_cd,
+        'state': county.state_id,
+        'county': county,
+        'horizontal_datum': HorizontalDatumLookup.objects.first(),
+        'altitude_datum': AltitudeDatumLookup.objects.first(),
+        'altitude_units': UnitsLookup.objects.first(),
+        'well_depth_units': UnitsLookup.objects.first(),
+        'nat_aqfr': NatAqfrLookup.objects.first()
+    }
+    MonitoringLocation.objects.bulk_create(
+        (MonitoringLocation(site_no=f'BENCHMARK{index}', site_name=f'Benchmark site {index}',
+                            dec_lat_va='43.0731', dec_long_va='-89.4012', alt_va='858.5', well_depth='120',
+                            site_type='WELL', aqfr_type='CONFINED', display_flag=True, **lookups)
+         for index in range(count)),
+        batch_size=5000
+    )
+
+
+class Command(BaseCommand):
+    """
+    Implements command to time each serialization path of the monitoring locations API against
+    a registry of a given size. The benchmark rows are created in a transaction which is rolled
+    back when the command finishes.
+    """
+    help = 'Benchmarks serialization of monitoring locations with synthetic rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                            help='Number of monitoring locations to benchmark with')
+
+    @staticmethod
+    def _time(serialize):
+        start = time.perf_counter()
+        content = serialize()
+        return time.perf_counter() - start, len(content)
+
+    @staticmethod
+    def _nested():
+        queryset = MonitoringLocationsListView.queryset.filter(site_no__startswith='BENCHMARK')
+        return JSONRenderer().render(MonitoringLocationSerializer(queryset, many=True).data)
+
+    @staticmethod
+    def _flat():
+        queryset = FlatMonitoringLocationSerializer.project(
+            MonitoringLocation.objects.filter(site_no__startswith='BENCHMARK'))
+        return JSONRenderer().render(FlatMonitoringLocationSerializer(queryset, many=True).data)
+
+    @staticmethod
+    def _pgjson():
+        queryset = PgJSONMonitoringLocationSerializer.project(
+            MonitoringLocation.objects.filter(site_no__startswith='BENCHMARK'))
+        return PassthroughJSONRenderer().render(PgJSONMonitoringLocationSerializer(queryset, many=True).data)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"rows":>8} {"path":>8} {"seconds":>9} {"bytes":>12}')
+        for count in options['rows']:
+            with transaction.atomic():
+                create_benchmark_monitoring_locations(count)
+                for name, serialize in (('nested', self._nested), ('flat', self._flat), ('pgjson', self._pgjson)):
+                    seconds, size = self._time(serialize)
+                    self.stdout.write(f'{count:>8} {name:>8} {seconds:>9.3f} {size:>12}')
+                transaction.set_rollback(True)
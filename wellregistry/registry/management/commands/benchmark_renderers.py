@@ -0,0 +1,65 @@
+"""
+Command to benchmark the JSON renderers on pages of monitoring locations
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import DecimalField
+from rest_framework.settings import api_settings
+
+from registry.management.commands.benchmark_api import create_benchmark_monitoring_locations
+from registry.renderers import FastJSONRenderer
+from registry.serializers import MonitoringLocationSerializer
+from registry.views import MonitoringLocationsListView
+
+
+class Command(BaseCommand):
+    """
+    Implements command to time serializing and encoding one page of monitoring locations with
+    each JSON renderer, with decimals represented as strings and as numbers. Each time is the
+    fastest of repeat runs. The benchmark rows are created in a transaction which is rolled back
+    when the command finishes.
+    """
+    help = 'Benchmarks JSON renderers on a page of synthetic monitoring locations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=api_settings.PAGE_SIZE,
+                            help='Number of monitoring locations in the page')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of times to time each step')
+
+    @staticmethod
+    def _best(repeat, function):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    @staticmethod
+    def _serialize(page, decimals):
+        serializer = MonitoringLocationSerializer(page, many=True)
+        for field in serializer.child.fields.values():
+            if isinstance(field, DecimalField):
+                field.coerce_to_string = decimals == 'string'
+        return serializer.data
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        repeat = options['repeat']
+        self.stdout.write(f'{"rows":>6} {"decimals":>8} {"renderer":>16} {"serialize":>10} {"encode":>10} '
+                          f'{"bytes":>10}')
+        with transaction.atomic():
+            create_benchmark_monitoring_locations(page_size)
+            page = list(MonitoringLocationsListView.queryset.filter(site_no__startswith='BENCHMARK')[:page_size])
+            for decimals in ('string', 'number'):
+                serialize_seconds, data = self._best(repeat, lambda decimals=decimals: self._serialize(page, decimals))
+                for renderer in (JSONRenderer(), FastJSONRenderer()):
+                    encode_seconds, content = self._best(repeat, lambda renderer=renderer: renderer.render(data))
+                    self.stdout.write(f'{page_size:>6} {decimals:>8} {type(renderer).__name__:>16} '
+                                      f'{serialize_seconds:>10.4f} {encode_seconds:>10.4f} {len(content):>10}')
+            transaction.set_rollback(True)
@@ -0,0 +1,19 @@
+"""
+Command to refresh the monitoring location statistics
+"""
+
+from django.core.management.base import BaseCommand
+
+from registry.statistics import refresh_statistics
+
+
+class Command(BaseCommand):
+    """
+    Implements command to refresh the monitoring_location_statistics materialized view, for
+    running on a schedule
+    """
+    help = 'Refreshes the monitoring location statistics'
+
+    def handle(self, *args, **options):
+        refresh_statistics()
+        self.stdout.write('Successfully refreshed monitoring location statistics')
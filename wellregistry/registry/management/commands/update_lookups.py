@@ -10,8 +10,10 @@ from django.contrib.auth.models import Group, Permission
 from django.core.management.base import BaseCommand
 from django.db.models.functions import Lower
 
+from registry.caching import invalidate_details, invalidate_pages
 from registry.models import CountryLookup, StateLookup, CountyLookup, NatAqfrLookup, AltitudeDatumLookup, \
-    HorizontalDatumLookup, UnitsLookup, AgencyLookup
+    HorizontalDatumLookup, UnitsLookup, AgencyLookup, DataVersion
+from registry.signals import lookup_invalidation_suspended
 
 INITIAL_DATA_DIR = os.path.join(settings.BASE_DIR, 'registry/management/commands/initial_data/')
 
@@ -104,17 +106,24 @@ class Command(BaseCommand):
             group.save()
 
     def handle(self, *args, **options):
-        self._update_simple_lookups('agency.csv', AgencyLookup, field_names=['agency_cd', 'agency_nm', 'agency_med'])
-        self._update_agency_groups()
-
-        self._update_simple_lookups('altitude_datums.csv', AltitudeDatumLookup,
-                                    field_names=['adatum_cd', 'adatum_desc'])
-        self._update_simple_lookups('country.csv', CountryLookup, field_names=['country_cd', 'country_nm'])
-        self._update_simple_lookups('horizontal_datums.csv', HorizontalDatumLookup,
-                                    field_names=['hdatum_cd', 'hdatum_desc'])
-        self._update_simple_lookups('nat_aqfr.csv', NatAqfrLookup, field_names=['nat_aqfr_cd', 'nat_aqfr_desc'])
-        self._update_simple_lookups('units.csv', UnitsLookup, field_names=['unit_id', 'unit_desc'])
-        self._update_state_lookups()
-        self._update_county_lookups()
+        # Lookups are invalidated once below rather than on each saved row
+        with lookup_invalidation_suspended():
+            self._update_simple_lookups('agency.csv', AgencyLookup,
+                                        field_names=['agency_cd', 'agency_nm', 'agency_med'])
+            self._update_agency_groups()
+
+            self._update_simple_lookups('altitude_datums.csv', AltitudeDatumLookup,
+                                        field_names=['adatum_cd', 'adatum_desc'])
+            self._update_simple_lookups('country.csv', CountryLookup, field_names=['country_cd', 'country_nm'])
+            self._update_simple_lookups('horizontal_datums.csv', HorizontalDatumLookup,
+                                        field_names=['hdatum_cd', 'hdatum_desc'])
+            self._update_simple_lookups('nat_aqfr.csv', NatAqfrLookup, field_names=['nat_aqfr_cd', 'nat_aqfr_desc'])
+            self._update_simple_lookups('units.csv', UnitsLookup, field_names=['unit_id', 'unit_desc'])
+            self._update_state_lookups()
+            self._update_county_lookups()
+        DataVersion.bump(DataVersion.LOOKUPS)
+        # Monitoring location details and pages include lookup names
+        invalidate_details()
+        invalidate_pages()
 
         self.stdout.write('Successfully updated all lookups')
@@ -0,0 +1,23 @@
+"""
+Command to write snapshots of the displayed monitoring location registry
+"""
+
+from django.core.management.base import BaseCommand
+
+from registry.snapshots import SnapshotWriter
+
+
+class Command(BaseCommand):
+    """
+    Implements command to write the JSON, CSV and GeoJSON snapshots of the displayed monitoring
+    locations and point latest.json at them
+    """
+    help = 'Writes snapshots of the displayed monitoring locations to SNAPSHOT_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--root', help='Directory to write the snapshots to, defaults to SNAPSHOT_ROOT')
+
+    def handle(self, *args, **options):
+        latest = SnapshotWriter(options['root']).write()
+        for snapshot_format, snapshot in latest['files'].items():
+            self.stdout.write(f'Wrote {snapshot_format} snapshot {snapshot["name"]} ({snapshot["size"]} bytes)')
@@ -0,0 +1,37 @@
+"""
+Adds the data_version table and indexes monitoring location update_date
+"""
+# Generated by Django 3.1.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """
+    Auto generated migration
+    """
+
+    dependencies = [
+        ('registry', '0004_verbose_name_updates_qw_and_wl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('version', models.IntegerField(default=0)),
+                ('update_date', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'data_version',
+            },
+        ),
+        migrations.AlterField(
+            model_name='monitoringlocation',
+            name='update_date',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
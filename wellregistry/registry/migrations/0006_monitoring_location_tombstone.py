@@ -0,0 +1,33 @@
+"""
+Adds the monitoring_location_tombstone table
+"""
+# Generated by Django 3.1.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    """
+    Auto generated migration
+    """
+
+    dependencies = [
+        ('registry', '0005_data_version_and_update_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonitoringLocationTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('monitoring_location_id', models.IntegerField()),
+                ('agency_cd', models.CharField(max_length=50, null=True)),
+                ('site_no', models.CharField(max_length=16)),
+                ('delete_date', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'monitoring_location_tombstone',
+            },
+        ),
+    ]
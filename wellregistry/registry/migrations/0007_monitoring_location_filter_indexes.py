@@ -0,0 +1,35 @@
+"""
+Adds the indexes backing the filters of the monitoring locations API
+"""
+# Generated by Django 3.1.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Auto generated migration
+    """
+
+    dependencies = [
+        ('registry', '0006_monitoring_location_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='monitoringlocation',
+            index=models.Index(fields=['site_type'], name='ml_site_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monitoringlocation',
+            index=models.Index(condition=models.Q(display_flag=True), fields=['id'], name='ml_display_flag_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monitoringlocation',
+            index=models.Index(condition=models.Q(wl_sn_flag=True), fields=['id'], name='ml_wl_sn_flag_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monitoringlocation',
+            index=models.Index(condition=models.Q(qw_sn_flag=True), fields=['id'], name='ml_qw_sn_flag_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+"""
+Adds indexed double precision copies of the monitoring location coordinates
+"""
+# Generated by Django 3.1.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Auto generated migration
+    """
+
+    dependencies = [
+        ('registry', '0007_monitoring_location_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitoringlocation',
+            name='dec_lat_float',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='monitoringlocation',
+            name='dec_long_float',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            'UPDATE registry_monitoringlocation '
+            'SET dec_lat_float = dec_lat_va::double precision, dec_long_float = dec_long_va::double precision',
+            migrations.RunSQL.noop
+        ),
+        migrations.AddIndex(
+            model_name='monitoringlocation',
+            index=models.Index(fields=['dec_lat_float', 'dec_long_float'], name='ml_float_coordinates_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+"""
+Adds the monitoring_location_statistics materialized view
+"""
+# Generated by Django 3.1.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+CREATE_STATISTICS_VIEW = '''
+CREATE MATERIALIZED VIEW monitoring_location_statistics AS
+SELECT (row_number() OVER (ORDER BY agency_cd, country_cd, state_cd, nat_aqfr_cd, site_type, display_flag,
+                                    wl_sn_flag, wl_baseline_flag, qw_sn_flag, qw_baseline_flag))::integer AS id,
+       summary.*
+FROM (
+    SELECT ml.agency_cd, ml.country_cd, state.state_cd, ml.nat_aqfr_cd, ml.site_type, ml.display_flag,
+           ml.wl_sn_flag, ml.wl_baseline_flag, ml.qw_sn_flag, ml.qw_baseline_flag, count(*)::integer AS count
+    FROM registry_monitoringlocation ml
+    LEFT JOIN state ON state.id = ml.state_id
+    GROUP BY ml.agency_cd, ml.country_cd, state.state_cd, ml.nat_aqfr_cd, ml.site_type, ml.display_flag,
+             ml.wl_sn_flag, ml.wl_baseline_flag, ml.qw_sn_flag, ml.qw_baseline_flag
+) summary;
+CREATE UNIQUE INDEX monitoring_location_statistics_id_idx ON monitoring_location_statistics (id);
+'''
+
+
+class Migration(migrations.Migration):
+    """
+    Auto generated migration
+    """
+
+    dependencies = [
+        ('registry', '0008_monitoring_location_float_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonitoringLocationStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agency_cd', models.CharField(max_length=50, null=True)),
+                ('country_cd', models.CharField(max_length=2, null=True)),
+                ('state_cd', models.CharField(max_length=2, null=True)),
+                ('nat_aqfr_cd', models.CharField(max_length=10, null=True)),
+                ('site_type', models.CharField(max_length=10)),
+                ('display_flag', models.BooleanField()),
+                ('wl_sn_flag', models.BooleanField()),
+                ('wl_baseline_flag', models.BooleanField()),
+                ('qw_sn_flag', models.BooleanField()),
+                ('qw_baseline_flag', models.BooleanField()),
+                ('count', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'monitoring_location_statistics',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(CREATE_STATISTICS_VIEW, 'DROP MATERIALIZED VIEW monitoring_location_statistics'),
+    ]
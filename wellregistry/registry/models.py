@@ -5,7 +5,9 @@ Monitoring Location Registry ORM object.
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models.functions import Cast
+from django.utils import timezone
 
 from smart_selects.db_fields import ChainedForeignKey
 
@@ -142,6 +144,41 @@ class UnitsLookup(models.Model):
         return self.unit_desc
 
 
+class DataVersion(models.Model):
+    """
+    Model definition for the data_version table. Each row is a counter which is incremented
+    whenever the named data set changes.
+    """
+    LOOKUPS = 'lookups'
+    STATISTICS = 'statistics'
+
+    name = models.CharField(max_length=50, unique=True)
+    version = models.IntegerField(default=0)
+    update_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'data_version'
+
+    def __str__(self):
+        return f'{self.name}:{self.version}'
+
+    @classmethod
+    def bump(cls, name):
+        """
+        Increment the version of the data set, name
+        """
+        cls.objects.get_or_create(name=name)
+        cls.objects.filter(name=name).update(version=models.F('version') + 1, update_date=timezone.now())
+
+    @classmethod
+    def get_version(cls, name):
+        """
+        Return the version of the data set, name. An unversioned data set has version 0.
+        :return: DataVersion
+        """
+        return cls.objects.filter(name=name).first() or cls(name=name, update_date=None)
+
+
 WELL_TYPES = [('Surveillance', 'Surveillance'), ('Trend', 'Trend'), ('Special', 'Special')]
 WELL_CHARACTERISTICS = [('Background', 'Background'),
                         ('Suspected/Anticipated Changes', 'Suspected/Anticipated Changes'),
@@ -153,6 +190,83 @@ non_blank_validator = RegexValidator(
     message='Field must not be blank')
 
 
+# Arbitrary precision coordinate fields and the double precision fields which shadow them
+FLOAT_COORDINATE_FIELDS = (('dec_lat_va', 'dec_lat_float'), ('dec_long_va', 'dec_long_float'))
+
+
+def _float_or_none(value):
+    return None if value is None or value == '' else float(value)
+
+
+class MonitoringLocationQuerySet(models.QuerySet):
+    """
+    QuerySet which keeps the double precision coordinates of monitoring locations in sync
+    with their decimal coordinates when rows are created or updated in bulk
+    """
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.set_float_coordinates()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        for field, float_field in FLOAT_COORDINATE_FIELDS:
+            if field in fields and float_field not in fields:
+                fields.append(float_field)
+        for obj in objs:
+            obj.set_float_coordinates()
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def upsert(self, objs):
+        """
+        Inserts objs with a single INSERT ... ON CONFLICT DO UPDATE, updating instead the monitoring
+        location with the same site number and agency if any of its fields differ. The insert user
+        and date of updated monitoring locations are kept. objs must have distinct site numbers and
+        agencies.
+        :return: tuple of the numbers of monitoring locations inserted and updated
+        """
+        objs = list(objs)
+        if not objs:
+            return 0, 0
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        meta = self.model._meta
+        fields = [field for field in meta.concrete_fields if not field.primary_key]
+        params = []
+        for obj in objs:
+            obj.set_float_coordinates()
+            params.extend(field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields)
+
+        table = quote_name(meta.db_table)
+        updated = [quote_name(field.column) for field in fields if field.name not in ('insert_user', 'insert_date')]
+        compared = [quote_name(field.column) for field in fields
+                    if field.name not in ('insert_user', 'insert_date', 'update_user', 'update_date')]
+        conflict = [quote_name(meta.get_field(name).column) for name in meta.unique_together[0]]
+        row = f'({", ".join(["%s"] * len(fields))})'
+        sql = f'INSERT INTO {table} ({", ".join(quote_name(field.column) for field in fields)}) ' \
+              f'VALUES {", ".join([row] * len(objs))} ' \
+              f'ON CONFLICT ({", ".join(conflict)}) DO UPDATE ' \
+              f'SET {", ".join(f"{column} = EXCLUDED.{column}" for column in updated)} ' \
+              f'WHERE ({", ".join(f"{table}.{column}" for column in compared)}) ' \
+              f'IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in compared)}) ' \
+              'RETURNING xmax = 0'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            inserted = [returned[0] for returned in cursor.fetchall()]
+        return inserted.count(True), inserted.count(False)
+
+    def update(self, **kwargs):
+        for field, float_field in FLOAT_COORDINATE_FIELDS:
+            if field in kwargs and float_field not in kwargs:
+                value = kwargs[field]
+                if not hasattr(value, 'resolve_expression'):
+                    value = models.Value(value, output_field=models.DecimalField())
+                kwargs[float_field] = Cast(value, output_field=models.FloatField())
+        return super().update(**kwargs)
+
+
 class MonitoringLocation(models.Model):
     """
     Django Registry Model.
@@ -184,6 +298,9 @@ class MonitoringLocation(models.Model):
 
     dec_lat_va = ArbitraryDecimalFields(null=True, verbose_name='Latitude(decimal degrees)')
     dec_long_va = ArbitraryDecimalFields(null=True, verbose_name='Longitude(decimal degrees)')
+    # Indexable double precision copies of dec_lat_va and dec_long_va for spatial queries
+    dec_lat_float = models.FloatField(null=True, editable=False)
+    dec_long_float = models.FloatField(null=True, editable=False)
     horizontal_datum = models.ForeignKey(HorizontalDatumLookup, on_delete=models.PROTECT,
                                          db_column='horizontal_datum_cd', null=True,
                                          to_field='hdatum_cd')
@@ -245,10 +362,19 @@ class MonitoringLocation(models.Model):
                                     related_name='+')
 
     insert_date = models.DateTimeField(auto_now_add=True, editable=False)
-    update_date = models.DateTimeField(auto_now=True, editable=False)
+    update_date = models.DateTimeField(auto_now=True, editable=False, db_index=True)
+
+    objects = MonitoringLocationQuerySet.as_manager()
 
     class Meta:
         unique_together = (('site_no', 'agency'),)
+        indexes = [
+            models.Index(fields=['site_type'], name='ml_site_type_idx'),
+            models.Index(fields=['id'], condition=models.Q(display_flag=True), name='ml_display_flag_idx'),
+            models.Index(fields=['id'], condition=models.Q(wl_sn_flag=True), name='ml_wl_sn_flag_idx'),
+            models.Index(fields=['id'], condition=models.Q(qw_sn_flag=True), name='ml_qw_sn_flag_idx'),
+            models.Index(fields=['dec_lat_float', 'dec_long_float'], name='ml_float_coordinates_idx'),
+        ]
 
     def clean(self):
         """
@@ -282,3 +408,62 @@ class MonitoringLocation(models.Model):
         """Default string."""
         str_rep = f'{self.agency}:{self.site_no}'
         return str_rep
+
+    def set_float_coordinates(self):
+        """
+        Copy the decimal coordinates to their double precision fields
+        """
+        for field, float_field in FLOAT_COORDINATE_FIELDS:
+            setattr(self, float_field, _float_or_none(getattr(self, field)))
+
+    def save(self, *args, **kwargs):  # pylint: disable=signature-differs
+        self.set_float_coordinates()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = list(update_fields) + [
+                float_field for field, float_field in FLOAT_COORDINATE_FIELDS if field in update_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class MonitoringLocationTombstone(models.Model):
+    """
+    Model definition for the monitoring_location_tombstone table. A row is added whenever a
+    monitoring location is deleted so that the change feed can report the deletion.
+    """
+    monitoring_location_id = models.IntegerField()
+    agency_cd = models.CharField(max_length=50, null=True)
+    site_no = models.CharField(max_length=16)
+    delete_date = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = 'monitoring_location_tombstone'
+
+    def __str__(self):
+        return f'{self.agency_cd}:{self.site_no}'
+
+
+class MonitoringLocationStatistics(models.Model):
+    """
+    Model definition for the monitoring_location_statistics materialized view. Each row is the
+    number of monitoring locations with one combination of the summarized attributes, so counts
+    grouped by any of them are read from the view rather than the monitoring location table.
+    """
+    agency_cd = models.CharField(max_length=50, null=True)
+    country_cd = models.CharField(max_length=2, null=True)
+    state_cd = models.CharField(max_length=2, null=True)
+    nat_aqfr_cd = models.CharField(max_length=10, null=True)
+    site_type = models.CharField(max_length=10)
+    display_flag = models.BooleanField()
+    wl_sn_flag = models.BooleanField()
+    wl_baseline_flag = models.BooleanField()
+    qw_sn_flag = models.BooleanField()
+    qw_baseline_flag = models.BooleanField()
+    count = models.IntegerField()
+
+    class Meta:
+        managed = False
+        db_table = 'monitoring_location_statistics'
+
+    def __str__(self):
+        return f'{self.agency_cd}:{self.state_cd}:{self.nat_aqfr_cd}:{self.site_type}:{self.count}'
@@ -0,0 +1,294 @@
+"""
+Pagination classes for the REST API
+"""
+
+from base64 import b64decode, b64encode
+from hashlib import md5
+import binascii
+import json
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, LimitOffsetPagination, replace_query_param
+from rest_framework.settings import api_settings
+
+COUNT_GENERATION_KEY = 'count-generation'
+COUNT_TIMEOUT = 60 * 10
+
+
+def _increment_count_generation():
+    try:
+        cache.incr(COUNT_GENERATION_KEY)
+    except ValueError:
+        cache.set(COUNT_GENERATION_KEY, 1, None)
+
+
+def invalidate_counts():
+    """
+    Invalidates every cached count. Called whenever monitoring locations are written. Counts are
+    invalidated again once the transaction commits, dropping any counted before the write was visible.
+    """
+    _increment_count_generation()
+    transaction.on_commit(_increment_count_generation)
+
+
+def _count_key(queryset):
+    generation = cache.get(COUNT_GENERATION_KEY, 0)
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    signature = md5(repr((sql, params)).encode()).hexdigest()
+    return f'count:{generation}:{signature}'
+
+
+def get_cached_count(queryset):
+    """
+    Returns the number of rows in queryset, counted once per filter signature until counts
+    are invalidated or COUNT_TIMEOUT passes
+    """
+    key = _count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by().values('pk').count()
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+def is_filtered(queryset):
+    """
+    Returns True if queryset has a WHERE clause
+    """
+    return bool(queryset.query.where)
+
+
+def estimate_count(model):
+    """
+    Returns the planner's estimate of the number of rows in the table of model, or None if
+    the table has not been analyzed
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class CachedCountLimitOffsetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination which avoids counting the queryset on every page. Exact counts are
+    cached per filter signature until monitoring locations are written. An unfiltered queryset
+    over a table of at least estimate_threshold rows is counted with the planner's estimate
+    instead. count=false omits the count. The next link is found by fetching one row past the
+    page, so it does not depend on the count.
+    """
+    count_query_param = 'count'
+    estimate_threshold = 100000
+
+    def __init__(self):
+        self.has_next = False
+
+    def include_count(self, request):
+        """
+        Returns False if the request asks for the count to be omitted with count=false
+        """
+        return request.query_params.get(self.count_query_param, '').lower() not in ('false', '0')
+
+    def get_count(self, queryset):
+        if not is_filtered(queryset):
+            estimate = estimate_count(queryset.model)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return get_cached_count(queryset)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.request = request
+        self.count = self.get_count(queryset) if self.include_count(request) else None
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        if self.template is not None and (self.has_next or self.offset > 0):
+            self.display_page_controls = True
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_html_context(self):
+        if self.count is not None:
+            return super().get_html_context()
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+            'page_links': []
+        }
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count']['nullable'] = True
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [{
+            'name': self.count_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Set to false to omit the count.',
+            'schema': {'type': 'boolean'}
+        }]
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator for the admin changelist which uses the cached count of its queryset
+    """
+    @cached_property
+    def count(self):
+        return get_cached_count(self.object_list)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination ordered on the primary key. Each page is a range scan of the primary key
+    index starting after the last id of the previous page, so a page costs the same no matter how
+    deep into the registry it is and no total count is computed.
+    """
+    ordering = 'id'
+    page_size_query_param = 'limit'
+
+
+class MonitoringLocationPagination(BasePagination):
+    """
+    Uses cached count limit/offset pagination unless the request asks for keyset pagination with
+    pagination=cursor. The cursor in the next and previous links is an opaque token which also
+    selects keyset pagination.
+    """
+    mode_query_param = 'pagination'
+    keyset_mode = 'cursor'
+
+    def __init__(self):
+        self.paginator = None
+
+    def use_keyset(self, request):
+        """
+        Return True if the request should be paginated with keyset pagination
+        :param request: rest framework Request
+        :return: boolean
+        """
+        return request.query_params.get(self.mode_query_param) == self.keyset_mode or \
+            KeysetPagination.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = KeysetPagination() if self.use_keyset(request) else CachedCountLimitOffsetPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return CachedCountLimitOffsetPagination().get_paginated_response_schema(schema)
+
+    def get_results(self, data):
+        return self.paginator.get_results(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        """
+        Used by the browsable API to decide whether to render page controls
+        """
+        return getattr(self.paginator, 'display_page_controls', False)
+
+    def get_schema_operation_parameters(self, view):
+        return CachedCountLimitOffsetPagination().get_schema_operation_parameters(view) + \
+            KeysetPagination().get_schema_operation_parameters(view)[:1]
+
+
+class ChangeFeedPagination:
+    """
+    Keyset pagination of the change feed. Each page has up to limit updated monitoring locations,
+    ordered on (update_date, id), and up to limit tombstones, ordered on (delete_date, id). The
+    cursor of the next link is an opaque token holding the updated_since and until timestamps of
+    the first page and the last key read from each list which has more rows, so following the
+    next links reads each change up to until once.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 10000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, request):
+        self.request = request
+        self.limit = self.get_limit()
+        self.cursor = self.decode_cursor()
+        self.next_positions = {}
+
+    def get_limit(self):
+        """
+        Returns the limit query parameter, at most max_limit, or default_limit if it is not a
+        positive integer
+        """
+        try:
+            limit = int(self.request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        return min(limit, self.max_limit) if limit > 0 else self.default_limit
+
+    def decode_cursor(self):
+        """
+        Returns the cursor of the request as a dictionary of the updated_since and until datetimes
+        and the (date, id) position of each list with more rows, or None if there is no cursor
+        """
+        token = self.request.query_params.get(self.cursor_query_param)
+        if token is None:
+            return None
+        try:
+            cursor = json.loads(b64decode(token.encode('ascii')))
+            decoded = {name: parse_datetime(cursor[name]) for name in ('updated_since', 'until')}
+            for name, (date, pk) in cursor['positions'].items():
+                decoded[name] = (parse_datetime(date), int(pk))
+        except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in (decoded['updated_since'], decoded['until']):
+            raise NotFound(self.invalid_cursor_message)
+        return decoded
+
+    def paginate(self, name, queryset, date_field):
+        """
+        Returns the rows of queryset, ordered on date_field and id, in the page of list name
+        """
+        if self.cursor is not None:
+            if name not in self.cursor:
+                return queryset.none()
+            date, pk = self.cursor[name]
+            queryset = queryset.filter(Q(**{f'{date_field}__gt': date}) | Q(**{date_field: date, 'id__gt': pk}))
+        keys = list(queryset.values_list(date_field, 'id')[:self.limit + 1])
+        if len(keys) > self.limit:
+            date, pk = keys[self.limit - 1]
+            self.next_positions[name] = (date.isoformat(), pk)
+            queryset = queryset.filter(Q(**{f'{date_field}__lt': date}) | Q(**{date_field: date, 'id__lte': pk}))
+        return queryset
+
+    def get_next_link(self, updated_since, until):
+        """
+        Returns the link to the next page, or None if every list has been read
+        """
+        if not self.next_positions:
+            return None
+        cursor = {'updated_since': updated_since.isoformat(), 'until': until.isoformat(),
+                  'positions': self.next_positions}
+        token = b64encode(json.dumps(cursor).encode()).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
@@ -0,0 +1,113 @@
+"""
+Renderers for the REST API
+"""
+
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, without it FastJSONRenderer renders like JSONRenderer
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders compact JSON with orjson, which encodes dictionaries, lists, strings, numbers and
+    datetimes natively and falls back to the REST framework encoder for other types, such as
+    Decimal. The output matches JSONRenderer. Indented JSON, such as the browsable API renders,
+    is rendered by JSONRenderer, as is everything if orjson is not installed.
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        content = orjson.dumps(data, default=self.encoder.default,
+                               option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        # Like JSONRenderer, escape the line separators which are not valid in javascript strings
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class StreamingJSONRenderer(FastJSONRenderer):
+    """
+    JSON renderer which can also render an iterable of items incrementally as a JSON array
+    """
+    batch_size = 100
+
+    def render_items(self, items):
+        """
+        Render each item in items, grouping the results in batches of batch_size
+        :param items: iterable of serializable items
+        :return: iterator of lists of byte strings
+        """
+        batch = []
+        for item in items:
+            batch.append(self.render(item))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def render_stream(self, items):
+        """
+        Render items as a JSON array without holding the whole array in memory
+        :param items: iterable of serializable items
+        :return: iterator of byte strings
+        """
+        yield b'['
+        separator = b''
+        for batch in self.render_items(items):
+            yield separator + b','.join(batch)
+            separator = b','
+        yield b']'
+
+
+class NDJSONRenderer(StreamingJSONRenderer):
+    """
+    Renders an iterable of items as newline delimited JSON, one item per line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render_stream(self, items):
+        for batch in self.render_items(items):
+            yield b'\n'.join(batch) + b'\n'
+
+
+class FlatJSONRenderer(FastJSONRenderer):
+    """
+    Renders JSON like FastJSONRenderer. Requesting format=flat selects the flat representation
+    of monitoring locations.
+    """
+    format = 'flat'
+
+
+class RawJSON(str):
+    """
+    A string containing a JSON document which PassthroughJSONRenderer writes untouched
+    """
+
+
+class PassthroughJSONRenderer(FastJSONRenderer):
+    """
+    Renders JSON like FastJSONRenderer except that RawJSON values, at the top level or as values
+    of a top level dictionary, are written as they are. Requesting format=pgjson selects
+    monitoring locations rendered to JSON by the database.
+    """
+    format = 'pgjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, RawJSON):
+            return data.encode()
+        if isinstance(data, dict) and any(isinstance(value, RawJSON) for value in data.values()):
+            members = [
+                json.dumps(key) + ':' + (value if isinstance(value, RawJSON)
+                                         else json.dumps(value, cls=self.encoder_class))
+                for key, value in data.items()
+            ]
+            return ('{' + ','.join(members) + '}').encode()
+        return super().render(data, accepted_media_type, renderer_context)
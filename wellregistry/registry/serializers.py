@@ -3,13 +3,41 @@ Serializers for the REST API
 """
 # pylint: disable=too-few-public-methods
 
-from rest_framework.serializers import ModelSerializer, StringRelatedField, DecimalField
+from decimal import Decimal
 
-from .models import AgencyLookup, CountryLookup, CountyLookup, NatAqfrLookup, MonitoringLocation, StateLookup, \
-    UnitsLookup
+from django.contrib.auth import get_user_model
+from django.db.models import Case, CharField, F, FloatField as DatabaseFloatField, TextField, Value, When
+from django.db.models.functions import Cast
 
+from rest_framework.serializers import BooleanField, CharField as CharSerializerField, DateTimeField, DecimalField, \
+    FloatField, IntegerField, ListField, ModelSerializer, RegexField, Serializer, StringRelatedField
+from rest_framework.settings import api_settings
 
-class AgencyLookupSerializer(ModelSerializer):
+from .db_functions import ISODateTime, JSONBuildObject
+from .models import AgencyLookup, AltitudeDatumLookup, CountryLookup, CountyLookup, HorizontalDatumLookup, \
+    NatAqfrLookup, MonitoringLocation, StateLookup, UnitsLookup
+from .renderers import RawJSON
+
+
+class CachedLookupSerializer(ModelSerializer):
+    """
+    Base serializer for lookups which caches representations by primary key for the life of
+    the serializer. When nested in MonitoringLocationSerializer, a lookup shared by many rows
+    of a response is only serialized once and the same dictionary is reused.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._representations = {}
+
+    def to_representation(self, instance):
+        try:
+            return self._representations[instance.pk]
+        except KeyError:
+            representation = self._representations[instance.pk] = super().to_representation(instance)
+            return representation
+
+
+class AgencyLookupSerializer(CachedLookupSerializer):
     """
     Serializer for AgencyLookup
     """
@@ -18,7 +46,7 @@ class AgencyLookupSerializer(ModelSerializer):
         exclude = ['id']
 
 
-class NatAqfrLookupSerializer(ModelSerializer):
+class NatAqfrLookupSerializer(CachedLookupSerializer):
     """
     Serializer for NatAqfrLookup
     """
@@ -27,7 +55,7 @@ class NatAqfrLookupSerializer(ModelSerializer):
         exclude = ['id']
 
 
-class UnitsLookupSerializer(ModelSerializer):
+class UnitsLookupSerializer(CachedLookupSerializer):
     """
     Serializer for UnitsLookup
     """
@@ -36,7 +64,7 @@ class UnitsLookupSerializer(ModelSerializer):
         fields = ['unit_id', 'unit_desc']
 
 
-class CountryLookupSerializer(ModelSerializer):
+class CountryLookupSerializer(CachedLookupSerializer):
     """
     Serializer for CountryLookup
     """
@@ -45,7 +73,7 @@ class CountryLookupSerializer(ModelSerializer):
         fields = ['country_cd', 'country_nm']
 
 
-class StateLookupSerializer(ModelSerializer):
+class StateLookupSerializer(CachedLookupSerializer):
     """
     Serializer for StateLookup
     """
@@ -54,7 +82,7 @@ class StateLookupSerializer(ModelSerializer):
         fields = ['state_cd', 'state_nm']
 
 
-class CountyLookupSerializer(ModelSerializer):
+class CountyLookupSerializer(CachedLookupSerializer):
     """
     Serializer for CountyLookup
     """
@@ -63,7 +91,73 @@ class CountyLookupSerializer(ModelSerializer):
         fields = ['county_cd', 'county_nm']
 
 
-class MonitoringLocationSerializer(ModelSerializer):
+class StateLookupListSerializer(StateLookupSerializer):
+    """
+    Serializer for the states lookup API, adding the country of each state
+    """
+    country_cd = CharSerializerField(source='country_cd_id', read_only=True)
+
+    class Meta:
+        model = StateLookup
+        fields = ['country_cd', 'state_cd', 'state_nm']
+
+
+class CountyLookupListSerializer(CountyLookupSerializer):
+    """
+    Serializer for the counties lookup API, adding the country and state of each county
+    """
+    country_cd = CharSerializerField(source='country_cd_id', read_only=True)
+    state_cd = CharSerializerField(source='state_id.state_cd', read_only=True)
+
+    class Meta:
+        model = CountyLookup
+        fields = ['country_cd', 'state_cd', 'county_cd', 'county_nm']
+
+
+class HorizontalDatumLookupSerializer(CachedLookupSerializer):
+    """
+    Serializer for HorizontalDatumLookup
+    """
+    class Meta:
+        model = HorizontalDatumLookup
+        exclude = ['id']
+
+
+class AltitudeDatumLookupSerializer(CachedLookupSerializer):
+    """
+    Serializer for AltitudeDatumLookup
+    """
+    class Meta:
+        model = AltitudeDatumLookup
+        exclude = ['id']
+
+
+class DecimalNumberField(DecimalField):
+    """
+    DecimalField(None, None) which represents values as floats rather than Decimals when
+    COERCE_DECIMAL_TO_STRING is False, so that renderers encode them without a fallback
+    """
+    def __init__(self, **kwargs):
+        super().__init__(None, None, **kwargs)
+
+    def to_representation(self, value):
+        representation = super().to_representation(value)
+        return float(representation) if isinstance(representation, Decimal) else representation
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin taking a fields keyword argument, the names of the fields to keep. The
+    other fields are removed from the serializer. All fields are kept if fields is None.
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class MonitoringLocationSerializer(SparseFieldsetMixin, ModelSerializer):
     """
     Serializer for RegistrySerializer
     """
@@ -71,11 +165,11 @@ class MonitoringLocationSerializer(ModelSerializer):
     country = CountryLookupSerializer()
     state = StateLookupSerializer()
     county = CountyLookupSerializer()
-    dec_lat_va = DecimalField(None, None)
-    dec_long_va = DecimalField(None, None)
-    alt_va = DecimalField(None, None)
+    dec_lat_va = DecimalNumberField()
+    dec_long_va = DecimalNumberField()
+    alt_va = DecimalNumberField()
     altitude_units = UnitsLookupSerializer()
-    well_depth = DecimalField(None, None)
+    well_depth = DecimalNumberField()
     well_depth_units = UnitsLookupSerializer()
     nat_aqfr = NatAqfrLookupSerializer()
     insert_user = StringRelatedField()
@@ -83,4 +177,240 @@ class MonitoringLocationSerializer(ModelSerializer):
 
     class Meta:
         model = MonitoringLocation
-        fields = '__all__'
+        exclude = ['dec_lat_float', 'dec_long_float']
+
+    @classmethod
+    def available_fields(cls):
+        """
+        Returns the names of the fields which can be selected with the fields keyword argument
+        """
+        return tuple(cls().fields)
+
+    @classmethod
+    def restrict_queryset(cls, queryset, fields):
+        """
+        Return queryset loading only the columns and joining only the lookups needed to
+        serialize fields
+        :param queryset: MonitoringLocation queryset
+        :param fields: list of the names of the serialized fields
+        :return: MonitoringLocation queryset
+        """
+        related = []
+        columns = []
+        for name, field in cls(fields=fields).fields.items():
+            columns.append(field.source)
+            if isinstance(field, Serializer):
+                related.append(field.source)
+                columns.extend(f'{field.source}__{lookup_field.source}' for lookup_field in field.fields.values())
+            elif isinstance(field, StringRelatedField):
+                related.append(field.source)
+                columns.append(f'{field.source}__{get_user_model().USERNAME_FIELD}')
+        return queryset.select_related(None).select_related(*related).only(*columns)
+
+
+def _decimal_representation(field_name):
+    """
+    Returns an expression which converts a numeric column in the database to the representation
+    of DecimalField(None, None), text or, if COERCE_DECIMAL_TO_STRING is False, a number
+    """
+    if api_settings.COERCE_DECIMAL_TO_STRING:
+        return Cast(field_name, output_field=CharField())
+    return Cast(field_name, output_field=DatabaseFloatField())
+
+
+class FlatMonitoringLocationSerializer:
+    """
+    Serializer for the flat representation of MonitoringLocation. Rather than nesting a serializer
+    per lookup, each row is fetched as a tuple by a single values_list query with a fixed column
+    projection and zipped with the precomputed keys.
+    """
+    columns = (
+        ('id', 'id'),
+        ('display_flag', 'display_flag'),
+        ('agency_cd', 'agency_id'),
+        ('agency_nm', 'agency__agency_nm'),
+        ('site_no', 'site_no'),
+        ('site_name', 'site_name'),
+        ('country_cd', 'country_id'),
+        ('country_nm', 'country__country_nm'),
+        ('state_cd', 'state__state_cd'),
+        ('state_nm', 'state__state_nm'),
+        ('county_cd', 'county__county_cd'),
+        ('county_nm', 'county__county_nm'),
+        ('dec_lat_va', 'dec_lat_va'),
+        ('dec_long_va', 'dec_long_va'),
+        ('horizontal_datum', 'horizontal_datum_id'),
+        ('horz_method', 'horz_method'),
+        ('horz_acy', 'horz_acy'),
+        ('alt_va', 'alt_va'),
+        ('altitude_units', 'altitude_units_id'),
+        ('altitude_units_desc', 'altitude_units__unit_desc'),
+        ('altitude_datum', 'altitude_datum_id'),
+        ('alt_method', 'alt_method'),
+        ('alt_acy', 'alt_acy'),
+        ('well_depth', 'well_depth'),
+        ('well_depth_units', 'well_depth_units_id'),
+        ('well_depth_units_desc', 'well_depth_units__unit_desc'),
+        ('nat_aqfr_cd', 'nat_aqfr_id'),
+        ('nat_aqfr_desc', 'nat_aqfr__nat_aqfr_desc'),
+        ('local_aquifer_name', 'local_aquifer_name'),
+        ('site_type', 'site_type'),
+        ('aqfr_type', 'aqfr_type'),
+        ('wl_sn_flag', 'wl_sn_flag'),
+        ('wl_network_name', 'wl_network_name'),
+        ('wl_baseline_flag', 'wl_baseline_flag'),
+        ('wl_well_type', 'wl_well_type'),
+        ('wl_well_chars', 'wl_well_chars'),
+        ('wl_well_purpose', 'wl_well_purpose'),
+        ('wl_well_purpose_notes', 'wl_well_purpose_notes'),
+        ('qw_sn_flag', 'qw_sn_flag'),
+        ('qw_network_name', 'qw_network_name'),
+        ('qw_baseline_flag', 'qw_baseline_flag'),
+        ('qw_well_type', 'qw_well_type'),
+        ('qw_well_chars', 'qw_well_chars'),
+        ('qw_well_purpose', 'qw_well_purpose'),
+        ('qw_well_purpose_notes', 'qw_well_purpose_notes'),
+        ('link', 'link'),
+        ('insert_user', 'insert_user__username'),
+        ('update_user', 'update_user__username'),
+        ('insert_date', 'insert_date'),
+        ('update_date', 'update_date'),
+    )
+    keys = tuple(key for key, _ in columns)
+    decimal_columns = frozenset(['dec_lat_va', 'dec_long_va', 'alt_va', 'well_depth'])
+
+    def __init__(self, instance=None, many=False, fields=None, **kwargs):
+        # pylint: disable=unused-argument
+        self.instance = instance
+        self.many = many
+        self.fields = self.keys if fields is None else tuple(key for key in self.keys if key in fields)
+
+    @classmethod
+    def available_fields(cls):
+        """
+        Returns the names of the fields which can be selected with the fields keyword argument
+        """
+        return cls.keys
+
+    @classmethod
+    def project(cls, queryset, fields=None, extra=()):
+        """
+        Return queryset restricted to the flat columns, or the columns of fields. Rows are named
+        tuples so that they can be paginated by id, which is fetched last when it is not selected.
+        :param queryset: MonitoringLocation queryset
+        :param fields: optional list of the names of the selected keys
+        :param extra: names of annotations of queryset to fetch after the columns
+        :return: values_list queryset
+        """
+        columns = [_decimal_representation(column) if column in cls.decimal_columns else column
+                   for key, column in cls.columns if fields is None or key in fields]
+        if fields is not None and 'id' not in fields:
+            columns.append('id')
+        return queryset.values_list(*columns, *extra, named=True)
+
+    @property
+    def data(self):
+        """
+        Returns the flat dictionary, or list of dictionaries if many, for instance
+        """
+        # zip stops at the end of the keys, dropping an id column which was not selected
+        keys = self.fields
+        if self.many:
+            return [dict(zip(keys, row)) for row in self.instance]
+        return dict(zip(keys, self.instance))
+
+
+class PgJSONMonitoringLocationSerializer:
+    """
+    Serializer for monitoring locations rendered to JSON by Postgres. Each row is built by
+    json_build_object in the same nested shape as MonitoringLocationSerializer and fetched as
+    text, so rows are never instantiated as models or decoded into Python objects.
+    """
+    def __init__(self, instance=None, many=False, **kwargs):
+        # pylint: disable=unused-argument
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def available_fields(cls):
+        """
+        Returns the names of the fields which can be selected with the fields keyword argument
+        """
+        return MonitoringLocationSerializer.available_fields()
+
+    @staticmethod
+    def _json_expression(name, field):
+        """
+        Return the expression which builds the JSON value of the serializer field, name
+        """
+        if isinstance(field, Serializer):
+            return Case(
+                When(**{f'{name}__isnull': True}, then=Value(None)),
+                default=JSONBuildObject(**{lookup_name: F(f'{name}__{lookup_name}') for lookup_name in field.fields}),
+                output_field=TextField()
+            )
+        if isinstance(field, DecimalField):
+            return _decimal_representation(name)
+        if isinstance(field, DateTimeField):
+            return ISODateTime(name)
+        if isinstance(field, StringRelatedField):
+            # The string representation of the related users is their user name
+            return F(f'{name}__{get_user_model().USERNAME_FIELD}')
+        return F(name)
+
+    @classmethod
+    def project(cls, queryset, fields=None, extra=()):
+        """
+        Return queryset annotated with the JSON document of each monitoring location
+        :param queryset: MonitoringLocation queryset
+        :param fields: optional list of the names of the fields in the documents
+        :param extra: names of annotations of queryset to fetch after the document
+        :return: values_list queryset of named tuples containing id and json_document
+        """
+        document = JSONBuildObject(**{
+            name: cls._json_expression(name, field)
+            for name, field in MonitoringLocationSerializer(fields=fields).fields.items()
+        })
+        return queryset.annotate(json_document=Cast(document, output_field=TextField())) \
+            .values_list('id', 'json_document', *extra, named=True)
+
+    @property
+    def data(self):
+        """
+        Returns the JSON document, or JSON array of documents if many, as RawJSON
+        """
+        if self.many:
+            return RawJSON('[' + ','.join(row.json_document for row in self.instance) + ']')
+        return RawJSON(self.instance.json_document)
+
+
+class NearestQuerySerializer(Serializer):
+    """
+    Validates the query parameters of the nearest monitoring locations API
+    """
+    # pylint: disable=abstract-method
+    lat = FloatField(min_value=-90, max_value=90)
+    lon = FloatField(min_value=-180, max_value=180)
+    k = IntegerField(min_value=1, max_value=100, default=10)
+    agency = CharSerializerField(required=False)
+    display_flag = BooleanField(required=False)
+    wl_sn_flag = BooleanField(required=False)
+    qw_sn_flag = BooleanField(required=False)
+
+
+class BatchLookupSerializer(Serializer):
+    """
+    Validates the body of the batch lookup API, a list of up to max_ids agency_cd:site_no ids
+    """
+    # pylint: disable=abstract-method
+    max_ids = 5000
+    ids = ListField(child=RegexField(r'\A[^:\s]+:\S+\Z',
+                                     error_messages={'invalid': 'Enter an id as agency_cd:site_no.'}),
+                    allow_empty=False, max_length=max_ids)
+
+    def validate_ids(self, value):
+        """
+        Returns the distinct ids in their order of first appearance
+        """
+        # pylint: disable=no-self-use
+        return list(dict.fromkeys(value))
@@ -0,0 +1,150 @@
+"""
+Signal handlers which keep derived registry data in step with monitoring location changes
+"""
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .caching import invalidate_detail, invalidate_details, invalidate_pages
+from .models import AgencyLookup, AltitudeDatumLookup, CountryLookup, CountyLookup, DataVersion, \
+    HorizontalDatumLookup, MonitoringLocation, MonitoringLocationTombstone, NatAqfrLookup, StateLookup, UnitsLookup
+from .pagination import invalidate_counts
+from .snapshots import snapshot_scheduler
+from .statistics import statistics_scheduler
+
+# Sent by code which changes monitoring locations without saving each one, such as bulk_create.
+# site_ids, if given, is the list of the (agency_cd, site_no) of the changed monitoring locations.
+monitoring_locations_changed = Signal()
+
+LOOKUP_MODELS = (AgencyLookup, AltitudeDatumLookup, CountryLookup, CountyLookup, HorizontalDatumLookup,
+                 NatAqfrLookup, StateLookup, UnitsLookup)
+
+
+@receiver(post_delete, sender=MonitoringLocation)
+def add_tombstone(sender, instance, **kwargs):
+    """
+    Records the deletion of a monitoring location for the change feed
+    """
+    # pylint: disable=unused-argument
+    MonitoringLocationTombstone.objects.create(monitoring_location_id=instance.id, agency_cd=instance.agency_id,
+                                               site_no=instance.site_no)
+
+
+@receiver(post_save, sender=MonitoringLocation)
+@receiver(post_delete, sender=MonitoringLocation)
+@receiver(monitoring_locations_changed)
+def request_snapshot(sender, **kwargs):
+    """
+    Requests a new registry snapshot once the change is committed
+    """
+    # pylint: disable=unused-argument
+    snapshot_scheduler.request()
+
+
+@receiver(post_save, sender=MonitoringLocation)
+@receiver(post_delete, sender=MonitoringLocation)
+@receiver(monitoring_locations_changed)
+def request_statistics_refresh(sender, **kwargs):
+    """
+    Requests a refresh of the monitoring location statistics once the change is committed
+    """
+    # pylint: disable=unused-argument
+    statistics_scheduler.request()
+
+
+@receiver(post_save, sender=MonitoringLocation)
+@receiver(post_delete, sender=MonitoringLocation)
+@receiver(monitoring_locations_changed)
+def invalidate_cached_counts(sender, **kwargs):
+    """
+    Invalidates the cached counts of monitoring location querysets
+    """
+    # pylint: disable=unused-argument
+    invalidate_counts()
+
+
+@receiver(post_save, sender=MonitoringLocation)
+@receiver(post_delete, sender=MonitoringLocation)
+@receiver(monitoring_locations_changed)
+def invalidate_cached_pages(sender, **kwargs):
+    """
+    Invalidates the cached pages of the monitoring locations API
+    """
+    # pylint: disable=unused-argument
+    invalidate_pages()
+
+
+@receiver(pre_save, sender=MonitoringLocation)
+def invalidate_previous_detail(sender, instance, raw=False, **kwargs):
+    """
+    Invalidates the cached detail of a monitoring location under its previous agency and site
+    number, when a save changes them
+    """
+    # pylint: disable=unused-argument
+    if raw or instance.pk is None:
+        return
+    previous = MonitoringLocation.objects.filter(pk=instance.pk).values_list('agency_id', 'site_no').first()
+    if previous and previous != (instance.agency_id, instance.site_no):
+        invalidate_detail(*previous)
+
+
+@receiver(post_save, sender=MonitoringLocation)
+@receiver(post_delete, sender=MonitoringLocation)
+def invalidate_cached_detail(sender, instance, **kwargs):
+    """
+    Invalidates the cached detail of a saved or deleted monitoring location
+    """
+    # pylint: disable=unused-argument
+    invalidate_detail(instance.agency_id, instance.site_no)
+
+
+@receiver(monitoring_locations_changed)
+def invalidate_cached_details(sender, site_ids=None, **kwargs):
+    """
+    Invalidates the cached details of the changed monitoring locations, or of every monitoring
+    location if they are not known
+    """
+    # pylint: disable=unused-argument
+    invalidate_details(site_ids)
+
+
+def invalidate_cached_lookups(sender, raw=False, **kwargs):
+    """
+    Changes the lookup version, which revalidates the cached lookup tables, and invalidates the
+    cached details and pages of the monitoring locations, which include lookup names
+    """
+    # pylint: disable=unused-argument
+    if raw:
+        return
+    DataVersion.bump(DataVersion.LOOKUPS)
+    invalidate_details()
+    invalidate_pages()
+
+
+def _connect_lookup_receivers():
+    for lookup_model in LOOKUP_MODELS:
+        post_save.connect(invalidate_cached_lookups, sender=lookup_model)
+        post_delete.connect(invalidate_cached_lookups, sender=lookup_model)
+
+
+def _disconnect_lookup_receivers():
+    for lookup_model in LOOKUP_MODELS:
+        post_save.disconnect(invalidate_cached_lookups, sender=lookup_model)
+        post_delete.disconnect(invalidate_cached_lookups, sender=lookup_model)
+
+
+@contextmanager
+def lookup_invalidation_suspended():
+    """
+    Suspends the invalidation on each lookup save or delete, for code which changes many lookups
+    and then invalidates them once
+    """
+    _disconnect_lookup_receivers()
+    try:
+        yield
+    finally:
+        _connect_lookup_receivers()
+
+
+_connect_lookup_receivers()
@@ -0,0 +1,226 @@
+"""
+Snapshots of the displayed monitoring location registry written to static files
+"""
+
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .background import BackgroundScheduler
+from .models import MonitoringLocation
+from .serializers import FlatMonitoringLocationSerializer, PgJSONMonitoringLocationSerializer
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, without it only gzip variants are written
+    brotli = None
+
+LATEST = 'latest.json'
+SNAPSHOT_NAME = re.compile(r'registry-[0-9a-f]{16}\.(json|csv|geojson)')
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv; charset=utf-8',
+    'geojson': 'application/geo+json',
+}
+# Compressed variants of each snapshot in order of preference, by content coding
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class SnapshotWriter:
+    """
+    Writes the displayed monitoring locations to JSON, CSV and GeoJSON files in root. Each file
+    is named by a hash of its content and is written with gzip and, if brotli is installed, brotli
+    variants. Files are written to a temporary file and renamed so a file is never seen partly
+    written. latest.json, written last, names the files of the newest snapshot. Snapshot files
+    which are no longer named by latest.json are removed once they are retain_seconds old.
+    """
+    chunk_size = 2000
+    retain_seconds = 60 * 60
+
+    def __init__(self, root=None):
+        self.root = root or settings.SNAPSHOT_ROOT
+
+    @staticmethod
+    def get_queryset():
+        """
+        Returns the monitoring locations in a snapshot
+        """
+        return MonitoringLocation.objects.filter(display_flag=True).order_by('id')
+
+    def render_json(self):
+        """
+        Yields the snapshot as a JSON array of the nested representation, built by Postgres
+        """
+        rows = PgJSONMonitoringLocationSerializer.project(self.get_queryset()).iterator(chunk_size=self.chunk_size)
+        separator = '['
+        for row in rows:
+            yield separator + row.json_document
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+    def render_csv(self):
+        """
+        Yields the snapshot as CSV of the flat representation
+        """
+        keys = FlatMonitoringLocationSerializer.keys
+        rows = FlatMonitoringLocationSerializer.project(self.get_queryset()).iterator(chunk_size=self.chunk_size)
+        encoder = JSONEncoder()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(keys)
+        for index, row in enumerate(rows, 1):
+            # Timestamps are formatted as they are in the API
+            writer.writerow([encoder.default(value) if isinstance(value, datetime.datetime) else value
+                             for value in row])
+            if index % self.chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def render_geojson(self):
+        """
+        Yields the snapshot as a GeoJSON feature collection with the flat representation as
+        the properties of each feature
+        """
+        keys = FlatMonitoringLocationSerializer.keys
+        rows = FlatMonitoringLocationSerializer.project(self.get_queryset()).iterator(chunk_size=self.chunk_size)
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        separator = '{"type":"FeatureCollection","features":['
+        for row in rows:
+            properties = dict(zip(keys, row))
+            geometry = None
+            if properties['dec_lat_va'] is not None and properties['dec_long_va'] is not None:
+                geometry = {'type': 'Point',
+                            'coordinates': [float(properties['dec_long_va']), float(properties['dec_lat_va'])]}
+            yield separator + encoder.encode({'type': 'Feature', 'geometry': geometry, 'properties': properties})
+            separator = ','
+        yield (separator if separator != ',' else '') + ']}'
+
+    def _write_atomic(self, path, write):
+        """
+        Calls write with a binary file which is renamed to path once write returns
+        """
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary_file:
+                write(temporary_file)
+            os.chmod(temporary_path, 0o644)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def write_snapshot_file(self, extension, chunks):
+        """
+        Writes chunks to the snapshot file for extension and its compressed variants
+        :param extension: file extension, json, csv or geojson
+        :param chunks: iterable of strings
+        :return: dictionary describing the file
+        """
+        digest = hashlib.sha256()
+        size = 0
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary_file:
+                for chunk in chunks:
+                    data = chunk.encode()
+                    digest.update(data)
+                    size += len(data)
+                    temporary_file.write(data)
+            os.chmod(temporary_path, 0o644)
+            name = f'registry-{digest.hexdigest()[:16]}.{extension}'
+            path = os.path.join(self.root, name)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+
+        if not os.path.exists(path + '.gz'):
+            self._write_atomic(path + '.gz', lambda target: self._gzip(path, target))
+        if brotli is not None and not os.path.exists(path + '.br'):
+            self._write_atomic(path + '.br', lambda target: self._brotli(path, target))
+        return {'name': name, 'size': size, 'sha256': digest.hexdigest()}
+
+    @staticmethod
+    def _gzip(path, target):
+        with open(path, 'rb') as source, gzip.GzipFile(fileobj=target, mode='wb', mtime=0) as compressed:
+            shutil.copyfileobj(source, compressed)
+
+    @staticmethod
+    def _brotli(path, target):
+        compressor = brotli.Compressor()
+        with open(path, 'rb') as source:
+            for block in iter(lambda: source.read(1024 * 1024), b''):
+                target.write(compressor.process(block))
+        target.write(compressor.finish())
+
+    def write(self):
+        """
+        Writes a snapshot of each format and then latest.json naming them
+        :return: dictionary written to latest.json
+        """
+        os.makedirs(self.root, exist_ok=True)
+        outermost = not connection.in_atomic_block
+        with transaction.atomic():
+            if outermost:
+                # The three formats are read from the same snapshot of the database
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            latest = {
+                'created': timezone.now().isoformat(),
+                'files': {
+                    'json': self.write_snapshot_file('json', self.render_json()),
+                    'csv': self.write_snapshot_file('csv', self.render_csv()),
+                    'geojson': self.write_snapshot_file('geojson', self.render_geojson())
+                }
+            }
+        content = json.dumps(latest, indent=2).encode()
+        self._write_atomic(os.path.join(self.root, LATEST), lambda target: target.write(content))
+        self.prune(latest)
+        return latest
+
+    def prune(self, latest):
+        """
+        Removes the snapshot files older than retain_seconds which latest does not name
+        """
+        current = {snapshot['name'] for snapshot in latest['files'].values()}
+        expiry = time.time() - self.retain_seconds
+        for entry in os.scandir(self.root):
+            name = entry.name
+            for _, suffix in ENCODINGS:
+                if name.endswith(suffix):
+                    name = name[:-len(suffix)]
+            if name not in current and (SNAPSHOT_NAME.fullmatch(name) or name.startswith('.tmp-')) \
+                    and entry.stat().st_mtime < expiry:
+                os.unlink(entry.path)
+
+
+class SnapshotScheduler(BackgroundScheduler):
+    """
+    Writes snapshots in the background once changes to monitoring locations are committed,
+    if settings.SNAPSHOT_ON_WRITE is set
+    """
+    setting = 'SNAPSHOT_ON_WRITE'
+    thread_name = 'registry-snapshot'
+
+    def run_job(self):
+        SnapshotWriter().write()
+
+
+snapshot_scheduler = SnapshotScheduler()
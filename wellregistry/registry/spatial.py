@@ -0,0 +1,257 @@
+"""
+In memory spatial index and map tiles of monitoring locations
+"""
+
+from heapq import heappush, heapreplace
+import math
+import threading
+
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, Max, Value
+from django.db.models.functions import Floor
+
+from .db_functions import MercatorY
+from .filters import bounding_box_filter
+from .models import MonitoringLocation, MonitoringLocationTombstone
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_ZOOM = 22
+
+
+def get_registry_version():
+    """
+    Returns a value which changes whenever monitoring locations are added, updated or deleted.
+    Adding or updating a monitoring location moves the latest update_date and deleting one adds
+    a tombstone, so both are read from indexes without counting the registry.
+    """
+    last_update = MonitoringLocation.objects.aggregate(last_update=Max('update_date'))['last_update']
+    last_delete = MonitoringLocationTombstone.objects.aggregate(last_delete=Max('delete_date'))['last_delete']
+    return last_update, last_delete
+
+
+def unit_vector(latitude, longitude):
+    """
+    Returns the point on the unit sphere at latitude and longitude in degrees. The straight line
+    distance between two such points increases with their great circle distance, so the nearest
+    points on the sphere are the nearest points in three dimensions.
+    """
+    latitude = math.radians(latitude)
+    longitude = math.radians(longitude)
+    return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude),
+            math.sin(latitude))
+
+
+def chord_to_km(chord):
+    """
+    Returns the great circle distance in kilometres between two points on the unit sphere which
+    are chord apart
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """
+    KD-tree of points in three dimensions. Nodes are tuples of the index of the point in points,
+    the splitting axis and the left and right subtrees.
+    """
+    def __init__(self, points):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indexes, depth):
+        if not indexes:
+            return None
+        axis = depth % 3
+        indexes.sort(key=lambda index: self.points[index][axis])
+        median = len(indexes) // 2
+        return (indexes[median], axis, self._build(indexes[:median], depth + 1),
+                self._build(indexes[median + 1:], depth + 1))
+
+    def nearest(self, point, k, predicate=None):
+        """
+        Returns the k points nearest to point, as a list of (distance, index) tuples in order of
+        distance. If predicate is given, only the points whose index it accepts are returned.
+        """
+        heap = []
+        points = self.points
+
+        def search(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            node_point = points[index]
+            squared_distance = (point[0] - node_point[0]) ** 2 + (point[1] - node_point[1]) ** 2 + \
+                (point[2] - node_point[2]) ** 2
+            if predicate is None or predicate(index):
+                if len(heap) < k:
+                    heappush(heap, (-squared_distance, index))
+                elif squared_distance < -heap[0][0]:
+                    heapreplace(heap, (-squared_distance, index))
+
+            difference = point[axis] - node_point[axis]
+            near, far = (left, right) if difference < 0 else (right, left)
+            search(near)
+            if len(heap) < k or difference ** 2 < -heap[0][0]:
+                search(far)
+
+        if k > 0:
+            search(self.root)
+        return sorted((math.sqrt(-negative_distance), index) for negative_distance, index in heap)
+
+
+class MonitoringLocationIndex:
+    """
+    KD-tree of the monitoring locations which have coordinates, with the attributes the nearest
+    search can filter on. The index of a process is rebuilt when the latest update_date or the
+    latest deletion changes.
+    """
+    attributes = ('agency_id', 'display_flag', 'wl_sn_flag', 'qw_sn_flag')
+    _current = None
+    _lock = threading.Lock()
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.ids = [row[0] for row in rows]
+        self.rows = [dict(zip(self.attributes, row[1:-2])) for row in rows]
+        self.tree = KDTree([unit_vector(latitude, longitude) for *_, latitude, longitude in rows])
+
+    @classmethod
+    def build(cls, version):
+        """
+        Returns the index of the monitoring locations with coordinates
+        """
+        rows = MonitoringLocation.objects \
+            .filter(dec_lat_float__isnull=False, dec_long_float__isnull=False) \
+            .order_by('id') \
+            .values_list('id', *cls.attributes, 'dec_lat_float', 'dec_long_float')
+        return cls(version, list(rows))
+
+    @classmethod
+    def get(cls):
+        """
+        Returns the current index, rebuilding it first if the monitoring locations have changed
+        """
+        version = get_registry_version()
+        current = cls._current
+        if current is None or current.version != version:
+            with cls._lock:
+                current = cls._current
+                if current is None or current.version != version:
+                    current = cls._current = cls.build(version)
+        return current
+
+    def nearest(self, latitude, longitude, k, **filters):
+        """
+        Returns the ids of the k monitoring locations nearest to latitude and longitude, as a
+        list of (distance in kilometres, id) tuples in order of distance. filters are attribute
+        values which the monitoring locations must match. A list value matches any of its values.
+        """
+        rows = self.rows
+
+        def matches(index):
+            row = rows[index]
+            for name, value in filters.items():
+                if isinstance(value, list):
+                    if row[name] not in value:
+                        return False
+                elif row[name] != value:
+                    return False
+            return True
+
+        neighbours = self.tree.nearest(unit_vector(latitude, longitude), k, matches if filters else None)
+        return [(chord_to_km(chord), self.ids[index]) for chord, index in neighbours]
+
+
+def _mercator_y(latitude):
+    return math.log(math.tan(math.radians(45 + latitude / 2)))
+
+
+def tile_bounds(z, x, y):
+    """
+    Returns the west, south, east and north bounds in degrees of the Web Mercator tile z/x/y
+    """
+    tiles = 2 ** z
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / tiles))))
+
+    return x / tiles * 360 - 180, latitude(y + 1), (x + 1) / tiles * 360 - 180, latitude(y)
+
+
+def _feature(longitude, latitude, properties):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]},
+        'properties': properties
+    }
+
+
+class MonitoringLocationTile:
+    """
+    GeoJSON feature collection of the displayed monitoring locations in the Web Mercator tile
+    z/x/y. Up to cluster_max_zoom the tile is divided into a grid of grid_size by grid_size cells
+    and each cell containing monitoring locations is a cluster feature with the centroid and
+    count of its locations, so the size of a tile does not depend on the size of the registry.
+    At higher zoom levels each monitoring location is a feature.
+    """
+    cluster_max_zoom = 8
+    grid_size = 16
+    well_columns = ('id', 'agency_id', 'site_no', 'site_name', 'wl_sn_flag', 'qw_sn_flag')
+    well_properties = ('id', 'agency_cd', 'site_no', 'site_name', 'wl_sn_flag', 'qw_sn_flag')
+
+    def __init__(self, z, x, y):
+        self.z = z
+        self.x = x
+        self.y = y
+        self.west, self.south, self.east, self.north = tile_bounds(z, x, y)
+
+    @staticmethod
+    def is_valid(z, x, y):
+        """
+        Returns True if z/x/y is a tile of the supported zoom levels
+        """
+        return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+    def get_queryset(self):
+        """
+        Returns the displayed monitoring locations in the tile. Locations on the east or south
+        edge of the tile may also be in the neighbouring tile.
+        """
+        return MonitoringLocation.objects \
+            .filter(display_flag=True) \
+            .filter(bounding_box_filter(self.west, self.south, self.east, self.north))
+
+    def clusters(self):
+        """
+        Returns the cluster features of the tile
+        """
+        north_y = _mercator_y(self.north)
+        cell_width = (self.east - self.west) / self.grid_size
+        cell_height = (north_y - _mercator_y(self.south)) / self.grid_size
+        cells = self.get_queryset() \
+            .annotate(
+                cell_x=Floor(ExpressionWrapper((F('dec_long_float') - Value(self.west)) / Value(cell_width),
+                                               output_field=FloatField())),
+                cell_y=Floor(ExpressionWrapper((Value(north_y) - MercatorY('dec_lat_float')) / Value(cell_height),
+                                               output_field=FloatField()))) \
+            .order_by() \
+            .values('cell_x', 'cell_y') \
+            .annotate(count=Count('id'), latitude=Avg('dec_lat_float'), longitude=Avg('dec_long_float')) \
+            .order_by('cell_y', 'cell_x')
+        return [_feature(cell['longitude'], cell['latitude'], {'cluster': True, 'count': cell['count']})
+                for cell in cells]
+
+    def wells(self):
+        """
+        Returns the monitoring location features of the tile
+        """
+        rows = self.get_queryset().order_by('id') \
+            .values_list(*self.well_columns, 'dec_lat_float', 'dec_long_float')
+        return [_feature(longitude, latitude, dict(zip(self.well_properties, row)))
+                for *row, latitude, longitude in rows]
+
+    def to_geojson(self):
+        """
+        Returns the tile as a GeoJSON feature collection
+        """
+        features = self.clusters() if self.z <= self.cluster_max_zoom else self.wells()
+        return {'type': 'FeatureCollection', 'features': features}
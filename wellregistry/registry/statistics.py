@@ -0,0 +1,60 @@
+"""
+Counts of monitoring locations grouped by their attributes, read from the
+monitoring_location_statistics materialized view
+"""
+
+from django.db import connection
+from django.db.models import Sum
+
+from .background import BackgroundScheduler
+from .models import DataVersion, MonitoringLocationStatistics
+
+# Each group of the statistics and the view columns it is grouped by
+GROUPS = (
+    ('agency', ('agency_cd',)),
+    ('state', ('country_cd', 'state_cd')),
+    ('nat_aqfr', ('nat_aqfr_cd',)),
+    ('site_type', ('site_type',)),
+    ('display_flag', ('display_flag',)),
+    ('wl_sn_flag', ('wl_sn_flag',)),
+    ('wl_baseline_flag', ('wl_baseline_flag',)),
+    ('qw_sn_flag', ('qw_sn_flag',)),
+    ('qw_baseline_flag', ('qw_baseline_flag',)),
+)
+
+
+def refresh_statistics():
+    """
+    Refreshes the materialized view without blocking readers and bumps the statistics version
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {MonitoringLocationStatistics._meta.db_table}')
+    DataVersion.bump(DataVersion.STATISTICS)
+
+
+def get_statistics(**filters):
+    """
+    Returns the total number of monitoring locations and their counts in each of GROUPS
+    :param filters: optional filters on the view columns, such as display_flag
+    :return: dictionary
+    """
+    queryset = MonitoringLocationStatistics.objects.filter(**filters).order_by()
+    statistics = {'total': queryset.aggregate(total=Sum('count'))['total'] or 0}
+    for name, columns in GROUPS:
+        statistics[name] = list(queryset.values(*columns).annotate(count=Sum('count')).order_by(*columns))
+    return statistics
+
+
+class StatisticsScheduler(BackgroundScheduler):
+    """
+    Refreshes the statistics in the background once changes to monitoring locations are
+    committed, if settings.STATISTICS_REFRESH_ON_WRITE is set
+    """
+    setting = 'STATISTICS_REFRESH_ON_WRITE'
+    thread_name = 'registry-statistics'
+
+    def run_job(self):
+        refresh_statistics()
+
+
+statistics_scheduler = StatisticsScheduler()
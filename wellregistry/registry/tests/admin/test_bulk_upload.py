@@ -2,12 +2,43 @@
 Tests for the registry admin custom bulk upload view
 """
 
+from collections import Counter
+import csv
+import gzip
+import io
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.http import HttpRequest
+from django.http import HttpRequest, QueryDict
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+
+from ...admin.bulk_upload import BulkUploadLookups, BulkUploadView, _get_monitoring_location
+from ...models import MonitoringLocation
+
+VALID_ROW = ['ADWR', 'Kb32-13', 'Dummy record', '39.035721', '-75.72704', 'NAD27', 'Survey', '0.1 m', '58.54', 'ft',
+             'NAVD88', 'Survey', '0.01m', 'N100GLCIAL', 'Federalsburg', '1234', 'United States of America',
+             'Michigan', 'St. Francis County', '192', 'ft', 'WELL', 'CONFINED', 'No', 'Yes', 'Yes', 'Background',
+             'Surveillance', 'Dedicated Monitoring/Observation', 'Just cuz', 'Michigan Groundwater Network', 'Yes',
+             'Yes', 'Background', 'Surveillance', 'Dedicated Monitoring/Observation', '',
+             'Michigan Groundwater Network', 'http://www.dgs.udel.edu/data']
 
-from ...admin.bulk_upload import BulkUploadView
+
+def _csv_file(*site_nos, invalid=()):
+    """
+    Returns the content of a bulk upload file with a row of VALID_ROW for each of site_nos. The
+    rows of the site numbers in invalid are missing their county.
+    """
+    content = io.StringIO()
+    writer = csv.writer(content)
+    writer.writerow(['HEADER LINE'])
+    for site_no in site_nos:
+        writer.writerow([VALID_ROW[0], site_no, *VALID_ROW[2:18], '' if site_no in invalid else VALID_ROW[18],
+                         *VALID_ROW[19:]])
+    return content.getvalue().encode()
 
 
 class TestBulkUploadView(TestCase):
@@ -91,6 +122,228 @@ Michigan Groundwater Network,http://www.dgs.udel.edu/data'
         self.assertEqual(resp.status_code, 200)
         self.assertIn('class="errorlist"', resp.content.decode())
 
+    def test_post_gzipped_file(self):
+        file = SimpleUploadedFile('test.csv.gz', gzip.compress(_csv_file('site1', 'site2')),
+                                  content_type='application/gzip')
+        self.view.request.FILES['file'] = file
+        resp = self.view.post(self.view.request)
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(MonitoringLocation.objects.filter(agency='ADWR').count(), 2)
+
+    def test_post_invalid_encoding(self):
+        file = SimpleUploadedFile('test.csv', b'HEADER LINE\n\xff\xfe,', content_type='text/csv')
+        self.view.request.FILES['file'] = file
+        resp = self.view.post(self.view.request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('The file could not be read', resp.content.decode())
+
+    def test_post_commit_all_rolls_back_chunks(self):
+        self.view.chunk_size = 2
+        file = SimpleUploadedFile('test.csv', _csv_file('site1', 'site2', 'site3', 'site4', 'site5', invalid=['site3']),
+                                  content_type='text/csv')
+        self.view.request.FILES['file'] = file
+        resp = self.view.post(self.view.request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('In row 4', resp.content.decode())
+        self.assertFalse(MonitoringLocation.objects.exists())
+
+    def test_post_commit_chunks(self):
+        self.view.chunk_size = 2
+        self.view.request.POST = QueryDict('commit=chunks')
+        file = SimpleUploadedFile('test.csv', _csv_file('site1', 'site2', 'site3', 'site4', 'site5', invalid=['site3']),
+                                  content_type='text/csv')
+        self.view.request.FILES['file'] = file
+        resp = self.view.post(self.view.request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('In row 4', resp.content.decode())
+        self.assertIn('3 monitoring locations inserted, 0 updated and 0 unchanged', resp.content.decode())
+        self.assertEqual(sorted(MonitoringLocation.objects.values_list('site_no', flat=True)),
+                         ['site1', 'site2', 'site5'])
+
+    def test_post_truncated_gzip_commit_chunks(self):
+        self.view.chunk_size = 100
+        self.view.request.POST = QueryDict('commit=chunks')
+        content = gzip.compress(_csv_file(*[f'site{index}' for index in range(600)]))
+        file = SimpleUploadedFile('test.csv.gz', content[:len(content) // 2], content_type='application/gzip')
+        self.view.request.FILES['file'] = file
+        resp = self.view.post(self.view.request)
+
+        loaded = MonitoringLocation.objects.count()
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(loaded, 0)
+        self.assertLess(loaded, 600)
+        self.assertEqual(loaded % 100, 0)
+        self.assertIn(f'{loaded} rows loaded before the file error at row', resp.content.decode())
+        self.assertIn(f'{loaded} monitoring locations inserted', resp.content.decode())
+
+    def test_post_too_many_errors(self):
+        self.view.chunk_size = 2
+        self.view.max_errors = 2
+        file = SimpleUploadedFile('test.csv', _csv_file('site1', 'site2', 'site3', 'site4', 'site5',
+                                                        invalid=['site1', 'site2', 'site3']),
+                                  content_type='text/csv')
+        self.view.request.FILES['file'] = file
+        resp = self.view.post(self.view.request)
+
+        self.assertIn('Too many errors', resp.content.decode())
+        self.assertNotIn('In row 4', resp.content.decode())
+
+    def test_load_too_many_warnings(self):
+        self.view.chunk_size = 2
+        self.view.max_warnings = 2
+        rows = [[*VALID_ROW[:1], f'site{index}', *VALID_ROW[2:19], 'unknown', *VALID_ROW[20:]] for index in range(5)]
+        counts, error_messages, warning_messages = self.view.load(enumerate(rows, 2), self.user, 'all')
+
+        self.assertEqual(counts['inserted'], 5)
+        self.assertEqual(error_messages, [])
+        self.assertEqual(warning_messages, [
+            (2, {'well_depth': "Invalid Value 'unknown'"}),
+            (3, {'well_depth': "Invalid Value 'unknown'"}),
+            (4, {'warning': 'Too many warnings, the warnings from this row on are not shown'})])
+
+    def test_post_duplicates(self):
+        MonitoringLocation.objects.create(agency_id='ADWR', site_no='site2', site_name='Existing')
+        file = SimpleUploadedFile('test.csv', _csv_file('site1', 'site2', 'site3', 'site1'), content_type='text/csv')
+        self.view.request.FILES['file'] = file
+        resp = self.view.post(self.view.request)
+
+        content = resp.content.decode()
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('In row 3', content)
+        self.assertIn('Monitoring location with this Site no and Agency already exists.', content)
+        self.assertIn('In row 5', content)
+        self.assertIn('Row 2 has the same agency and site number', content)
+        self.assertNotIn('In row 2', content)
+        self.assertNotIn('In row 4', content)
+        self.assertEqual(MonitoringLocation.objects.count(), 1)
+
+    def test_load_constant_queries(self):
+        query_counts = []
+        for count in (1, 20):
+            reader = csv.reader(io.StringIO(_csv_file(*[f'{count}-{index}' for index in range(count)]).decode()))
+            next(reader)
+            with CaptureQueriesContext(connection) as queries:
+                counts, errors, _ = self.view.load(enumerate(reader, 2), self.user, 'all')
+            self.assertEqual((counts['inserted'], errors), (count, []))
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_load_upsert(self):
+        def rows(*site_names):
+            return enumerate([[VALID_ROW[0], f'site{index}', site_name, *VALID_ROW[3:]]
+                              for index, site_name in enumerate(site_names)], 2)
+
+        self.view.load(rows('First', 'Second'), self.user, 'all')
+        inserted = MonitoringLocation.objects.get(site_no='site1')
+        uploader = get_user_model().objects.create(username='uploader')
+
+        counts, errors, _ = self.view.load(rows('First', 'Renamed', 'Third'), uploader, 'all', 'upsert')
+
+        self.assertEqual(errors, [])
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 1, 'changed_fields': Counter()})
+        updated = MonitoringLocation.objects.get(site_no='site1')
+        self.assertEqual((updated.site_name, updated.insert_user, updated.update_user),
+                         ('Renamed', self.user, uploader))
+        self.assertEqual(updated.insert_date, inserted.insert_date)
+        self.assertEqual(MonitoringLocation.objects.get(site_no='site0').update_user, self.user)
+
+    def test_load_diff(self):
+        def rows(*site_names):
+            return enumerate([[VALID_ROW[0], f'site{index}', site_name, *VALID_ROW[3:8], '58.540', *VALID_ROW[9:]]
+                              for index, site_name in enumerate(site_names)], 2)
+
+        self.view.load(rows('First', 'Second'), self.user, 'all')
+        unchanged = MonitoringLocation.objects.get(site_no='site0')
+        inserted = MonitoringLocation.objects.get(site_no='site1')
+        uploader = get_user_model().objects.create(username='uploader')
+
+        with mock.patch('registry.signals.invalidate_details') as mock_invalidate_details:
+            with CaptureQueriesContext(connection) as queries:
+                counts, errors, _ = self.view.load(rows('First', 'Renamed', 'Third'), uploader, 'all', 'diff')
+
+        self.assertEqual(errors, [])
+        self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 1,
+                                  'changed_fields': Counter({'site_name': 1})})
+        mock_invalidate_details.assert_called_once_with([(VALID_ROW[0], 'site2'), (VALID_ROW[0], 'site1')])
+        update = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(update), 1)
+        self.assertNotIn('"alt_va"', update[0])
+        self.assertEqual(MonitoringLocation.objects.get(site_no='site0').update_date, unchanged.update_date)
+        updated = MonitoringLocation.objects.get(site_no='site1')
+        self.assertEqual((updated.site_name, updated.insert_user, updated.update_user),
+                         ('Renamed', self.user, uploader))
+        self.assertGreater(updated.update_date, inserted.update_date)
+
+    def test_post_diff_reports_changed_fields(self):
+        self.view.load(enumerate([VALID_ROW], 2), self.user, 'all')
+        self.view.request.POST = QueryDict('mode=diff')
+        file = SimpleUploadedFile('test.csv', _csv_file(VALID_ROW[1]).replace(b'Dummy record', b'Renamed'),
+                                  content_type='text/csv')
+        self.view.request.FILES['file'] = file
+        with mock.patch('registry.admin.bulk_upload.messages') as mock_messages:
+            resp = self.view.post(self.view.request)
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(mock_messages.success.call_args[0][1],
+                         '0 monitoring locations inserted, 1 updated and 0 unchanged. Changed fields: site_name (1)')
+
+    def test_post_invalid_choices(self):
+        self.view.request.POST = QueryDict('mode=foo&commit=bar')
+        self.view.request.FILES['file'] = SimpleUploadedFile('test.csv', _csv_file('site1'), content_type='text/csv')
+        resp = self.view.post(self.view.request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content.decode().count('Select a valid choice'), 2)
+        self.assertFalse(MonitoringLocation.objects.exists())
+
+    def test_post_upsert_duplicate_in_file(self):
+        self.view.request.POST = QueryDict('mode=upsert')
+        file = SimpleUploadedFile('test.csv', _csv_file('site1', 'site1'), content_type='text/csv')
+        self.view.request.FILES['file'] = file
+        resp = self.view.post(self.view.request)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('Row 2 has the same agency and site number', resp.content.decode())
+        self.assertFalse(MonitoringLocation.objects.exists())
+
+
+class TestGetMonitoringLocation(TestCase):
+    fixtures = ['test_agencies', 'test_countries.json', 'test_states.json', 'test_counties.json',
+                'test_horizontal_datum.json', 'test_altitude_datum.json', 'test_nat_aquifer.json',
+                'test_units.json']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='testuser')
+
+    def test_row_conversion_does_not_query(self):
+        # One query per lookup table
+        with self.assertNumQueries(8):
+            lookups = BulkUploadLookups()
+        with self.assertNumQueries(0):
+            monitoring_locations = [
+                _get_monitoring_location(index, [VALID_ROW[0], f'site{index}', *VALID_ROW[2:]], self.user, lookups, [])
+                for index in range(25)
+            ]
+
+        self.assertEqual(len(monitoring_locations), 25)
+        self.assertEqual(monitoring_locations[0].agency.agency_cd, 'ADWR')
+        self.assertEqual(monitoring_locations[0].state.state_cd, '26')
+        self.assertEqual(monitoring_locations[0].county.county_nm, 'St. Francis County')
+        self.assertEqual(monitoring_locations[0].altitude_units.unit_desc, 'ft')
+
+    def test_unknown_lookups(self):
+        row = [*VALID_ROW[:17], 'Delaware', *VALID_ROW[18:20], '', *VALID_ROW[21:]]
+        with self.assertRaises(ValidationError) as context:
+            _get_monitoring_location(2, row, self.user, BulkUploadLookups(), [])
+
+        self.assertEqual(list(context.exception.message_dict), ['state', 'county', 'well_depth_units'])
+        self.assertEqual(context.exception.message_dict['county'], ['This field cannot be blank.'])
+
 
 class TestBulkUploadTemplateView(TestCase):
 
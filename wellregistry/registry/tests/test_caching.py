@@ -0,0 +1,150 @@
+"""
+Tests for the caching module
+"""
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..caching import SingleFlightCache, detail_key, invalidate_details
+
+
+class TestSingleFlightCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.single_flight = SingleFlightCache('test-generation', 'test-invalidated', 60, 30)
+        self.single_flight.wait_timeout = 0.2
+        self.single_flight.wait_interval = 0.01
+        self.compute = mock.Mock(side_effect=['first', 'second', 'third'])
+
+    def invalidate(self, at):
+        cache.set('test-generation', cache.get('test-generation', 0) + 1)
+        cache.set('test-invalidated', at)
+
+    def test_cached(self):
+        self.assertEqual(self.single_flight.get_or_compute('key', self.compute), 'first')
+        self.assertEqual(self.single_flight.get_or_compute('key', self.compute), 'first')
+        self.assertEqual(self.compute.call_count, 1)
+        self.assertIsNone(cache.get('key:lock'))
+
+    @mock.patch('registry.caching.time.time')
+    def test_invalidated(self, mock_time):
+        mock_time.return_value = 1000
+        self.single_flight.get_or_compute('key', self.compute)
+        self.invalidate(1001)
+
+        self.assertEqual(self.single_flight.get_or_compute('key', self.compute), 'second')
+
+    @mock.patch('registry.caching.time.time')
+    def test_expired(self, mock_time):
+        mock_time.return_value = 1000
+        self.single_flight.get_or_compute('key', self.compute)
+        mock_time.return_value = 1061
+
+        self.assertEqual(self.single_flight.get_or_compute('key', self.compute), 'second')
+
+    @mock.patch('registry.caching.time.time')
+    def test_stale_served_while_locked(self, mock_time):
+        mock_time.return_value = 1000
+        self.single_flight.get_or_compute('key', self.compute)
+        self.invalidate(1001)
+        cache.add('key:lock', 'other')
+        mock_time.return_value = 1030
+
+        self.assertEqual(self.single_flight.get_or_compute('key', self.compute), 'first')
+        self.assertEqual(self.compute.call_count, 1)
+
+    @mock.patch('registry.caching.time.sleep')
+    @mock.patch('registry.caching.time.time')
+    def test_stale_window_bounded(self, mock_time, mock_sleep):
+        mock_time.return_value = 1000
+        self.single_flight.get_or_compute('key', self.compute)
+        self.invalidate(1001)
+        cache.add('key:lock', 'other')
+        mock_time.return_value = 1040
+
+        def advance(seconds):
+            mock_time.return_value += seconds
+        mock_sleep.side_effect = advance
+
+        # The lock is still held after waiting, so the value is computed without it
+        self.assertEqual(self.single_flight.get_or_compute('key', self.compute), 'second')
+        self.assertTrue(mock_sleep.called)
+        self.assertEqual(cache.get('key:lock'), 'other')
+
+    def test_wait_for_computing_process(self):
+        cache.add('key:lock', 'other')
+
+        def compute_elsewhere(_):
+            cache.set('key', {'generation': 0, 'expires': float('inf'), 'value': 'elsewhere'})
+
+        with mock.patch('registry.caching.time.sleep', side_effect=compute_elsewhere):
+            self.assertEqual(self.single_flight.get_or_compute('key', self.compute), 'elsewhere')
+        self.compute.assert_not_called()
+
+    def test_lock_released_on_error(self):
+        with self.assertRaises(ValueError):
+            self.single_flight.get_or_compute('key', mock.Mock(side_effect=ValueError))
+
+        self.assertIsNone(cache.get('key:lock'))
+        self.assertEqual(self.single_flight.get_or_compute('key', self.compute), 'first')
+
+
+class TestInvalidateDetails(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache.set(detail_key('USGS', '1', 'json'), 'one')
+        cache.set(detail_key('USGS', '2', 'json'), 'two')
+
+    def test_site_ids(self):
+        invalidate_details([('USGS', '1')])
+
+        self.assertIsNone(cache.get(detail_key('USGS', '1', 'json')))
+        self.assertEqual(cache.get(detail_key('USGS', '2', 'json')), 'two')
+
+    def test_all(self):
+        invalidate_details()
+
+        self.assertIsNone(cache.get(detail_key('USGS', '2', 'json')))
+
+    @mock.patch('registry.caching.DETAIL_INVALIDATION_LIMIT', 1)
+    def test_too_many_site_ids(self):
+        invalidate_details([('USGS', '1'), ('USGS', '3')])
+
+        self.assertIsNone(cache.get(detail_key('USGS', '2', 'json')))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                       'LOCATION': 'test_registry_cache'}})
+class TestDatabaseCache(TestCase):
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+
+    def test_single_flight(self):
+        single_flight = SingleFlightCache('test-generation', 'test-invalidated', 60, 30)
+        compute = mock.Mock(side_effect=['first', 'second'])
+
+        self.assertEqual(single_flight.get_or_compute('key', compute), 'first')
+        self.assertEqual(single_flight.get_or_compute('key', compute), 'first')
+        self.assertIsNone(cache.get('key:lock'))
+
+    def test_stale_served_while_locked_by_another_process(self):
+        single_flight = SingleFlightCache('test-generation', 'test-invalidated', 60, 30)
+        single_flight.get_or_compute('key', lambda: 'first')
+        cache.set_many({'test-generation': 1, 'test-invalidated': time.time()})
+        self.assertTrue(cache.add('key:lock', 'another process', 60))
+        compute = mock.Mock()
+
+        self.assertEqual(single_flight.get_or_compute('key', compute), 'first')
+        compute.assert_not_called()
+
+    def test_invalidate_details(self):
+        cache.set(detail_key('USGS', '1', 'json'), 'one')
+        invalidate_details([('USGS', '1')])
+
+        self.assertIsNone(cache.get(detail_key('USGS', '1', 'json')))
@@ -0,0 +1,52 @@
+"""
+Tests for benchmark_api and benchmark_renderers management commands
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ..models import MonitoringLocation
+
+
+class TestBenchmarkApi(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json']
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_api', rows=[5], stdout=out)
+        lines = out.getvalue().splitlines()
+
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[1].split()[:2], ['5', 'nested'])
+        self.assertEqual(lines[2].split()[:2], ['5', 'flat'])
+        self.assertEqual(lines[3].split()[:2], ['5', 'pgjson'])
+        self.assertEqual(MonitoringLocation.objects.count(), 0)
+
+
+class TestBenchmarkApiWithoutLookups(TestCase):
+
+    def test_benchmark_without_lookups(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_api', rows=[5], stdout=StringIO())
+
+
+class TestBenchmarkRenderers(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json']
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_renderers', page_size=5, repeat=1, stdout=out)
+        lines = out.getvalue().splitlines()
+
+        self.assertEqual([line.split()[:3] for line in lines[1:]],
+                         [['5', 'string', 'JSONRenderer'], ['5', 'string', 'FastJSONRenderer'],
+                          ['5', 'number', 'JSONRenderer'], ['5', 'number', 'FastJSONRenderer']])
+        # Both renderers produce the same content
+        self.assertEqual(lines[1].split()[-1], lines[2].split()[-1])
+        self.assertEqual(MonitoringLocation.objects.count(), 0)
@@ -0,0 +1,23 @@
+"""
+Tests for refresh_statistics management command
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import MonitoringLocationStatistics
+
+
+class TestRefreshStatistics(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def test_refresh_statistics(self):
+        out = StringIO()
+        call_command('refresh_statistics', stdout=out)
+
+        self.assertIn('Successfully refreshed', out.getvalue())
+        self.assertEqual(sum(MonitoringLocationStatistics.objects.values_list('count', flat=True)), 3)
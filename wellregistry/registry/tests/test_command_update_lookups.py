@@ -6,8 +6,8 @@ from unittest.mock import patch, MagicMock
 from django.test import TestCase
 
 from ..management.commands.update_lookups import Command
-from ..models import AgencyLookup, AltitudeDatumLookup, CountryLookup, CountyLookup, HorizontalDatumLookup, \
-    NatAqfrLookup, StateLookup, UnitsLookup
+from ..models import AgencyLookup, AltitudeDatumLookup, CountryLookup, CountyLookup, DataVersion, \
+    HorizontalDatumLookup, NatAqfrLookup, StateLookup, UnitsLookup
 
 TEST_AGENCY_CSV = ['"AGENCY_CD","AGENCY_NM","AGENCY_MED"',
                    'MPCA,Minnesota Pollution Control Agency,MN Pollution Control Agency',
@@ -81,6 +81,7 @@ class TestUpdateLookups(TestCase):
         self.assertEqual(UnitsLookup.objects.count(), 2)
         self.assertEqual(StateLookup.objects.count(), 2)
         self.assertEqual(CountyLookup.objects.count(), 3)
+        self.assertEqual(DataVersion.get_version(DataVersion.LOOKUPS).version, 1)
 
     @patch('builtins.open', spec=open)
     def test_updating_lookups(self, mock_open):
@@ -128,3 +129,4 @@ class TestUpdateLookups(TestCase):
         self.assertEqual(UnitsLookup.objects.count(), 2)
         self.assertEqual(StateLookup.objects.count(), 3)
         self.assertEqual(CountyLookup.objects.count(), 4)
+        self.assertEqual(DataVersion.get_version(DataVersion.LOOKUPS).version, 2)
@@ -0,0 +1,29 @@
+"""
+Tests for write_snapshots management command
+"""
+from io import StringIO
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..snapshots import LATEST
+
+
+class TestWriteSnapshots(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def test_write_snapshots(self):
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as root:
+            call_command('write_snapshots', root=root, stdout=out)
+
+            self.assertTrue(os.path.exists(os.path.join(root, LATEST)))
+        lines = out.getvalue().splitlines()
+
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('Wrote json snapshot registry-'))
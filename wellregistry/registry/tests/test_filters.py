@@ -0,0 +1,134 @@
+"""
+Tests for the registry filters module
+"""
+from django.db import connection
+from django.test import TestCase
+
+from ..filters import MonitoringLocationFilter
+from ..models import MonitoringLocation
+
+
+class TestMonitoringLocationFilter(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        # Moves the second USGS monitoring location half a degree north of the first
+        MonitoringLocation.objects.filter(site_no='11112222').update(dec_lat_va='40.5')
+
+    def _site_nos(self, params):
+        filterset = MonitoringLocationFilter(params, queryset=MonitoringLocation.objects.all())
+        self.assertTrue(filterset.is_valid(), filterset.errors)
+        return sorted(filterset.qs.values_list('site_no', flat=True))
+
+    def test_agency(self):
+        self.assertEqual(self._site_nos({'agency': 'USGS'}), ['11112222', '12345678'])
+        self.assertEqual(self._site_nos({'agency': 'ADWR,USGS'}), ['11112222', '12345678', '44445555'])
+
+    def test_state_and_county(self):
+        self.assertEqual(self._site_nos({'state': '26'}), ['11112222', '12345678'])
+        self.assertEqual(self._site_nos({'state': '26', 'county': 'none'}), [])
+
+    def test_site_no(self):
+        self.assertEqual(self._site_nos({'site_no': '44445555,12345678,99999999'}), ['12345678', '44445555'])
+
+    def test_update_date_range(self):
+        self.assertEqual(self._site_nos({'update_date_after': '2020-07-09T20:10:00Z'}), ['11112222', '44445555'])
+        self.assertEqual(self._site_nos({'update_date_after': '2020-07-09T20:10:00Z',
+                                         'update_date_before': '2020-07-09T20:15:00Z'}), ['11112222'])
+
+    def test_flags(self):
+        self.assertEqual(self._site_nos({'display_flag': 'true'}), ['11112222'])
+        self.assertEqual(len(self._site_nos({'wl_sn_flag': 'false', 'qw_sn_flag': 'false'})),
+                         MonitoringLocation.objects.filter(wl_sn_flag=False, qw_sn_flag=False).count())
+
+    def test_bbox(self):
+        self.assertEqual(self._site_nos({'bbox': '-101,39.9,-99,40.1'}), ['12345678'])
+        self.assertEqual(self._site_nos({'bbox': '-180,-90,180,90'}), ['11112222', '12345678'])
+
+    def test_bbox_across_antimeridian(self):
+        self.assertEqual(self._site_nos({'bbox': '170,39,-99,41'}), ['11112222', '12345678'])
+        self.assertEqual(self._site_nos({'bbox': '170,39,-101,41'}), [])
+
+    def test_near(self):
+        self.assertEqual(self._site_nos({'near': '40,-100', 'radius_km': '10'}), ['12345678'])
+        self.assertEqual(self._site_nos({'near': '40,-100', 'radius_km': '55'}), ['12345678'])
+        self.assertEqual(self._site_nos({'near': '40,-100', 'radius_km': '56'}), ['11112222', '12345678'])
+        self.assertEqual(self._site_nos({'near': '40.25,-100.3', 'radius_km': '40'}), ['11112222', '12345678'])
+
+    def test_invalid_spatial_filters(self):
+        for params in [{'bbox': '-101,39.9,-99'}, {'bbox': '-101,41,-99,40'}, {'bbox': 'a,b,c,d'},
+                       {'near': '40,-100'}, {'near': '91,-100', 'radius_km': '1'}, {'near': '40', 'radius_km': '1'},
+                       {'near': '40,-100', 'radius_km': '-1'}]:
+            with self.subTest(params=params):
+                filterset = MonitoringLocationFilter(params, queryset=MonitoringLocation.objects.all())
+
+                self.assertFalse(filterset.is_valid())
+
+    def test_invalid_update_date(self):
+        filterset = MonitoringLocationFilter({'update_date_after': 'yesterday'},
+                                             queryset=MonitoringLocation.objects.all())
+
+        self.assertFalse(filterset.is_valid())
+
+
+class TestMonitoringLocationFilterIndexes(TestCase):
+    """
+    Sequential scans are disabled so that the plans are those Postgres would choose for a
+    registry too large to scan. A scan of the monitoring location table must then use an index
+    condition or a partial index, rather than filtering the rows of a full scan.
+    """
+    fixtures = ['test_agencies.json', 'test_countries.json', 'test_states.json', 'test_counties.json']
+    partial_indexes = ['ml_display_flag_idx', 'ml_wl_sn_flag_idx', 'ml_qw_sn_flag_idx']
+
+    @classmethod
+    def setUpTestData(cls):
+        # The table is analyzed with enough rows that the plans do not depend on whether
+        # autovacuum has found it empty
+        MonitoringLocation.objects.bulk_create([
+            MonitoringLocation(agency_id='ADWR', site_no=f'site{index}', site_name='',
+                               state_id=39 if index % 100 == 0 else None, county_id=171 if index % 100 == 0 else None)
+            for index in range(1000)
+        ])
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {MonitoringLocation._meta.db_table}')
+            cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('RESET enable_seqscan')
+
+    @classmethod
+    def _nodes(cls, plan):
+        yield plan
+        for child in plan.get('Plans', []):
+            yield from cls._nodes(child)
+
+    def _assert_indexed(self, params):
+        queryset = MonitoringLocationFilter(params, queryset=MonitoringLocation.objects.all()).qs
+        sql, sql_params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', sql_params)
+            plan = cursor.fetchone()[0][0]['Plan']
+        scans = [node for node in self._nodes(plan)
+                 if node.get('Relation Name') == MonitoringLocation._meta.db_table]
+
+        self.assertTrue(scans)
+        for node in scans:
+            self.assertNotEqual(node['Node Type'], 'Seq Scan', plan)
+            if node['Node Type'] != 'Bitmap Heap Scan':
+                self.assertTrue('Index Cond' in node or node['Index Name'] in self.partial_indexes, plan)
+
+    def test_filters_use_indexes(self):
+        for params in [{'display_flag': 'true'}, {'agency': 'USGS'}, {'state': '26'}, {'county': '001'},
+                       {'nat_aqfr': 'N100AKUNCD'}, {'site_type': 'WELL'}, {'wl_sn_flag': 'true'},
+                       {'qw_sn_flag': 'true'}, {'update_date_after': '2020-07-09T20:10:00Z'},
+                       {'update_date_before': '2020-07-09T20:10:00Z'}, {'site_no': '12345678,44445555'},
+                       {'agency': 'USGS', 'site_no': '12345678'}, {'bbox': '-101,39.9,-99,40.1'},
+                       {'near': '40,-100', 'radius_km': '10'}]:
+            with self.subTest(params=params):
+                self._assert_indexed(params)
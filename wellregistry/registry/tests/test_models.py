@@ -3,11 +3,133 @@ Tests for registry.models
 """
 from decimal import Decimal
 
+from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-from ..models import MonitoringLocation, AgencyLookup, CountyLookup, CountryLookup, HorizontalDatumLookup, \
-    StateLookup, UnitsLookup, AltitudeDatumLookup, NatAqfrLookup
+from ..models import MonitoringLocation, AgencyLookup, CountyLookup, CountryLookup, DataVersion, \
+    HorizontalDatumLookup, StateLookup, UnitsLookup, AltitudeDatumLookup, NatAqfrLookup
+
+
+class TestDataVersion(TestCase):
+
+    def test_unversioned(self):
+        version = DataVersion.get_version('test')
+
+        self.assertEqual(version.version, 0)
+        self.assertIsNone(version.update_date)
+
+    def test_bump(self):
+        DataVersion.bump('test')
+        first = DataVersion.get_version('test')
+        DataVersion.bump('test')
+        second = DataVersion.get_version('test')
+
+        self.assertEqual(first.version, 1)
+        self.assertEqual(second.version, 2)
+        self.assertGreaterEqual(second.update_date, first.update_date)
+        self.assertEqual(DataVersion.get_version('other').version, 0)
+
+
+class TestMonitoringLocationFloatCoordinates(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def _float_coordinates(self, site_no):
+        return tuple(MonitoringLocation.objects.filter(site_no=site_no)
+                     .values_list('dec_lat_float', 'dec_long_float').get())
+
+    def test_save(self):
+        monitoring_location = MonitoringLocation.objects.get(site_no='44445555')
+        monitoring_location.dec_lat_va = Decimal('43.0731')
+        monitoring_location.dec_long_va = '-89.4012'
+        monitoring_location.save()
+
+        self.assertEqual(self._float_coordinates('44445555'), (43.0731, -89.4012))
+
+    def test_save_update_fields(self):
+        monitoring_location = MonitoringLocation.objects.get(site_no='44445555')
+        monitoring_location.dec_lat_va = Decimal('43.0731')
+        monitoring_location.save(update_fields=['dec_lat_va'])
+
+        self.assertEqual(self._float_coordinates('44445555'), (43.0731, None))
+
+    def test_bulk_create(self):
+        monitoring_location = MonitoringLocation.objects.get(site_no='44445555')
+        monitoring_location.pk = None
+        monitoring_location.site_no = '99998888'
+        monitoring_location.dec_lat_va = Decimal('-12.5')
+        monitoring_location.dec_long_va = Decimal('130.25')
+        MonitoringLocation.objects.bulk_create([monitoring_location])
+
+        self.assertEqual(self._float_coordinates('99998888'), (-12.5, 130.25))
+
+    def test_bulk_update(self):
+        monitoring_locations = list(MonitoringLocation.objects.filter(agency='USGS'))
+        for monitoring_location in monitoring_locations:
+            monitoring_location.dec_long_va = Decimal('-101.5')
+        MonitoringLocation.objects.bulk_update(monitoring_locations, ['dec_long_va'])
+
+        self.assertEqual(self._float_coordinates('12345678'), (40.0, -101.5))
+        self.assertEqual(self._float_coordinates('11112222'), (40.0, -101.5))
+
+    def test_update(self):
+        MonitoringLocation.objects.filter(site_no='12345678').update(dec_lat_va=Decimal('41.25'), dec_long_va=None)
+
+        self.assertEqual(self._float_coordinates('12345678'), (41.25, None))
+
+
+class TestMonitoringLocationUpsert(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def _upload(self, existing_site_no, **changes):
+        """
+        Returns a new instance of the monitoring location existing_site_no with changes, as uploaded by user
+        """
+        monitoring_location = MonitoringLocation.objects.get(site_no=existing_site_no)
+        monitoring_location.pk = None
+        monitoring_location.insert_user = monitoring_location.update_user = self.user
+        for name, value in changes.items():
+            setattr(monitoring_location, name, value)
+        return monitoring_location
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='uploader')
+
+    def test_upsert(self):
+        before = MonitoringLocation.objects.get(site_no='12345678')
+        counts = MonitoringLocation.objects.upsert([
+            self._upload('12345678', site_name='Renamed', dec_lat_va=Decimal('41.5')),
+            self._upload('11112222'),
+            self._upload('12345678', site_no='99998888', site_name='New')
+        ])
+
+        self.assertEqual(counts, (1, 1))
+        updated = MonitoringLocation.objects.get(site_no='12345678')
+        self.assertEqual((updated.pk, updated.site_name, updated.dec_lat_float), (before.pk, 'Renamed', 41.5))
+        self.assertEqual((updated.insert_user_id, updated.insert_date), (before.insert_user_id, before.insert_date))
+        self.assertEqual(updated.update_user, self.user)
+        self.assertGreater(updated.update_date, before.update_date)
+        unchanged = MonitoringLocation.objects.get(site_no='11112222')
+        self.assertNotEqual(unchanged.update_user, self.user)
+        inserted = MonitoringLocation.objects.get(site_no='99998888')
+        self.assertEqual((inserted.insert_user, inserted.site_name), (self.user, 'New'))
+
+    def test_upsert_equal_decimals_unchanged(self):
+        monitoring_location = MonitoringLocation.objects.get(site_no='12345678')
+        counts = MonitoringLocation.objects.upsert([
+            self._upload('12345678', dec_lat_va=monitoring_location.dec_lat_va + Decimal('0.000'))
+        ])
+
+        self.assertEqual(counts, (0, 0))
+
+    def test_upsert_nothing(self):
+        self.assertEqual(MonitoringLocation.objects.upsert([]), (0, 0))
 
 
 class TestMonitoringLocationFullClean(TestCase):
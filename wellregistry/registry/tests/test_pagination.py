@@ -0,0 +1,123 @@
+"""
+Tests for the pagination module
+"""
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase
+
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+
+from ..models import MonitoringLocation
+from ..pagination import CachedCountLimitOffsetPagination, CachedCountPaginator, KeysetPagination, \
+    MonitoringLocationPagination, estimate_count, get_cached_count
+
+
+class TestMonitoringLocationPagination(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.queryset = MonitoringLocation.objects.all()
+        cache.clear()
+
+    def _paginate(self, url):
+        paginator = MonitoringLocationPagination()
+        page = paginator.paginate_queryset(self.queryset, Request(self.factory.get(url)))
+        return paginator, page
+
+    def test_default_is_limit_offset(self):
+        paginator, page = self._paginate('/monitoring-locations/?limit=2&offset=1')
+
+        self.assertIsInstance(paginator.paginator, LimitOffsetPagination)
+        self.assertEqual(len(page), 2)
+        self.assertEqual(paginator.get_paginated_response([]).data['count'], 3)
+
+    def test_keyset_pagination(self):
+        paginator, page = self._paginate('/monitoring-locations/?pagination=cursor&limit=2')
+        response_data = paginator.get_paginated_response([ml.id for ml in page]).data
+
+        self.assertIsInstance(paginator.paginator, KeysetPagination)
+        self.assertNotIn('count', response_data)
+        self.assertEqual(response_data['results'], [3, 4])
+        self.assertIsNone(response_data['previous'])
+
+        next_params = parse_qs(urlparse(response_data['next']).query)
+        self.assertIn('cursor', next_params)
+
+        paginator, page = self._paginate(response_data['next'])
+        response_data = paginator.get_paginated_response([ml.id for ml in page]).data
+
+        self.assertIsInstance(paginator.paginator, KeysetPagination)
+        self.assertEqual(response_data['results'], [5])
+        self.assertIsNone(response_data['next'])
+        self.assertIsNotNone(response_data['previous'])
+
+
+class TestCachedCountPagination(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        cache.clear()
+
+    def _paginate(self, queryset, url, estimate_threshold=None):
+        paginator = CachedCountLimitOffsetPagination()
+        if estimate_threshold is not None:
+            paginator.estimate_threshold = estimate_threshold
+        page = paginator.paginate_queryset(queryset, Request(self.factory.get(url)))
+        return paginator.get_paginated_response([ml.id for ml in page]).data
+
+    def test_cached_count_invalidated_by_save(self):
+        queryset = MonitoringLocation.objects.filter(display_flag=True)
+        self.assertEqual(get_cached_count(queryset), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_count(queryset), 1)
+
+        monitoring_location = MonitoringLocation.objects.get(pk=3)
+        monitoring_location.display_flag = True
+        monitoring_location.save()
+
+        self.assertEqual(get_cached_count(queryset), 2)
+
+    def test_count_per_filter_signature(self):
+        self.assertEqual(get_cached_count(MonitoringLocation.objects.filter(agency='USGS')), 2)
+        self.assertEqual(get_cached_count(MonitoringLocation.objects.filter(agency='ADWR')), 1)
+
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {MonitoringLocation._meta.db_table}')
+        self.assertEqual(estimate_count(MonitoringLocation), 3)
+
+        data = self._paginate(MonitoringLocation.objects.all(), '/monitoring-locations/?limit=2', 3)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['results'], [3, 4])
+        self.assertIsNotNone(data['next'])
+
+        # Filtered querysets are counted exactly
+        with self.assertNumQueries(2):
+            data = self._paginate(MonitoringLocation.objects.filter(display_flag=True), '/monitoring-locations/', 3)
+        self.assertEqual(data['count'], 1)
+
+    def test_count_false(self):
+        with self.assertNumQueries(1):
+            data = self._paginate(MonitoringLocation.objects.order_by('id'),
+                                  '/monitoring-locations/?limit=3&count=false')
+
+        self.assertIsNone(data['count'])
+        self.assertEqual(data['results'], [3, 4, 5])
+        self.assertIsNone(data['next'])
+
+    def test_admin_paginator(self):
+        paginator = CachedCountPaginator(MonitoringLocation.objects.order_by('id'), 2)
+        self.assertEqual(paginator.count, 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedCountPaginator(MonitoringLocation.objects.order_by('id'), 2).num_pages, 2)
@@ -0,0 +1,74 @@
+"""
+Tests for the renderers module
+"""
+import datetime
+from decimal import Decimal
+from unittest import TestCase, skipIf
+
+from django.utils import timezone
+
+from rest_framework.renderers import JSONRenderer
+
+from .. import renderers
+from ..renderers import FastJSONRenderer, NDJSONRenderer, PassthroughJSONRenderer, RawJSON, StreamingJSONRenderer
+
+
+@skipIf(renderers.orjson is None, 'orjson is not installed')
+class TestFastJSONRenderer(TestCase):
+
+    def test_render_matches_json_renderer(self):
+        data = {
+            'decimal': Decimal('43.1234567'),
+            'datetime': datetime.datetime(2021, 2, 3, 4, 5, 6, 789000, tzinfo=timezone.utc),
+            'date': datetime.date(2021, 2, 3),
+            'text': 'line\u2028separator\u2029é',
+            1: [None, True, 1.5],
+        }
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_render_indented(self):
+        renderer_context = {'indent': 4}
+
+        self.assertEqual(FastJSONRenderer().render({'a': 1}, 'application/json', renderer_context),
+                         JSONRenderer().render({'a': 1}, 'application/json', renderer_context))
+
+    def test_render_none(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class TestStreamingJSONRenderer(TestCase):
+
+    def test_render_stream(self):
+        renderer = StreamingJSONRenderer()
+        renderer.batch_size = 2
+
+        self.assertEqual(b''.join(renderer.render_stream(iter([{'a': 1}, {'a': 2}, {'a': 3}]))),
+                         b'[{"a":1},{"a":2},{"a":3}]')
+
+    def test_render_empty_stream(self):
+        self.assertEqual(b''.join(StreamingJSONRenderer().render_stream(iter([]))), b'[]')
+
+
+class TestNDJSONRenderer(TestCase):
+
+    def test_render_stream(self):
+        renderer = NDJSONRenderer()
+        renderer.batch_size = 2
+
+        self.assertEqual(b''.join(renderer.render_stream(iter([{'a': 1}, {'a': 2}, {'a': 3}]))),
+                         b'{"a":1}\n{"a":2}\n{"a":3}\n')
+
+
+class TestPassthroughJSONRenderer(TestCase):
+
+    def test_render_raw_json(self):
+        self.assertEqual(PassthroughJSONRenderer().render(RawJSON('[{"a": 1}]')), b'[{"a": 1}]')
+
+    def test_render_dict_containing_raw_json(self):
+        content = PassthroughJSONRenderer().render({'count': 1, 'next': None, 'results': RawJSON('[{"a": 1}]')})
+
+        self.assertEqual(content, b'{"count":1,"next":null,"results":[{"a": 1}]}')
+
+    def test_render_without_raw_json(self):
+        self.assertEqual(PassthroughJSONRenderer().render({'detail': 'Not found.'}), b'{"detail":"Not found."}')
@@ -0,0 +1,37 @@
+"""
+Tests for the serializers module
+"""
+from django.test import TestCase
+
+from ..models import AgencyLookup, MonitoringLocation
+from ..serializers import AgencyLookupSerializer, MonitoringLocationSerializer
+
+
+class TestMonitoringLocationSerializer(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def test_lookup_representations_are_reused(self):
+        queryset = MonitoringLocation.objects.filter(agency='USGS').order_by('id')
+        data = MonitoringLocationSerializer(queryset, many=True).data
+
+        self.assertEqual(len(data), 2)
+        self.assertIs(data[0]['agency'], data[1]['agency'])
+        self.assertIs(data[0]['state'], data[1]['state'])
+        self.assertIs(data[0]['altitude_units'], data[1]['altitude_units'])
+        self.assertEqual(data[0]['agency'], AgencyLookupSerializer(AgencyLookup.objects.get(agency_cd='USGS')).data)
+
+    def test_lookup_representations_are_per_serializer(self):
+        queryset = MonitoringLocation.objects.filter(agency='USGS')
+        first = MonitoringLocationSerializer(queryset, many=True).data
+        second = MonitoringLocationSerializer(queryset, many=True).data
+
+        self.assertEqual(first[0]['agency'], second[0]['agency'])
+        self.assertIsNot(first[0]['agency'], second[0]['agency'])
+
+    def test_different_lookups(self):
+        data = MonitoringLocationSerializer(MonitoringLocation.objects.order_by('id'), many=True).data
+
+        self.assertEqual([ml['agency']['agency_cd'] for ml in data], ['USGS', 'USGS', 'ADWR'])
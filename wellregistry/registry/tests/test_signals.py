@@ -0,0 +1,46 @@
+"""
+Tests for the registry signals module
+"""
+from django.test import TestCase
+
+from ..models import CountyLookup, DataVersion, MonitoringLocation, MonitoringLocationTombstone
+from ..signals import lookup_invalidation_suspended
+
+
+class TestAddTombstone(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def test_delete_adds_tombstone(self):
+        MonitoringLocation.objects.get(site_no='44445555').delete()
+        tombstone = MonitoringLocationTombstone.objects.get()
+
+        self.assertEqual(tombstone.monitoring_location_id, 5)
+        self.assertEqual(tombstone.agency_cd, 'ADWR')
+        self.assertEqual(tombstone.site_no, '44445555')
+        self.assertIsNotNone(tombstone.delete_date)
+
+    def test_queryset_delete_adds_tombstones(self):
+        MonitoringLocation.objects.filter(agency='USGS').delete()
+
+        self.assertEqual(sorted(MonitoringLocationTombstone.objects.values_list('site_no', flat=True)),
+                         ['11112222', '12345678'])
+
+
+class TestInvalidateCachedLookups(TestCase):
+    fixtures = ['test_counties.json', 'test_countries.json', 'test_states.json']
+
+    def test_lookup_delete_bumps_lookup_version(self):
+        CountyLookup.objects.get(county_cd='123').delete()
+
+        self.assertEqual(DataVersion.get_version(DataVersion.LOOKUPS).version, 1)
+
+    def test_lookup_invalidation_suspended(self):
+        with lookup_invalidation_suspended():
+            CountyLookup.objects.get(county_cd='123').save()
+
+        self.assertEqual(DataVersion.get_version(DataVersion.LOOKUPS).version, 0)
+        CountyLookup.objects.get(county_cd='123').save()
+        self.assertEqual(DataVersion.get_version(DataVersion.LOOKUPS).version, 1)
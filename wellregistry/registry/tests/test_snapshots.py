@@ -0,0 +1,200 @@
+"""
+Tests for the registry snapshots module
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+
+import brotli
+
+from ..models import MonitoringLocation
+from ..snapshots import ENCODINGS, LATEST, SnapshotScheduler, SnapshotWriter
+from ..views import MonitoringLocationsListView, SnapshotView
+
+
+class SnapshotTestCase(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _read(self, name):
+        with open(os.path.join(self.root, name), 'rb') as snapshot_file:
+            return snapshot_file.read()
+
+
+class TestSnapshotWriter(SnapshotTestCase):
+
+    def test_write(self):
+        latest = SnapshotWriter(self.root).write()
+
+        self.assertEqual(json.loads(self._read(LATEST)), latest)
+        self.assertEqual(set(latest['files']), {'json', 'csv', 'geojson'})
+        for snapshot in latest['files'].values():
+            content = self._read(snapshot['name'])
+            self.assertEqual(len(content), snapshot['size'])
+            self.assertEqual(gzip.decompress(self._read(snapshot['name'] + '.gz')), content)
+
+    def test_json_matches_api(self):
+        latest = SnapshotWriter(self.root).write()
+        api = MonitoringLocationsListView.as_view()(
+            self.factory.get('/apps/location-registry/monitoring-locations/?format=json&display_flag=true'))
+
+        self.assertEqual(json.loads(self._read(latest['files']['json']['name'])),
+                         json.loads(api.rendered_content)['results'])
+
+    def test_csv_and_geojson(self):
+        latest = SnapshotWriter(self.root).write()
+        rows = list(csv.DictReader(io.StringIO(self._read(latest['files']['csv']['name']).decode())))
+        geojson = json.loads(self._read(latest['files']['geojson']['name']))
+
+        self.assertEqual([row['site_no'] for row in rows], ['11112222'])
+        self.assertEqual(rows[0]['agency_cd'], 'USGS')
+        self.assertEqual(rows[0]['update_date'], '2020-07-09T20:13:15.420000Z')
+        self.assertEqual(geojson['type'], 'FeatureCollection')
+        self.assertEqual(geojson['features'][0]['geometry'], {'type': 'Point', 'coordinates': [-100.0, 40.0]})
+        self.assertEqual(geojson['features'][0]['properties']['site_no'], '11112222')
+
+    def test_empty_registry(self):
+        MonitoringLocation.objects.update(display_flag=False)
+        latest = SnapshotWriter(self.root).write()
+
+        self.assertEqual(json.loads(self._read(latest['files']['json']['name'])), [])
+        self.assertEqual(json.loads(self._read(latest['files']['geojson']['name'])),
+                         {'type': 'FeatureCollection', 'features': []})
+
+    def test_names_follow_content(self):
+        first = SnapshotWriter(self.root).write()
+        unchanged = SnapshotWriter(self.root).write()
+        MonitoringLocation.objects.filter(pk=3).update(display_flag=True)
+        changed = SnapshotWriter(self.root).write()
+
+        self.assertEqual(first['files'], unchanged['files'])
+        self.assertNotEqual(first['files']['json']['name'], changed['files']['json']['name'])
+        # Previous snapshots are kept until they are older than retain_seconds
+        self.assertTrue(os.path.exists(os.path.join(self.root, first['files']['json']['name'])))
+
+    def test_prune(self):
+        first = SnapshotWriter(self.root).write()
+        MonitoringLocation.objects.filter(pk=3).update(display_flag=True)
+        writer = SnapshotWriter(self.root)
+        writer.retain_seconds = -1
+        second = writer.write()
+
+        self.assertFalse(os.path.exists(os.path.join(self.root, first['files']['json']['name'])))
+        self.assertFalse(os.path.exists(os.path.join(self.root, first['files']['json']['name'] + '.gz')))
+        self.assertEqual(sorted(os.listdir(self.root)),
+                         sorted([LATEST] + [snapshot['name'] + suffix for snapshot in second['files'].values()
+                                            for suffix in ['', *(suffix for _, suffix in ENCODINGS)]]))
+
+
+class TestSnapshotScheduler(TestCase):
+
+    @override_settings(SNAPSHOT_ON_WRITE=False)
+    def test_disabled(self):
+        with mock.patch('registry.background.transaction.on_commit') as on_commit:
+            SnapshotScheduler().request()
+
+        on_commit.assert_not_called()
+
+    @override_settings(SNAPSHOT_ON_WRITE=True)
+    def test_request_on_commit(self):
+        scheduler = SnapshotScheduler()
+        with mock.patch('registry.background.transaction.on_commit') as on_commit:
+            scheduler.request()
+
+        on_commit.assert_called_once_with(scheduler._start)
+
+    def test_requests_during_write_are_coalesced(self):
+        scheduler = SnapshotScheduler()
+        writing = threading.Event()
+        release = threading.Event()
+        writes = []
+
+        def write():
+            writes.append(1)
+            writing.set()
+            release.wait(5)
+
+        with mock.patch('registry.snapshots.SnapshotWriter') as writer:
+            writer.return_value.write.side_effect = write
+            scheduler._start()
+            writing.wait(5)
+            scheduler._start()
+            scheduler._start()
+            release.set()
+            for thread in threading.enumerate():
+                if thread.name == 'registry-snapshot':
+                    thread.join(5)
+
+        self.assertEqual(len(writes), 2)
+        self.assertFalse(scheduler._running)
+
+
+class TestSnapshotView(SnapshotTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.latest = SnapshotWriter(self.root).write()
+        self.json_name = self.latest['files']['json']['name']
+
+    def _get(self, name, **headers):
+        with self.settings(SNAPSHOT_ROOT=self.root):
+            return SnapshotView.as_view()(
+                self.factory.get(f'/apps/location-registry/snapshots/{name}', **headers), name=name)
+
+    def test_latest(self):
+        resp = self._get(LATEST)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Cache-Control'], 'no-cache')
+        self.assertEqual(json.loads(b''.join(resp.streaming_content)), self.latest)
+
+    def test_snapshot(self):
+        resp = self._get(self.json_name)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertIn('immutable', resp['Cache-Control'])
+        self.assertFalse(resp.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(resp.streaming_content), self._read(self.json_name))
+
+    def test_gzip_snapshot(self):
+        resp = self._get(self.json_name, HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(resp['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(resp.streaming_content)), self._read(self.json_name))
+
+    def test_brotli_snapshot(self):
+        resp = self._get(self.json_name, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertEqual(resp['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(b''.join(resp.streaming_content)), self._read(self.json_name))
+
+    def test_etag_varies_by_encoding(self):
+        etags = {self._get(self.json_name, HTTP_ACCEPT_ENCODING=coding)['ETag'] for coding in ['', 'gzip', 'br']}
+
+        self.assertEqual(len(etags), 3)
+
+    def test_missing_snapshot(self):
+        for name in ['registry-0123456789abcdef.csv', '../settings.py', 'registry-x.json']:
+            with self.subTest(name=name):
+                with self.assertRaises(Http404):
+                    self._get(name)
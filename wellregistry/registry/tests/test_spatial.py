@@ -0,0 +1,157 @@
+"""
+Tests for the registry spatial module
+"""
+import math
+import random
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..models import MonitoringLocation
+from ..spatial import KDTree, MonitoringLocationIndex, MonitoringLocationTile, chord_to_km, get_registry_version, \
+    tile_bounds, unit_vector
+
+
+class TestKDTree(TestCase):
+
+    def test_nearest_matches_brute_force(self):
+        generator = random.Random(42)
+        points = [unit_vector(generator.uniform(-90, 90), generator.uniform(-180, 180)) for _ in range(500)]
+        tree = KDTree(points)
+        for _ in range(20):
+            point = unit_vector(generator.uniform(-90, 90), generator.uniform(-180, 180))
+            expected = sorted((math.dist(point, other), index) for index, other in enumerate(points))[:7]
+
+            self.assertEqual([index for _, index in tree.nearest(point, 7)], [index for _, index in expected])
+
+    def test_nearest_with_predicate(self):
+        points = [unit_vector(0, longitude) for longitude in range(10)]
+        tree = KDTree(points)
+
+        self.assertEqual([index for _, index in tree.nearest(unit_vector(0, 0), 3, lambda index: index % 2)],
+                         [1, 3, 5])
+
+    def test_nearest_more_than_points(self):
+        tree = KDTree([unit_vector(0, 0), unit_vector(1, 1)])
+
+        self.assertEqual(len(tree.nearest(unit_vector(0, 0), 5)), 2)
+        self.assertEqual(KDTree([]).nearest(unit_vector(0, 0), 5), [])
+
+    def test_chord_to_km(self):
+        chord = math.dist(unit_vector(0, 0), unit_vector(0, 1))
+
+        self.assertAlmostEqual(chord_to_km(chord), 111.195, places=2)
+        self.assertAlmostEqual(chord_to_km(math.dist(unit_vector(0, 179.5), unit_vector(0, -179.5))), 111.195,
+                               places=2)
+
+
+class TestMonitoringLocationIndex(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        # Moves the second USGS monitoring location half a degree north of the first
+        MonitoringLocation.objects.filter(site_no='11112222').update(dec_lat_va='40.5')
+        MonitoringLocationIndex._current = None
+
+    def tearDown(self):
+        MonitoringLocationIndex._current = None
+
+    def test_nearest(self):
+        index = MonitoringLocationIndex.get()
+        nearest = index.nearest(40.4, -100, 5)
+
+        self.assertEqual([pk for _, pk in nearest], [4, 3])
+        self.assertAlmostEqual(nearest[0][0], 11.12, places=1)
+        self.assertEqual(index.nearest(40.4, -100, 5, display_flag=False), [nearest[1]])
+        self.assertEqual(index.nearest(40.4, -100, 5, agency_id=['ADWR']), [])
+
+    def test_rebuilt_when_data_changes(self):
+        index = MonitoringLocationIndex.get()
+
+        self.assertIs(MonitoringLocationIndex.get(), index)
+        monitoring_location = MonitoringLocation.objects.get(pk=5)
+        monitoring_location.dec_lat_va = '40.35'
+        monitoring_location.dec_long_va = '-100'
+        monitoring_location.save()
+        rebuilt = MonitoringLocationIndex.get()
+
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual([pk for _, pk in rebuilt.nearest(40.4, -100, 5)], [5, 4, 3])
+
+        MonitoringLocation.objects.filter(pk=4).delete()
+        self.assertEqual([pk for _, pk in MonitoringLocationIndex.get().nearest(40.4, -100, 5)], [5, 3])
+
+    def test_version_does_not_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            get_registry_version()
+
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+
+class TestTileBounds(TestCase):
+
+    def test_world(self):
+        west, south, east, north = tile_bounds(0, 0, 0)
+
+        self.assertEqual((west, east), (-180, 180))
+        self.assertAlmostEqual(south, -85.0511, places=4)
+        self.assertAlmostEqual(north, 85.0511, places=4)
+
+    def test_quadrant(self):
+        west, south, east, north = tile_bounds(1, 0, 1)
+
+        self.assertEqual((west, east), (-180, 0))
+        self.assertAlmostEqual(south, -85.0511, places=4)
+        self.assertAlmostEqual(north, 0)
+
+    def test_is_valid(self):
+        self.assertTrue(MonitoringLocationTile.is_valid(0, 0, 0))
+        self.assertTrue(MonitoringLocationTile.is_valid(3, 7, 7))
+        self.assertFalse(MonitoringLocationTile.is_valid(3, 8, 0))
+        self.assertFalse(MonitoringLocationTile.is_valid(-1, 0, 0))
+        self.assertFalse(MonitoringLocationTile.is_valid(23, 0, 0))
+
+
+class TestMonitoringLocationTile(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        # Moves the second USGS monitoring location half a degree north of the first
+        MonitoringLocation.objects.filter(site_no='11112222').update(dec_lat_va='40.5')
+
+    def test_clusters(self):
+        MonitoringLocation.objects.filter(pk=3).update(display_flag=True)
+        features = MonitoringLocationTile(0, 0, 0).to_geojson()['features']
+
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]['properties'], {'cluster': True, 'count': 2})
+        self.assertAlmostEqual(features[0]['geometry']['coordinates'][0], -100)
+        self.assertAlmostEqual(features[0]['geometry']['coordinates'][1], 40.25)
+
+    def test_clusters_split_by_cell(self):
+        MonitoringLocation.objects.filter(pk=3).update(display_flag=True, dec_long_va=-80)
+        features = MonitoringLocationTile(0, 0, 0).to_geojson()['features']
+
+        self.assertEqual([feature['properties']['count'] for feature in features], [1, 1])
+
+    def test_wells(self):
+        # Tile 10/227/385 contains 40.5, -100
+        features = MonitoringLocationTile(10, 227, 385).to_geojson()['features']
+
+        self.assertEqual(features, [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [-100.0, 40.5]},
+            'properties': {'id': 4, 'agency_cd': 'USGS', 'site_no': '11112222', 'site_name': '',
+                           'wl_sn_flag': False, 'qw_sn_flag': False}
+        }])
+        self.assertEqual(MonitoringLocationTile(10, 228, 385).to_geojson()['features'], [])
+
+    def test_empty_tile(self):
+        self.assertEqual(MonitoringLocationTile(1, 1, 1).to_geojson(), {'type': 'FeatureCollection', 'features': []})
@@ -0,0 +1,69 @@
+"""
+Tests for the registry statistics module
+"""
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from ..models import DataVersion, MonitoringLocation, MonitoringLocationStatistics
+from ..statistics import StatisticsScheduler, get_statistics, refresh_statistics
+
+
+class TestStatistics(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        refresh_statistics()
+
+    def test_refresh_statistics(self):
+        self.assertEqual(sum(MonitoringLocationStatistics.objects.values_list('count', flat=True)), 3)
+        version = DataVersion.get_version(DataVersion.STATISTICS).version
+
+        MonitoringLocation.objects.get(site_no='44445555').delete()
+        refresh_statistics()
+
+        self.assertEqual(sum(MonitoringLocationStatistics.objects.values_list('count', flat=True)), 2)
+        self.assertEqual(DataVersion.get_version(DataVersion.STATISTICS).version, version + 1)
+
+    def test_get_statistics(self):
+        statistics = get_statistics()
+
+        self.assertEqual(statistics['total'], 3)
+        self.assertEqual(statistics['agency'], [{'agency_cd': 'ADWR', 'count': 1}, {'agency_cd': 'USGS', 'count': 2}])
+        self.assertEqual(statistics['display_flag'], [{'display_flag': False, 'count': 2},
+                                                      {'display_flag': True, 'count': 1}])
+        self.assertEqual(sum(group['count'] for group in statistics['state']), 3)
+        self.assertEqual(sum(group['count'] for group in statistics['wl_baseline_flag']), 3)
+
+    def test_get_statistics_filtered(self):
+        statistics = get_statistics(display_flag=True)
+
+        self.assertEqual(statistics['total'], 1)
+        self.assertEqual(statistics['agency'], [{'agency_cd': 'USGS', 'count': 1}])
+
+    def test_statistics_do_not_read_monitoring_locations(self):
+        with self.assertNumQueries(10) as queries:
+            get_statistics()
+        self.assertFalse([query for query in queries.captured_queries
+                          if MonitoringLocation._meta.db_table in query['sql']])
+
+
+class TestStatisticsScheduler(TestCase):
+
+    @override_settings(STATISTICS_REFRESH_ON_WRITE=False)
+    def test_disabled(self):
+        with mock.patch('registry.background.transaction.on_commit') as on_commit:
+            StatisticsScheduler().request()
+
+        on_commit.assert_not_called()
+
+    @override_settings(STATISTICS_REFRESH_ON_WRITE=True)
+    def test_request_on_commit(self):
+        scheduler = StatisticsScheduler()
+        with mock.patch('registry.background.transaction.on_commit') as on_commit:
+            scheduler.request()
+
+        on_commit.assert_called_once_with(scheduler._start)
@@ -1,10 +1,27 @@
 """
 Tests for the registry  views module
 """
+import datetime
+import json
+from urllib.parse import urlencode, urlparse
 
-from django.test import RequestFactory, TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.conf import settings
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
 
-from ..views import BasePage, MonitoringLocationsListView, status_check
+from ..caching import invalidate_pages, page_key
+from ..models import AgencyLookup, CountyLookup, DataVersion, MonitoringLocation
+from ..signals import monitoring_locations_changed
+from ..statistics import refresh_statistics
+from ..spatial import MonitoringLocationIndex
+from ..serializers import AgencyLookupSerializer, CountyLookupListSerializer
+from ..views import BasePage, LookupListView, MonitoringLocationBatchView, MonitoringLocationChangesView, \
+    MonitoringLocationDetailView, MonitoringLocationNearestView, MonitoringLocationsListView, \
+    MonitoringLocationStatisticsView, MonitoringLocationsStreamView, MonitoringLocationTileView, status_check
 
 
 class TestBasePage(TestCase):
@@ -26,6 +43,7 @@ class TestMonitoringLocationsListView(TestCase):
 
     def setUp(self):
         self.factory = RequestFactory()
+        cache.clear()
 
     def test_all_monitoring_locations(self):
         req = self.factory.get('/apps/location-registry/monitoring-locations/?format=json')
@@ -50,6 +68,733 @@ class TestMonitoringLocationsListView(TestCase):
         self.assertEqual(len(resp.data['results']), 2)
         self.assertIn(resp.data['results'][0]['site_no'], ['12345678', '44445555'])
         self.assertIn(resp.data['results'][1]['site_no'], ['12345678', '44445555'])
+
+    def test_keyset_pagination_monitoring_locations(self):
+        req = self.factory.get('/apps/location-registry/monitoring-locations/?format=json&pagination=cursor&limit=2')
+        resp = MonitoringLocationsListView.as_view()(req)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('count', resp.data)
+        self.assertEqual([ml['site_no'] for ml in resp.data['results']], ['12345678', '11112222'])
+
+        req = self.factory.get(resp.data['next'])
+        resp = MonitoringLocationsListView.as_view()(req)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([ml['site_no'] for ml in resp.data['results']], ['44445555'])
+        self.assertIsNone(resp.data['next'])
+
+    def test_flat_monitoring_locations(self):
+        req = self.factory.get('/apps/location-registry/monitoring-locations/?format=flat&display_flag=true')
+        resp = MonitoringLocationsListView.as_view()(req)
+        nested = MonitoringLocationsListView.as_view()(
+            self.factory.get('/apps/location-registry/monitoring-locations/?format=json&display_flag=true')
+        ).data['results'][0]
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['count'], 1)
+        flat = json.loads(resp.rendered_content)['results'][0]
+        self.assertEqual(flat['site_no'], '11112222')
+        self.assertEqual(flat['agency_cd'], nested['agency']['agency_cd'])
+        self.assertEqual(flat['agency_nm'], nested['agency']['agency_nm'])
+        self.assertEqual(flat['state_cd'], nested['state']['state_cd'])
+        self.assertEqual(flat['county_nm'], nested['county']['county_nm'])
+        self.assertEqual(flat['altitude_units'], nested['altitude_units']['unit_id'])
+        self.assertEqual(flat['nat_aqfr_cd'], nested['nat_aqfr']['nat_aqfr_cd'])
+        self.assertEqual(flat['dec_lat_va'], nested['dec_lat_va'])
+        self.assertEqual(flat['well_depth'], nested['well_depth'])
+        self.assertEqual(flat['horizontal_datum'], nested['horizontal_datum'])
+        self.assertEqual(flat['insert_user'], nested['insert_user'])
+        self.assertEqual(flat['update_date'], nested['update_date'])
+
+    def test_pgjson_parity(self):
+        MonitoringLocation.objects.filter(site_no='44445555').update(
+            county=None, nat_aqfr=None, well_depth=None, insert_user=None,
+            insert_date=datetime.datetime(2021, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc))
+        for query in ['', '&display_flag=true', '&pagination=cursor&limit=2']:
+            with self.subTest(query=query):
+                resp = MonitoringLocationsListView.as_view()(
+                    self.factory.get(f'/apps/location-registry/monitoring-locations/?format=pgjson{query}'))
+                drf_resp = MonitoringLocationsListView.as_view()(
+                    self.factory.get(f'/apps/location-registry/monitoring-locations/?format=json{query}'))
+
+                self.assertEqual(resp.status_code, 200)
+                pgjson = json.loads(resp.rendered_content)
+                drf_json = json.loads(drf_resp.rendered_content)
+                self.assertEqual(pgjson['results'], drf_json['results'])
+                self.assertEqual({key: value for key, value in pgjson.items() if key != 'next'},
+                                 {key: value for key, value in drf_json.items() if key != 'next'})
+
+    def test_decimals_as_numbers(self):
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'COERCE_DECIMAL_TO_STRING': False}):
+            results = {
+                format_name: json.loads(MonitoringLocationsListView.as_view()(self.factory.get(
+                    f'/apps/location-registry/monitoring-locations/?format={format_name}')).rendered_content)['results']
+                for format_name in ['json', 'flat', 'pgjson']
+            }
+
+        self.assertIsInstance(results['json'][0]['dec_lat_va'], float)
+        self.assertEqual(results['pgjson'], results['json'])
+        for flat, nested in zip(results['flat'], results['json']):
+            for name in ['dec_lat_va', 'dec_long_va', 'alt_va', 'well_depth']:
+                self.assertEqual(flat[name], nested[name])
+
+    def test_conditional_get_etag(self):
+        url = '/apps/location-registry/monitoring-locations/?format=json'
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(url))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('ETag', resp)
+        self.assertIn('Last-Modified', resp)
+
+        not_modified = MonitoringLocationsListView.as_view()(self.factory.get(url, HTTP_IF_NONE_MATCH=resp['ETag']))
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], resp['ETag'])
+
+        other_page = MonitoringLocationsListView.as_view()(
+            self.factory.get(f'{url}&limit=1', HTTP_IF_NONE_MATCH=resp['ETag']))
+
+        self.assertEqual(other_page.status_code, 200)
+
+    def test_conditional_get_etag_changes(self):
+        url = '/apps/location-registry/monitoring-locations/?format=json'
+        etag = MonitoringLocationsListView.as_view()(self.factory.get(url))['ETag']
+
+        MonitoringLocation.objects.get(site_no='44445555').save()
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(url, HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+        etag = resp['ETag']
+        # As update_lookups does
+        DataVersion.bump(DataVersion.LOOKUPS)
+        invalidate_pages()
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(url, HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(resp.status_code, 200)
+
+        etag = resp['ETag']
+        MonitoringLocation.objects.get(site_no='12345678').delete()
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(url, HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['count'], 2)
+
+    def test_conditional_get_etag_changes_when_row_leaves_filter(self):
+        url = '/apps/location-registry/monitoring-locations/?format=json&agency=USGS'
+        etag = MonitoringLocationsListView.as_view()(self.factory.get(url))['ETag']
+
+        # The latest update_date of the filtered rows does not change
+        monitoring_location = MonitoringLocation.objects.filter(agency='USGS').earliest('update_date')
+        monitoring_location.agency_id = 'ADWR'
+        monitoring_location.save()
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(url, HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['count'], 1)
+
+    def test_conditional_get_if_modified_since(self):
+        url = '/apps/location-registry/monitoring-locations/?format=json&display_flag=true'
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(url))
+
+        self.assertEqual(resp['Last-Modified'], 'Thu, 09 Jul 2020 20:13:15 GMT')
+
+        not_modified = MonitoringLocationsListView.as_view()(
+            self.factory.get(url, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified']))
+
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_sparse_fields(self):
+        req = self.factory.get(
+            '/apps/location-registry/monitoring-locations/?format=json&fields=site_no,agency,wl_sn_flag')
+        with CaptureQueriesContext(connection) as queries:
+            resp = MonitoringLocationsListView.as_view()(req)
+            resp.render()
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(list(resp.data['results'][0].keys()), ['agency', 'site_no', 'wl_sn_flag'])
+        self.assertEqual(resp.data['results'][0]['agency']['agency_cd'], 'USGS')
+        select = [query['sql'] for query in queries.captured_queries if 'wl_sn_flag' in query['sql']][-1]
+        self.assertNotIn('wl_well_purpose_notes', select)
+        self.assertNotIn('county', select)
+        self.assertEqual(select.count(' JOIN '), 1)
+
+    def test_sparse_exclude(self):
+        req = self.factory.get('/apps/location-registry/monitoring-locations/?format=json'
+                               '&exclude=wl_well_purpose_notes,qw_well_purpose_notes,insert_user')
+        resp = MonitoringLocationsListView.as_view()(req)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn('wl_well_purpose_notes', resp.data['results'][0])
+        self.assertNotIn('insert_user', resp.data['results'][0])
+        self.assertIn('update_user', resp.data['results'][0])
+        self.assertEqual(resp.data['results'][0]['state']['state_cd'], '26')
+
+    def test_sparse_fields_flat_and_pgjson(self):
+        for format_name, expected in [('flat', {'site_no': '11112222', 'agency_cd': 'USGS'}),
+                                      ('pgjson', {'site_no': '11112222', 'agency': {
+                                          'agency_cd': 'USGS', 'agency_nm': 'United States Geological Survey',
+                                          'agency_med': 'US Geological Survey'}})]:
+            with self.subTest(format=format_name):
+                fields = ','.join(expected)
+                resp = MonitoringLocationsListView.as_view()(self.factory.get(
+                    f'/apps/location-registry/monitoring-locations/?format={format_name}&display_flag=true'
+                    f'&pagination=cursor&fields={fields}'))
+
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual(json.loads(resp.rendered_content)['results'], [expected])
+
+    def test_sparse_fields_unknown(self):
+        req = self.factory.get('/apps/location-registry/monitoring-locations/?format=json&fields=site_no,bogus')
+        resp = MonitoringLocationsListView.as_view()(req)
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('bogus', str(resp.data['fields']))
+
+    def test_count_false(self):
+        resp = MonitoringLocationsListView.as_view()(
+            self.factory.get('/apps/location-registry/monitoring-locations/?format=json&count=false&limit=2'))
+
+        self.assertIsNone(resp.data['count'])
+        self.assertEqual(len(resp.data['results']), 2)
+        self.assertIn('offset=2', resp.data['next'])
+
+        resp = MonitoringLocationsListView.as_view()(
+            self.factory.get('/apps/location-registry/monitoring-locations/?format=json&count=false&limit=2&offset=2'))
+
+        self.assertEqual(len(resp.data['results']), 1)
+        self.assertIsNone(resp.data['next'])
+
+    def test_count_cached_until_write(self):
+        url = '/apps/location-registry/monitoring-locations/?format=json&agency=USGS'
+        MonitoringLocationsListView.as_view()(self.factory.get(url))
+        with CaptureQueriesContext(connection) as queries:
+            resp = MonitoringLocationsListView.as_view()(self.factory.get(f'{url}&limit=1'))
+        # The count of the first request is reused by the validators and the pagination
+        self.assertEqual(len([query for query in queries if 'COUNT(' in query['sql']]), 0)
+        self.assertEqual(resp.data['count'], 2)
+
+        MonitoringLocation.objects.get(site_no='12345678').delete()
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(url))
+
+        self.assertEqual(resp.data['count'], 1)
+
+    def test_page_cached_until_write(self):
+        url = '/apps/location-registry/monitoring-locations/?format=json&agency=USGS'
+        MonitoringLocationsListView.as_view()(self.factory.get(url))
+        with CaptureQueriesContext(connection) as queries:
+            resp = MonitoringLocationsListView.as_view()(self.factory.get(url))
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(resp.data['count'], 2)
+
+        not_modified = MonitoringLocationsListView.as_view()(self.factory.get(url, HTTP_IF_NONE_MATCH=resp['ETag']))
+
+        self.assertEqual(not_modified.status_code, 304)
+
+        MonitoringLocation.objects.get(site_no='12345678').delete()
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(url))
+
+        self.assertEqual(resp.data['count'], 1)
+
+    def test_stale_page_served_while_recomputed(self):
+        url = '/apps/location-registry/monitoring-locations/?format=json&agency=USGS'
+        MonitoringLocationsListView.as_view()(self.factory.get(url))
+        MonitoringLocation.objects.get(site_no='12345678').delete()
+        # Another worker is recomputing the page
+        cache.add(f'{page_key(f"http://testserver{url}", "application/json")}:lock', 'other', 60)
+        with CaptureQueriesContext(connection) as queries:
+            resp = MonitoringLocationsListView.as_view()(self.factory.get(url))
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(resp.data['count'], 2)
+
+    def test_browsable_api_not_cached(self):
+        url = '/apps/location-registry/monitoring-locations/?format=api'
+        MonitoringLocationsListView.as_view()(self.factory.get(url)).render()
+        key = page_key(f'http://testserver{url}', 'text/html')
+
+        self.assertIsNone(cache.get(key))
+
+    def test_unfiltered_count_not_counted_twice(self):
+        url = '/apps/location-registry/monitoring-locations/?format=json'
+        MonitoringLocationsListView.as_view()(self.factory.get(url))
+        with CaptureQueriesContext(connection) as queries:
+            resp = MonitoringLocationsListView.as_view()(self.factory.get(url))
+
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        self.assertEqual(resp.data['count'], 3)
+
+    def test_flat_keyset_pagination(self):
+        req = self.factory.get('/apps/location-registry/monitoring-locations/?format=flat&pagination=cursor&limit=2')
+        resp = MonitoringLocationsListView.as_view()(req)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([ml['site_no'] for ml in resp.data['results']], ['12345678', '11112222'])
+
+        resp = MonitoringLocationsListView.as_view()(self.factory.get(resp.data['next']))
+
+        self.assertEqual([ml['site_no'] for ml in resp.data['results']], ['44445555'])
+
+
+class TestMonitoringLocationsStreamView(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_stream_json_array(self):
+        req = self.factory.get('/apps/location-registry/monitoring-locations/stream/')
+        resp = MonitoringLocationsStreamView.as_view()(req)
+        content = json.loads(b''.join(resp.streaming_content))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertEqual([ml['site_no'] for ml in content], ['12345678', '11112222', '44445555'])
+        self.assertEqual(content[0]['agency']['agency_cd'], 'USGS')
+
+    def test_stream_ndjson(self):
+        req = self.factory.get('/apps/location-registry/monitoring-locations/stream/?format=ndjson')
+        resp = MonitoringLocationsStreamView.as_view()(req)
+        lines = b''.join(resp.streaming_content).decode().splitlines()
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['site_no'] for line in lines], ['12345678', '11112222', '44445555'])
+
+    def test_stream_display_flag_true(self):
+        req = self.factory.get('/apps/location-registry/monitoring-locations/stream/?display_flag=true')
+        resp = MonitoringLocationsStreamView.as_view()(req)
+        content = json.loads(b''.join(resp.streaming_content))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([ml['site_no'] for ml in content], ['11112222'])
+
+
+class TestMonitoringLocationChangesView(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _get(self, query, **initkwargs):
+        req = self.factory.get(f'/apps/location-registry/monitoring-locations/changes/?{query}')
+        return MonitoringLocationChangesView.as_view(**initkwargs)(req)
+
+    def test_updated_since(self):
+        resp = self._get('format=json&updated_since=2020-07-09T20:10:00Z')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([ml['site_no'] for ml in resp.data['updated']], ['11112222', '44445555'])
+        self.assertEqual(resp.data['deleted'], [])
+
+    def test_updated_since_date_and_display_flag(self):
+        resp = self._get('format=json&updated_since=2020-07-09&display_flag=false')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([ml['site_no'] for ml in resp.data['updated']], ['12345678', '44445555'])
+
+    def test_deleted(self):
+        no_lag = datetime.timedelta()
+        resp = self._get('format=json&updated_since=2020-07-09', commit_lag=no_lag)
+        MonitoringLocation.objects.get(site_no='12345678').delete()
+        next_resp = self._get(urlencode({'format': 'json', 'updated_since': resp.data['until'].isoformat()}),
+                              commit_lag=no_lag)
+
+        self.assertEqual(next_resp.status_code, 200)
+        self.assertEqual(next_resp.data['updated'], [])
+        self.assertEqual(len(next_resp.data['deleted']), 1)
+        self.assertEqual(next_resp.data['deleted'][0]['id'], 3)
+        self.assertEqual(next_resp.data['deleted'][0]['agency_cd'], 'USGS')
+        self.assertEqual(next_resp.data['deleted'][0]['site_no'], '12345678')
+
+    def test_paginated(self):
+        MonitoringLocation.objects.get(site_no='12345678').delete()
+        MonitoringLocation.objects.get(site_no='11112222').delete()
+        no_lag = datetime.timedelta()
+        resp = self._get('format=json&updated_since=2020-07-09&limit=1', commit_lag=no_lag)
+        pages = [resp.data]
+        while pages[-1]['next']:
+            pages.append(self._get(urlparse(pages[-1]['next']).query).data)
+        unpaginated = self._get('format=json&updated_since=2020-07-09', commit_lag=no_lag).data
+
+        self.assertEqual(len(pages), max(len(unpaginated['updated']), len(unpaginated['deleted'])))
+        self.assertEqual({page['until'] for page in pages}, {resp.data['until']})
+        self.assertEqual([ml for page in pages for ml in page['updated']], unpaginated['updated'])
+        self.assertEqual([ml['site_no'] for page in pages for ml in page['deleted']], ['12345678', '11112222'])
+
+    def test_commit_lag(self):
+        MonitoringLocation.objects.get(site_no='12345678').save()
+        resp = self._get('format=json&updated_since=2020-07-09T20:10:00Z')
+
+        self.assertEqual([ml['site_no'] for ml in resp.data['updated']], ['11112222', '44445555'])
+        self.assertLess(resp.data['until'], timezone.now() - datetime.timedelta(minutes=4))
+        lagged = self._get(urlencode({'format': 'json', 'updated_since': timezone.now().isoformat()}))
+        self.assertEqual(lagged.data['until'], lagged.data['updated_since'])
+        self.assertEqual(lagged.data['updated'], [])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self._get('format=json&cursor=junk').status_code, 404)
+
+    def test_pgjson_changes(self):
+        resp = self._get('format=pgjson&updated_since=2020-07-09T20:10:00Z')
+        resp.render()
+        content = json.loads(resp.content)
+
+        self.assertEqual([ml['site_no'] for ml in content['updated']], ['11112222', '44445555'])
+
+    def test_missing_updated_since(self):
+        resp = self._get('format=json')
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('updated_since', resp.data)
+
+    def test_invalid_updated_since(self):
+        resp = self._get('format=json&updated_since=2020-13-45')
+
+        self.assertEqual(resp.status_code, 400)
+
+
+class TestMonitoringLocationDetailView(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        cache.clear()
+
+    def _get(self, agency_cd, site_no, query='format=json'):
+        req = self.factory.get(f'/apps/location-registry/monitoring-locations/{agency_cd}:{site_no}/?{query}')
+        return MonitoringLocationDetailView.as_view()(req, agency_cd=agency_cd, site_no=site_no)
+
+    def test_url(self):
+        match = resolve('/apps/location-registry/monitoring-locations/USGS:12345678/')
+
+        self.assertEqual(match.func.view_class, MonitoringLocationDetailView)
+        self.assertEqual(match.kwargs, {'agency_cd': 'USGS', 'site_no': '12345678'})
+
+    def test_detail(self):
+        resp = self._get('USGS', '12345678')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['site_no'], '12345678')
+        self.assertEqual(resp.data['agency']['agency_cd'], 'USGS')
+
+        list_resp = MonitoringLocationsListView.as_view()(
+            self.factory.get('/apps/location-registry/monitoring-locations/?format=json&site_no=12345678'))
+        self.assertEqual(json.loads(resp.rendered_content), json.loads(list_resp.rendered_content)['results'][0])
+
+    def test_detail_flat_and_sparse_fields(self):
+        resp = self._get('USGS', '12345678', 'format=flat&fields=agency_nm,site_no')
+
+        self.assertEqual(resp.data, {'agency_nm': 'United States Geological Survey', 'site_no': '12345678'})
+
+    def test_not_found(self):
+        self.assertEqual(self._get('USGS', '00000000').status_code, 404)
+        self.assertEqual(self._get('ADWR', '12345678').status_code, 404)
+
+    def test_cached_until_saved(self):
+        self._get('USGS', '12345678')
+        with self.assertNumQueries(0):
+            resp = self._get('USGS', '12345678', 'format=json&fields=site_name')
+        self.assertEqual(resp.data, {'site_name': ''})
+
+        monitoring_location = MonitoringLocation.objects.get(site_no='12345678')
+        monitoring_location.site_name = 'Renamed site'
+        monitoring_location.save()
+
+        self.assertEqual(self._get('USGS', '12345678').data['site_name'], 'Renamed site')
+
+    def test_browsable_api_invalidated_when_saved(self):
+        self.assertEqual(self._get('USGS', '12345678', 'format=api').data['site_name'], '')
+
+        monitoring_location = MonitoringLocation.objects.get(site_no='12345678')
+        monitoring_location.site_name = 'Renamed site'
+        monitoring_location.save()
+
+        self.assertEqual(self._get('USGS', '12345678', 'format=api').data['site_name'], 'Renamed site')
+
+    def test_site_no_change_and_delete(self):
+        self._get('USGS', '12345678')
+        self._get('USGS', '87654321')
+        monitoring_location = MonitoringLocation.objects.get(site_no='12345678')
+        monitoring_location.site_no = '87654321'
+        monitoring_location.save()
+
+        self.assertEqual(self._get('USGS', '12345678').status_code, 404)
+        self.assertEqual(self._get('USGS', '87654321').status_code, 200)
+
+        monitoring_location.delete()
+
+        self.assertEqual(self._get('USGS', '87654321').status_code, 404)
+
+    def test_bulk_change_invalidates(self):
+        self._get('USGS', '12345678')
+        MonitoringLocation.objects.filter(site_no='12345678').update(site_name='Bulk site')
+        monitoring_locations_changed.send(sender=MonitoringLocation)
+
+        self.assertEqual(self._get('USGS', '12345678').data['site_name'], 'Bulk site')
+
+
+class TestMonitoringLocationBatchView(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _post(self, ids, query='format=json'):
+        req = self.factory.post(f'/apps/location-registry/monitoring-locations/batch/?{query}',
+                                data=json.dumps({'ids': ids}), content_type='application/json')
+        return MonitoringLocationBatchView.as_view()(req)
+
+    def test_batch_in_input_order(self):
+        with self.assertNumQueries(1):
+            resp = self._post(['ADWR:44445555', 'USGS:00000000', 'USGS:12345678', 'ADWR:44445555'])
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([row['site_no'] for row in resp.data['results']], ['44445555', '12345678'])
+        self.assertEqual(resp.data['results'][1]['agency']['agency_cd'], 'USGS')
+        self.assertEqual(resp.data['missing'], ['USGS:00000000'])
+
+    def test_batch_flat_and_pgjson(self):
+        ids = ['USGS:11112222', 'USGS:12345678']
+        flat = self._post(ids, 'format=flat&fields=site_no,agency_cd')
+
+        self.assertEqual(flat.data['results'], [{'agency_cd': 'USGS', 'site_no': '11112222'},
+                                                {'agency_cd': 'USGS', 'site_no': '12345678'}])
+
+        pgjson = json.loads(self._post(ids, 'format=pgjson').rendered_content)
+        drf_json = json.loads(self._post(ids).rendered_content)
+
+        self.assertEqual(pgjson, drf_json)
+
+    def test_batch_filters(self):
+        resp = self._post(['USGS:11112222', 'USGS:12345678'], 'format=json&display_flag=true')
+
+        self.assertEqual([row['site_no'] for row in resp.data['results']], ['11112222'])
+        self.assertEqual(resp.data['missing'], ['USGS:12345678'])
+
+    def test_batch_invalid(self):
+        self.assertEqual(self._post([]).status_code, 400)
+        self.assertEqual(self._post(['USGS12345678']).status_code, 400)
+        self.assertEqual(self._post(['junk USGS:1 2']).status_code, 400)
+        self.assertEqual(self._post(['USGS:1'] * 5001).status_code, 400)
+
+        req = self.factory.get('/apps/location-registry/monitoring-locations/batch/')
+        self.assertEqual(MonitoringLocationBatchView.as_view()(req).status_code, 405)
+
+
+class TestMonitoringLocationNearestView(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        # Moves the second USGS monitoring location half a degree north of the first
+        MonitoringLocation.objects.filter(site_no='11112222').update(dec_lat_va='40.5')
+        MonitoringLocationIndex._current = None
+
+    def tearDown(self):
+        MonitoringLocationIndex._current = None
+
+    def _get(self, query):
+        req = self.factory.get(f'/apps/location-registry/monitoring-locations/nearest/?{query}')
+        return MonitoringLocationNearestView.as_view()(req)
+
+    def test_nearest(self):
+        resp = self._get('format=json&lat=40.1&lon=-100&k=2')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([ml['site_no'] for ml in resp.data], ['12345678', '11112222'])
+        self.assertEqual(resp.data[0]['agency']['agency_cd'], 'USGS')
+        self.assertAlmostEqual(resp.data[0]['distance_km'], 11.12, places=1)
+        self.assertLess(resp.data[0]['distance_km'], resp.data[1]['distance_km'])
+
+    def test_nearest_k_and_filters(self):
+        self.assertEqual([ml['site_no'] for ml in self._get('format=json&lat=40.1&lon=-100&k=1').data],
+                         ['12345678'])
+        self.assertEqual([ml['site_no'] for ml in self._get('format=json&lat=40.1&lon=-100&display_flag=true').data],
+                         ['11112222'])
+        self.assertEqual(self._get('format=json&lat=40.1&lon=-100&agency=ADWR').data, [])
+
+    def test_nearest_flat_sparse_fields(self):
+        resp = self._get('format=flat&lat=40.1&lon=-100&k=1&fields=site_no,agency_cd')
+
+        self.assertEqual(json.loads(resp.rendered_content),
+                         [{'site_no': '12345678', 'agency_cd': 'USGS', 'distance_km': 11.12}])
+
+    def test_nearest_invalid(self):
+        for query in ['format=json&lon=-100', 'format=json&lat=95&lon=-100', 'format=json&lat=40&lon=-100&k=0']:
+            with self.subTest(query=query):
+                self.assertEqual(self._get(query).status_code, 400)
+
+
+class TestMonitoringLocationTileView(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        cache.clear()
+
+    def _get(self, z, x, y):
+        req = self.factory.get(f'/apps/location-registry/monitoring-locations/tiles/{z}/{x}/{y}/?format=json')
+        return MonitoringLocationTileView.as_view()(req, z=z, x=x, y=y)
+
+    def test_tile(self):
+        resp = self._get(0, 0, 0)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['type'], 'FeatureCollection')
+        self.assertEqual([feature['properties']['count'] for feature in resp.data['features']], [1])
+
+    def test_tile_cached_until_data_changes(self):
+        self._get(0, 0, 0)
+        # Only the registry version is queried for a cached tile
+        with self.assertNumQueries(2):
+            resp = self._get(0, 0, 0)
+        self.assertEqual(resp.data['features'][0]['properties']['count'], 1)
+
+        monitoring_location = MonitoringLocation.objects.get(pk=3)
+        monitoring_location.display_flag = True
+        monitoring_location.save()
+        resp = self._get(0, 0, 0)
+
+        self.assertEqual(resp.data['features'][0]['properties']['count'], 2)
+
+    def test_invalid_tile(self):
+        self.assertEqual(self._get(2, 4, 0).status_code, 404)
+
+
+class TestLookupListView(TestCase):
+    fixtures = ['test_agencies.json', 'test_counties.json', 'test_countries.json', 'test_states.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.agencies = LookupListView.as_view(queryset=AgencyLookup.objects.all(),
+                                               serializer_class=AgencyLookupSerializer)
+        cache.clear()
+
+    def test_lookup(self):
+        resp = self.agencies(self.factory.get('/apps/location-registry/lookups/agencies/?format=json'))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data), 2)
+        self.assertIn({'agency_cd': 'USGS', 'agency_nm': 'United States Geological Survey',
+                       'agency_med': 'US Geological Survey'}, resp.data)
+        self.assertIn('public', resp['Cache-Control'])
+        self.assertIn('max-age=86400', resp['Cache-Control'])
+
+    def test_counties_lookup(self):
+        counties = LookupListView.as_view(queryset=CountyLookup.objects.select_related('state_id'),
+                                          serializer_class=CountyLookupListSerializer)
+        resp = counties(self.factory.get('/apps/location-registry/lookups/counties/?format=json'))
+
+        self.assertEqual(resp.data, [{'country_cd': 'US', 'state_cd': '26', 'county_cd': '123',
+                                      'county_nm': 'St. Francis County'}])
+
+    def test_conditional_get_etag(self):
+        url = '/apps/location-registry/lookups/agencies/?format=json'
+        etag = self.agencies(self.factory.get(url))['ETag']
+        # Only the lookup version is queried to revalidate or to serve a cached lookup
+        with self.assertNumQueries(1):
+            not_modified = self.agencies(self.factory.get(url, HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(not_modified.status_code, 304)
+        with self.assertNumQueries(1):
+            resp = self.agencies(self.factory.get(url))
+        self.assertEqual(len(resp.data), 2)
+
+    def test_lookup_version_changes(self):
+        url = '/apps/location-registry/lookups/agencies/?format=json'
+        etag = self.agencies(self.factory.get(url))['ETag']
+
+        AgencyLookup.objects.create(agency_cd='TEST', agency_nm='Test agency', agency_med='Test')
+        DataVersion.bump(DataVersion.LOOKUPS)
+        resp = self.agencies(self.factory.get(url, HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertIn('Last-Modified', resp)
+        self.assertEqual(len(resp.data), 3)
+
+    def test_edited_county_changes_etag(self):
+        counties = LookupListView.as_view(queryset=CountyLookup.objects.select_related('state_id'),
+                                          serializer_class=CountyLookupListSerializer)
+        url = '/apps/location-registry/lookups/counties/?format=json'
+        etag = counties(self.factory.get(url))['ETag']
+
+        county = CountyLookup.objects.get(county_cd='123')
+        county.county_nm = 'Saint Francis County'
+        county.save()
+        resp = counties(self.factory.get(url, HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(resp.data[0]['county_nm'], 'Saint Francis County')
+
+
+class TestMonitoringLocationStatisticsView(TestCase):
+    fixtures = ['test_agencies.json', 'test_altitude_datum.json', 'test_counties.json',
+                'test_countries.json', 'test_horizontal_datum.json', 'test_nat_aquifer.json',
+                'test_states.json', 'test_units.json', 'test_groups.json', 'test_monitoring_location.json',
+                'test_user.json']
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        cache.clear()
+        refresh_statistics()
+
+    def _get(self, query='format=json', **headers):
+        req = self.factory.get(f'/apps/location-registry/monitoring-locations/statistics/?{query}', **headers)
+        return MonitoringLocationStatisticsView.as_view()(req)
+
+    def test_statistics(self):
+        resp = self._get()
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['total'], 3)
+        self.assertEqual(resp.data['site_type'], [{'site_type': '', 'count': 1}, {'site_type': 'WELL', 'count': 2}])
+        self.assertIsNotNone(resp.data['refreshed'])
+
+        resp = self._get('format=json&display_flag=true')
+
+        self.assertEqual(resp.data['total'], 1)
+
+    def test_cached_until_refreshed(self):
+        etag = self._get()['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self._get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        MonitoringLocation.objects.get(site_no='44445555').delete()
+        self.assertEqual(self._get().data['total'], 3)
+        refresh_statistics()
+        resp = self._get(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['total'], 2)
+
+    def test_invalid_display_flag(self):
+        self.assertEqual(self._get('format=json&display_flag=maybe').status_code, 400)
+
+
 class TestStatusCheck(TestCase):
 
     def setUp(self):
@@ -1,13 +1,60 @@
 """
 Register Django URL route names.
 """
-from django.urls import path
+from django.urls import path, re_path
 
-from .views import BasePage, MonitoringLocationsListView, status_check
+from .models import AgencyLookup, AltitudeDatumLookup, CountryLookup, CountyLookup, HorizontalDatumLookup, \
+    NatAqfrLookup, StateLookup, UnitsLookup
+from .serializers import AgencyLookupSerializer, AltitudeDatumLookupSerializer, CountryLookupSerializer, \
+    CountyLookupListSerializer, HorizontalDatumLookupSerializer, NatAqfrLookupSerializer, StateLookupListSerializer, \
+    UnitsLookupSerializer
+from .views import BasePage, LookupListView, MonitoringLocationBatchView, MonitoringLocationChangesView, \
+    MonitoringLocationDetailView, MonitoringLocationNearestView, MonitoringLocationsListView, \
+    MonitoringLocationStatisticsView, MonitoringLocationsStreamView, MonitoringLocationTileView, SnapshotView, \
+    status_check
 
 
 urlpatterns = [
     path('', BasePage.as_view(), name='home'),
     path('monitoring-locations/', MonitoringLocationsListView.as_view(), name="api-monitoring-locations"),
+    path('monitoring-locations/stream/', MonitoringLocationsStreamView.as_view(),
+         name="api-monitoring-locations-stream"),
+    path('monitoring-locations/changes/', MonitoringLocationChangesView.as_view(),
+         name="api-monitoring-locations-changes"),
+    re_path(r'^monitoring-locations/(?P<agency_cd>[^/:]+):(?P<site_no>[^/]+)/$', MonitoringLocationDetailView.as_view(),
+            name='api-monitoring-location-detail'),
+    path('monitoring-locations/batch/', MonitoringLocationBatchView.as_view(),
+         name='api-monitoring-locations-batch'),
+    path('monitoring-locations/statistics/', MonitoringLocationStatisticsView.as_view(),
+         name='api-monitoring-locations-statistics'),
+    path('monitoring-locations/nearest/', MonitoringLocationNearestView.as_view(),
+         name="api-monitoring-locations-nearest"),
+    path('monitoring-locations/tiles/<int:z>/<int:x>/<int:y>/', MonitoringLocationTileView.as_view(),
+         name="api-monitoring-locations-tile"),
+    path('lookups/agencies/', LookupListView.as_view(queryset=AgencyLookup.objects.all(),
+                                                     serializer_class=AgencyLookupSerializer),
+         name='api-lookups-agencies'),
+    path('lookups/countries/', LookupListView.as_view(queryset=CountryLookup.objects.all(),
+                                                      serializer_class=CountryLookupSerializer),
+         name='api-lookups-countries'),
+    path('lookups/states/', LookupListView.as_view(queryset=StateLookup.objects.all(),
+                                                   serializer_class=StateLookupListSerializer),
+         name='api-lookups-states'),
+    path('lookups/counties/', LookupListView.as_view(queryset=CountyLookup.objects.select_related('state_id'),
+                                                     serializer_class=CountyLookupListSerializer),
+         name='api-lookups-counties'),
+    path('lookups/units/', LookupListView.as_view(queryset=UnitsLookup.objects.all(),
+                                                  serializer_class=UnitsLookupSerializer),
+         name='api-lookups-units'),
+    path('lookups/national-aquifers/', LookupListView.as_view(queryset=NatAqfrLookup.objects.all(),
+                                                              serializer_class=NatAqfrLookupSerializer),
+         name='api-lookups-national-aquifers'),
+    path('lookups/horizontal-datums/', LookupListView.as_view(queryset=HorizontalDatumLookup.objects.all(),
+                                                              serializer_class=HorizontalDatumLookupSerializer),
+         name='api-lookups-horizontal-datums'),
+    path('lookups/altitude-datums/', LookupListView.as_view(queryset=AltitudeDatumLookup.objects.all(),
+                                                            serializer_class=AltitudeDatumLookupSerializer),
+         name='api-lookups-altitude-datums'),
+    path('snapshots/<str:name>', SnapshotView.as_view(), name='snapshot'),
     path('status/', status_check, name='status')
 ]
@@ -1,15 +1,44 @@
 """
 Registry application views.
 """
-from django.http import JsonResponse
-from django.views.generic.base import TemplateView
+from calendar import timegm
+from hashlib import md5
+
+import datetime
+import os
+import re
+
+from django.conf import settings
+
+from django.core.cache import cache
+from django.db.models import CharField, Max, Value
+from django.db.models.functions import Concat
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
+from django.views.generic.base import TemplateView, View
 
 from django_filters.rest_framework import DjangoFilterBackend
 
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import ListAPIView
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
-from .models import MonitoringLocation
-from .serializers import MonitoringLocationSerializer
+from .caching import DETAIL_TIMEOUT, detail_key, page_cache, page_key
+from .filters import MonitoringLocationFilter, site_id_filter
+from .models import DataVersion, MonitoringLocation, MonitoringLocationTombstone
+from .pagination import ChangeFeedPagination, MonitoringLocationPagination, get_cached_count, is_filtered
+from .renderers import FlatJSONRenderer, NDJSONRenderer, PassthroughJSONRenderer, StreamingJSONRenderer
+from .serializers import BatchLookupSerializer, FlatMonitoringLocationSerializer, MonitoringLocationSerializer, \
+    NearestQuerySerializer, PgJSONMonitoringLocationSerializer
+from .snapshots import CONTENT_TYPES, ENCODINGS, LATEST, SNAPSHOT_NAME
+from .spatial import MonitoringLocationIndex, MonitoringLocationTile, get_registry_version
+from .statistics import get_statistics
 
 
 class BasePage(TemplateView):
@@ -31,14 +60,480 @@ def status_check(request):
     return JsonResponse(resp)
 
 
+class LookupListView(ListAPIView):
+    """
+    REST API returning a whole lookup table, given by queryset and serializer_class. Lookups
+    change rarely, when update_lookups runs or one is edited in the admin, so responses may be
+    cached by clients for cache_max_age seconds and are revalidated with an ETag derived from the
+    lookup version, which either change bumps.
+    The serialized table is kept in the cache until the lookup version changes.
+    """
+    pagination_class = None
+    filter_backends = []
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    cache_max_age = 60 * 60 * 24
+    cache_timeout = 60 * 60 * 24 * 7
+
+    def list(self, request, *args, **kwargs):
+        table = self.get_queryset().model._meta.db_table
+        lookups = DataVersion.get_version(DataVersion.LOOKUPS)
+        key = f'{table}:{lookups.version}:{request.accepted_media_type}'
+        etag = f'"{md5(key.encode()).hexdigest()}"'
+        last_modified = timegm(lookups.update_date.utctimetuple()) if lookups.update_date else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            cache_key = f'lookup:{table}:{lookups.version}'
+            data = cache.get(cache_key)
+            if data is None:
+                data = list(self.get_serializer(self.get_queryset(), many=True).data)
+                cache.set(cache_key, data, self.cache_timeout)
+            response = Response(data)
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, max_age=self.cache_max_age)
+        return response
+
+
 class MonitoringLocationsListView(ListAPIView):  # pylint: disable=too-few-public-methods
     """
-    REST API for monitoring location registry
+    REST API for monitoring location registry, filtered with MonitoringLocationFilter.
+    Pages are limit/offset by default, pagination=cursor selects keyset pagination for
+    harvesting the whole registry.
+    format=flat returns rows with the lookup codes and names inlined, fetched with
+    a single values_list query. format=pgjson returns the nested representation built
+    as JSON by Postgres. Responses carry an ETag and Last-Modified so that unchanged
+    pages can be revalidated with a 304 without being serialized. Pages, other than those of
+    the browsable API, are kept in page_cache until monitoring locations are written, and while
+    one is recomputed its stale copy is served to concurrent requests. fields and exclude take
+    comma separated field names which select the fields of each monitoring location. Only
+    the columns and lookups of the selected fields are fetched.
     """
     serializer_class = MonitoringLocationSerializer
+    pagination_class = MonitoringLocationPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, FlatJSONRenderer, PassthroughJSONRenderer]
     queryset = MonitoringLocation.objects.all().select_related('agency', 'country', 'state', 'county',
                                                                'horizontal_datum', 'altitude_units',
                                                                'altitude_datum', 'well_depth_units',
-                                                               'nat_aqfr', 'insert_user', 'update_user')
+                                                               'nat_aqfr', 'insert_user', 'update_user') \
+        .order_by('id')
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['display_flag']
+    filterset_class = MonitoringLocationFilter
+    projecting_serializer_classes = {
+        FlatJSONRenderer.format: FlatMonitoringLocationSerializer,
+        PassthroughJSONRenderer.format: PgJSONMonitoringLocationSerializer
+    }
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    def get_projecting_serializer_class(self):
+        """
+        Returns the serializer class for the requested format if that serializer projects the
+        queryset itself, otherwise None
+        """
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return self.projecting_serializer_classes.get(getattr(renderer, 'format', None))
+
+    def get_serializer_class(self):
+        return self.get_projecting_serializer_class() or super().get_serializer_class()
+
+    def get_sparse_fields(self):
+        """
+        Returns the names of the fields selected by the fields and exclude query parameters, or
+        None if neither is used. Raises a ValidationError for unknown field names.
+        """
+        params = self.request.query_params
+        if self.fields_query_param not in params and self.exclude_query_param not in params:
+            return None
+
+        available_fields = self.get_serializer_class().available_fields()
+        selected = {}
+        for param in (self.fields_query_param, self.exclude_query_param):
+            names = [name.strip() for name in params.get(param, '').split(',') if name.strip()]
+            unknown = [name for name in names if name not in available_fields]
+            if unknown:
+                raise ValidationError({param: f'Unknown fields: {", ".join(unknown)}'})
+            selected[param] = names
+
+        fields = selected[self.fields_query_param] or available_fields
+        return [name for name in available_fields
+                if name in fields and name not in selected[self.exclude_query_param]]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_sparse_fields()
+        if fields is not None and self.get_projecting_serializer_class() is None:
+            queryset = self.get_serializer_class().restrict_queryset(queryset, fields)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_sparse_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def project_queryset(self, queryset, extra=()):
+        """
+        Returns queryset projected by the serializer for the requested format, if it projects,
+        keeping the annotations named by extra
+        """
+        projecting_serializer_class = self.get_projecting_serializer_class()
+        if projecting_serializer_class:
+            queryset = projecting_serializer_class.project(queryset, fields=self.get_sparse_fields(), extra=extra)
+        return queryset
+
+    def get_validators(self, queryset):
+        """
+        Returns the ETag and Last-Modified timestamp for the response containing queryset. Both are
+        derived from the latest update_date of queryset, which is index backed, the lookup version and
+        the latest deletion. The ETag of a filtered queryset also depends on its cached count, since
+        rows can leave it without changing its latest update_date. Every write invalidates the
+        cached counts. The ETag also depends on the requested url and format.
+        :param queryset: filtered MonitoringLocation queryset
+        :return: tuple of ETag string and Last-Modified timestamp or None
+        """
+        summary = queryset.order_by().aggregate(last_update=Max('update_date'))
+        summary['count'] = get_cached_count(queryset) if is_filtered(queryset) else None
+        lookups = DataVersion.get_version(DataVersion.LOOKUPS)
+        last_delete = MonitoringLocationTombstone.objects.aggregate(last_delete=Max('delete_date'))['last_delete']
+
+        key = ':'.join([str(summary['count']), str(summary['last_update']), str(lookups.version), str(last_delete),
+                        self.request.get_full_path(), self.request.accepted_media_type])
+        etag = f'"{md5(key.encode()).hexdigest()}"'
+
+        modified_dates = [date for date in (summary['last_update'], lookups.update_date, last_delete) if date]
+        last_modified = timegm(max(modified_dates).utctimetuple()) if modified_dates else None
+        return etag, last_modified
+
+    def get_page_data(self, queryset):
+        """
+        Returns the response data of the requested page of queryset
+        """
+        queryset = self.project_queryset(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data).data
+        return self.get_serializer(queryset, many=True).data
+
+    def get_cacheable_page(self):
+        """
+        Returns a dictionary of the ETag, Last-Modified timestamp and data of the requested page
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        etag, last_modified = self.get_validators(queryset)
+        return {'etag': etag, 'last_modified': last_modified, 'data': self.get_page_data(queryset)}
+
+    def list(self, request, *args, **kwargs):
+        if isinstance(request.accepted_renderer, BrowsableAPIRenderer):
+            queryset = self.filter_queryset(self.get_queryset())
+            etag, last_modified = self.get_validators(queryset)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = Response(self.get_page_data(queryset))
+        else:
+            key = page_key(request.build_absolute_uri(), request.accepted_media_type)
+            page = page_cache.get_or_compute(key, self.get_cacheable_page)
+            etag, last_modified = page['etag'], page['last_modified']
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified) or \
+                Response(page['data'])
+
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class MonitoringLocationsStreamView(MonitoringLocationsListView):
+    """
+    REST API which streams the whole monitoring location registry in a single response, either
+    as a JSON array or as newline delimited JSON (format=ndjson). Rows are read through a server
+    side cursor so memory use does not grow with the size of the registry.
+    """
+    pagination_class = None
+    renderer_classes = [StreamingJSONRenderer, NDJSONRenderer]
+    chunk_size = 2000
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns a StreamingHttpResponse containing the filtered monitoring locations
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        serializer = self.get_serializer()
+        rows = (serializer.to_representation(monitoring_location)
+                for monitoring_location in queryset.iterator(chunk_size=self.chunk_size))
+        return StreamingHttpResponse(request.accepted_renderer.render_stream(rows),
+                                     content_type=request.accepted_renderer.media_type)
+
+
+class MonitoringLocationChangesView(MonitoringLocationsListView):
+    """
+    REST API change feed. Returns the monitoring locations created or updated, and those deleted,
+    after the updated_since timestamp and up to the until timestamp of the response, in pages of
+    up to limit of each. While next is not null it links to the rest of the changes up to the same
+    until. The until timestamp should then be the updated_since of the next request. Rows saved
+    by a transaction which commits after a feed has been read can have an earlier update_date
+    than its until, so until lags the current time by commit_lag, which should exceed the
+    longest write transaction.
+    """
+    pagination_class = None
+    commit_lag = datetime.timedelta(minutes=5)
+
+    def get_updated_since(self):
+        """
+        Returns the updated_since query parameter as an aware datetime
+        """
+        value = self.request.query_params.get('updated_since', '')
+        try:
+            updated_since = parse_datetime(value)
+            if updated_since is None:
+                updated_date = parse_date(value)
+                updated_since = datetime.datetime.combine(updated_date, datetime.time()) if updated_date else None
+        except ValueError:
+            updated_since = None
+        if updated_since is None:
+            raise ValidationError({'updated_since': 'Enter an ISO 8601 date or date and time.'})
+
+        if timezone.is_naive(updated_since):
+            updated_since = timezone.make_aware(updated_since, datetime.timezone.utc)
+        return updated_since
+
+    def list(self, request, *args, **kwargs):
+        pagination = ChangeFeedPagination(request)
+        if pagination.cursor is None:
+            updated_since = self.get_updated_since()
+            until = max(timezone.now() - self.commit_lag, updated_since)
+        else:
+            updated_since = pagination.cursor['updated_since']
+            until = pagination.cursor['until']
+
+        queryset = self.filter_queryset(self.get_queryset()) \
+            .filter(update_date__gt=updated_since, update_date__lte=until) \
+            .order_by('update_date', 'id')
+        queryset = pagination.paginate('updated', queryset, 'update_date')
+        tombstones = MonitoringLocationTombstone.objects \
+            .filter(delete_date__gt=updated_since, delete_date__lte=until) \
+            .order_by('delete_date', 'id')
+        tombstones = pagination.paginate('deleted', tombstones, 'delete_date') \
+            .values_list('monitoring_location_id', 'agency_cd', 'site_no', 'delete_date')
+
+        return Response({
+            'updated_since': updated_since,
+            'until': until,
+            'next': pagination.get_next_link(updated_since, until),
+            'updated': self.get_serializer(self.project_queryset(queryset), many=True).data,
+            'deleted': [
+                {'id': monitoring_location_id, 'agency_cd': agency_cd, 'site_no': site_no, 'delete_date': delete_date}
+                for monitoring_location_id, agency_cd, site_no, delete_date in tombstones
+            ]
+        })
+
+
+class MonitoringLocationDetailView(MonitoringLocationsListView):
+    """
+    REST API returning the monitoring location agency_cd:site_no. Its full json and flat
+    representations are cached, as is the absence of a monitoring location, until the monitoring
+    location is written. The browsable API shows the cached json representation. fields and
+    exclude select fields from the cached representation.
+    """
+    pagination_class = None
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, FlatJSONRenderer]
+    filter_backends = []
+
+    def get_representation(self, agency_cd, site_no):
+        """
+        Returns the full representation of the monitoring location in the requested format, or
+        None if there is no such monitoring location
+        """
+        representation = FlatJSONRenderer.format if self.get_projecting_serializer_class() else 'json'
+        key = detail_key(agency_cd, site_no, representation)
+        entry = cache.get(key)
+        if entry is None:
+            queryset = self.queryset.filter(agency_id=agency_cd, site_no=site_no)
+            projecting_serializer_class = self.get_projecting_serializer_class()
+            if projecting_serializer_class:
+                queryset = projecting_serializer_class.project(queryset)
+            monitoring_location = queryset.first()
+            entry = {'data': None if monitoring_location is None
+                     else dict(self.get_serializer(monitoring_location, fields=None).data)}
+            cache.set(key, entry, DETAIL_TIMEOUT)
+        return entry['data']
+
+    def get(self, request, *args, **kwargs):
+        """
+        Returns the monitoring location given by the agency_cd and site_no url arguments
+        """
+        data = self.get_representation(kwargs['agency_cd'], kwargs['site_no'])
+        if data is None:
+            raise Http404
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            data = {name: value for name, value in data.items() if name in fields}
+        return Response(data)
+
+
+class MonitoringLocationBatchView(MonitoringLocationsListView):
+    """
+    REST API returning the monitoring locations with the agency_cd:site_no ids posted as
+    {"ids": [...]}, in the order of the ids, with the ids which match no monitoring location
+    listed in missing. The ids are matched with a single query. Filter query parameters further
+    restrict the matches.
+    """
+    pagination_class = None
+    http_method_names = ['post', 'options']
+
+    def post(self, request, *args, **kwargs):
+        """
+        Returns the monitoring locations with the posted ids
+        """
+        body = BatchLookupSerializer(data=request.data)
+        body.is_valid(raise_exception=True)
+        site_ids = body.validated_data['ids']
+
+        queryset = self.filter_queryset(self.get_queryset()) \
+            .filter(site_id_filter([site_id.split(':', 1) for site_id in site_ids])) \
+            .annotate(batch_site_id=Concat('agency_id', Value(':'), 'site_no', output_field=CharField()))
+        rows = {row.batch_site_id: row for row in self.project_queryset(queryset, extra=['batch_site_id'])}
+
+        return Response({
+            'results': self.get_serializer([rows[site_id] for site_id in site_ids if site_id in rows], many=True).data,
+            'missing': [site_id for site_id in site_ids if site_id not in rows]
+        })
+
+
+class MonitoringLocationNearestView(MonitoringLocationsListView):
+    """
+    REST API returning the k monitoring locations nearest to lat and lon, in order of distance.
+    Each location has its distance_km. agency, display_flag, wl_sn_flag and qw_sn_flag restrict
+    the search, agency taking a comma separated list of codes. The search uses the in memory
+    MonitoringLocationIndex of the process, which is rebuilt when the registry changes.
+    """
+    pagination_class = None
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, FlatJSONRenderer]
+    filter_backends = []
+
+    def list(self, request, *args, **kwargs):
+        query = NearestQuerySerializer(data=request.query_params.dict())
+        query.is_valid(raise_exception=True)
+        filters = dict(query.validated_data)
+        latitude, longitude, k = filters.pop('lat'), filters.pop('lon'), filters.pop('k')
+        if 'agency' in filters:
+            filters['agency_id'] = [agency_cd.strip() for agency_cd in filters.pop('agency').split(',')]
+
+        neighbours = MonitoringLocationIndex.get().nearest(latitude, longitude, k, **filters)
+        queryset = self.project_queryset(self.get_queryset().filter(id__in=[pk for _, pk in neighbours]))
+        rows = {row.id: row for row in queryset}
+        # Locations deleted since the index was built are skipped
+        neighbours = [(distance, rows[pk]) for distance, pk in neighbours if pk in rows]
+
+        data = self.get_serializer([row for _, row in neighbours], many=True).data
+        for representation, (distance, _) in zip(data, neighbours):
+            representation['distance_km'] = round(distance, 3)
+        return Response(data)
+
+
+class MonitoringLocationTileView(APIView):
+    """
+    REST API returning the displayed monitoring locations in the Web Mercator map tile z/x/y
+    as GeoJSON, clustered at low zoom levels. Tiles are cached until the registry changes.
+    """
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    cache_timeout = 60 * 60 * 24
+
+    def get(self, request, z, x, y):
+        """
+        Returns the tile z/x/y from the cache, building it if the registry has changed
+        """
+        # pylint: disable=invalid-name
+        if not MonitoringLocationTile.is_valid(z, x, y):
+            raise Http404('No such tile')
+
+        version = md5(str(get_registry_version()).encode()).hexdigest()
+        key = f'monitoring-location-tile:{version}:{z}:{x}:{y}'
+        tile = cache.get(key)
+        if tile is None:
+            tile = MonitoringLocationTile(z, x, y).to_geojson()
+            cache.set(key, tile, self.cache_timeout)
+        return Response(tile)
+
+
+class MonitoringLocationStatisticsView(APIView):
+    """
+    REST API returning the number of monitoring locations by agency, state, national aquifer,
+    site type, display flag and water-level and water quality sub-network and baseline flags.
+    The counts are read from the statistics materialized view as of refreshed and are cached
+    until it is next refreshed. display_flag restricts the counts to displayed or hidden
+    monitoring locations.
+    """
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    cache_timeout = 60 * 60 * 24
+
+    def get(self, request):
+        """
+        Returns the monitoring location statistics
+        """
+        filters = {}
+        display_flag = request.query_params.get('display_flag', '').lower()
+        if display_flag:
+            if display_flag not in ('true', 'false'):
+                raise ValidationError({'display_flag': 'Enter true or false.'})
+            filters['display_flag'] = display_flag == 'true'
+
+        version = DataVersion.get_version(DataVersion.STATISTICS)
+        key = f'monitoring-location-statistics:{version.version}:{display_flag or "all"}'
+        etag = f'"{md5(f"{key}:{request.accepted_media_type}".encode()).hexdigest()}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = cache.get(key)
+            if data is None:
+                data = {'refreshed': version.update_date, **get_statistics(**filters)}
+                cache.set(key, data, self.cache_timeout)
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+
+class SnapshotView(View):
+    """
+    Serves the registry snapshots written by SnapshotWriter without touching the database.
+    latest.json names the files of the newest snapshot and must be revalidated. Snapshot files
+    are named by their content so they are cached for a year. A precompressed variant is served
+    when the client accepts its encoding.
+    """
+    immutable_cache_control = 'public, max-age=31536000, immutable'
+
+    def get(self, request, name):
+        """
+        Returns the snapshot file, name
+        """
+        if name == LATEST:
+            content_type = 'application/json'
+        elif SNAPSHOT_NAME.fullmatch(name):
+            content_type = CONTENT_TYPES[name.rsplit('.', 1)[1]]
+        else:
+            raise Http404('No such snapshot')
+
+        path = os.path.join(settings.SNAPSHOT_ROOT, name)
+        encoding = None
+        if name != LATEST:
+            accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+            for coding, suffix in ENCODINGS:
+                if re.search(rf'\b{coding}\b', accept_encoding) and os.path.exists(path + suffix):
+                    path, encoding = path + suffix, coding
+                    break
+        try:
+            snapshot_file = open(path, 'rb')  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            raise Http404('No such snapshot')
+
+        response = FileResponse(snapshot_file, content_type=content_type, filename=name)
+        if name == LATEST:
+            response['Cache-Control'] = 'no-cache'
+        else:
+            response['Cache-Control'] = self.immutable_cache_control
+            # Each encoding of a snapshot is a different representation, so has its own ETag
+            digest = name.split('-')[1].split('.')[0]
+            response['ETag'] = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+            response['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return response
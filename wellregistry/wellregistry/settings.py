@@ -47,7 +47,7 @@ except ValueError:
 # Application definition
 
 INSTALLED_APPS = [
-    'registry',
+    'registry.apps.RegistryConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -219,6 +219,24 @@ else:
         }
     }
 
+# Cache shared by every process, so that invalidation reaches every gunicorn worker and the
+# management commands, and only one worker recomputes an invalidated page. By default it is the
+# CACHE_LOCATION table in the database, created by manage.py createcachetable. CACHE_BACKEND may
+# name another shared backend, such as memcached, whose client library must then be installed.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'registry_cache'),
+    }
+}
+if CACHE_BACKEND == 'django.core.cache.backends.db.DatabaseCache':
+    # Detail and page entries are culled once there are more than MAX_ENTRIES
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '20000'))}
+if 'test' in sys.argv:
+    # Tests count the queries of views, which a database cache would add to
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -263,12 +281,27 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'wellregistry/staticfiles')
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 USE_X_FORWARDED_HOST = True
 
-# Rest framework configuration
+# Rest framework configuration. The first renderer renders format=json. DECIMALS_AS_NUMBERS
+# renders coordinates, altitudes and well depths as JSON numbers rather than strings.
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
-    'PAGE_SIZE': 1024
+    'PAGE_SIZE': 1024,
+    'DEFAULT_RENDERER_CLASSES': [
+        'registry.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+    'COERCE_DECIMAL_TO_STRING': 'DECIMALS_AS_NUMBERS' not in os.environ
 }
 
 NWIS_SITE_SERVICE_ENDPOINT = 'https://waterservices.usgs.gov/nwis/site'
 
 BULK_UPLOAD_TEMPLATE_PATH = os.path.join(BASE_DIR, 'registry/data/Well_Registry_Bulk_Upload_Template.xlsx')
+
+# Snapshots of the registry written by the write_snapshots command. SNAPSHOT_ON_WRITE also
+# writes them in the background whenever monitoring locations change.
+SNAPSHOT_ROOT = os.getenv('SNAPSHOT_ROOT', os.path.join(BASE_DIR, 'snapshots'))
+SNAPSHOT_ON_WRITE = 'SNAPSHOT_ON_WRITE' in os.environ
+
+# Monitoring location statistics are refreshed by the refresh_statistics command.
+# STATISTICS_REFRESH_ON_WRITE also refreshes them in the background whenever monitoring locations change.
+STATISTICS_REFRESH_ON_WRITE = 'STATISTICS_REFRESH_ON_WRITE' in os.environ